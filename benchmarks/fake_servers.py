@@ -0,0 +1,385 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import JUDGE_CRITERIA
+
+"""
+Local stand-ins for the Ollama generate endpoint and the Anthropic messages endpoint.
+Each server answers with well-formed responses after a simulated delay of
+latency + output_tokens / tokens_per_second, and fails a configurable share of requests,
+so the pipeline can be measured without a GPU or an API key.
+"""
+
+
+class ServiceProfile:
+    """
+    Simulated behaviour of one service.
+    latency: seconds before the first token; jitter: relative random spread of the whole delay;
+    failure_rate: share of requests answered with a server error;
+    outlier_rate: share of requests whose generation takes outlier_delay seconds longer.
+    """
+
+    def __init__(self, latency: float = 0.005, tokens_per_second: float = 50000, output_tokens: int = 400,
+                 failure_rate: float = 0.0, jitter: float = 0.1, seed: int = 0,
+                 outlier_rate: float = 0.0, outlier_delay: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.failure_rate = failure_rate
+        self.outlier_rate = outlier_rate
+        self.outlier_delay = outlier_delay
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple:
+        """
+        Returns (first_token_delay, generation_time, fail) for one request.
+        """
+        with self._lock:
+            spread = 1 + self.random.uniform(-self.jitter, self.jitter)
+            fail = self.random.random() < self.failure_rate
+            outlier = self.outlier_rate and self.random.random() < self.outlier_rate
+        generation_time = self.output_tokens / self.tokens_per_second if self.tokens_per_second else 0
+        generation_time = generation_time * spread + (self.outlier_delay if outlier else 0)
+        return self.latency * spread, generation_time, fail
+
+
+class FakeServer:
+
+    def __init__(self, profile: Optional[ServiceProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        self.profile = profile or ServiceProfile()
+        self.requests_served = 0
+        self.requests_failed = 0
+        self.service_times: List[float] = []
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this, delayed ACKs add ~40 ms per response
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                started = time.perf_counter()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    payload = {}
+                failed = server.handle(self, payload)
+                with server._lock:
+                    server.requests_served += 1
+                    server.requests_failed += int(failed)
+                    server.service_times.append(time.perf_counter() - started)
+
+            def do_GET(self):
+                server.handle_get(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests_served,
+                "failed_requests": self.requests_failed,
+                "service_times": list(self.service_times)
+            }
+
+    def handle(self, handler: BaseHTTPRequestHandler, payload: Dict[str, Any]) -> bool:
+        """
+        Answer one request; returns True when a failure was simulated.
+        """
+        raise NotImplementedError
+
+    def handle_get(self, handler: BaseHTTPRequestHandler):
+        self.send_json(handler, 404, {"error": f"unknown endpoint {handler.path}"})
+
+    @staticmethod
+    def send_json(handler: BaseHTTPRequestHandler, status: int, data: Dict[str, Any]):
+        body = json.dumps(data).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+class FakeOllamaServer(FakeServer):
+    """
+    Ollama /api/generate answering with a JSX component of about output_tokens tokens, streamed as NDJSON chunks
+    unless the request sets "stream": false. Streams closed by the client are counted as cancelled.
+    The first request for a model also waits model_load_time, after which /api/ps lists the model as loaded;
+    a request with "keep_alive": 0 and no prompt unloads it again.
+    parallel > 0 serves at most that many generations at once and queues the rest, like OLLAMA_NUM_PARALLEL.
+    /api/pull streams the progress of a download taking pull_time seconds, after which /api/tags lists the model.
+    """
+
+    def __init__(self, profile: Optional[ServiceProfile] = None, host: str = "127.0.0.1", port: int = 0,
+                 model_load_time: float = 0.0, parallel: int = 0, pull_time: float = 0.0):
+        super().__init__(profile, host, port)
+        self.model_load_time = model_load_time
+        self.pull_time = pull_time
+        self.loaded_models: List[str] = []
+        self.pulled_models: List[str] = []
+        self.requests_cancelled = 0
+        self._slots = threading.BoundedSemaphore(parallel) if parallel > 0 else None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats["cancelled_requests"] = self.requests_cancelled
+        return stats
+
+    def handle_get(self, handler):
+        if handler.path == "/api/ps":
+            with self._lock:
+                models = [{"name": model, "model": model} for model in self.loaded_models]
+            self.send_json(handler, 200, {"models": models})
+        elif handler.path == "/api/tags":
+            with self._lock:
+                models = [{"name": model, "model": model} for model in self.pulled_models]
+            self.send_json(handler, 200, {"models": models})
+        elif handler.path == "/api/version":
+            self.send_json(handler, 200, {"version": "0.0.0-fake"})
+        else:
+            super().handle_get(handler)
+
+    def handle(self, handler, payload):
+        if handler.path == "/api/pull":
+            return self._pull(handler, payload)
+        if handler.path != "/api/generate":
+            self.send_json(handler, 404, {"error": f"unknown endpoint {handler.path}"})
+            return True
+
+        if self._slots is None:
+            return self._generate(handler, payload)
+        with self._slots:
+            return self._generate(handler, payload)
+
+    def _generate(self, handler, payload):
+        model = payload.get("model", "")
+        if payload.get("keep_alive") == 0 and not payload.get("prompt"):
+            # An unload request, as Ollama takes it: evict the model without generating
+            with self._lock:
+                if model in self.loaded_models:
+                    self.loaded_models.remove(model)
+            self.send_json(handler, 200, {"model": model, "response": "", "done": True, "done_reason": "unload"})
+            return False
+        with self._lock:
+            load = model not in self.loaded_models
+            if load:
+                self.loaded_models.append(model)
+        load_time = self.model_load_time if load else 0.0
+        time.sleep(load_time)
+
+        first_token_delay, generation_time, fail = self.profile.draw()
+        time.sleep(first_token_delay)
+        if fail:
+            self.send_json(handler, 500, {"error": "simulated model runner failure"})
+            return True
+
+        final = {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "eval_count": self.profile.output_tokens,
+            "eval_duration": int(generation_time * 1e9),
+            "load_duration": int(load_time * 1e9)
+        }
+        text = fake_component(self.profile.output_tokens)
+
+        if payload.get("stream", True) is False:
+            time.sleep(generation_time)
+            self.send_json(handler, 200, dict(final, response=text))
+            return False
+
+        self._stream_chunks(handler, final, text, generation_time)
+        return False
+
+    def _pull(self, handler, payload):
+        model = payload.get("model") or payload.get("name", "")
+        layer_size, steps = 2 ** 30, 10
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def send(data):
+            line = (json.dumps(data) + "\n").encode("utf-8")
+            handler.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            handler.wfile.flush()
+
+        send({"status": "pulling manifest"})
+        for step in range(1, steps + 1):
+            time.sleep(self.pull_time / steps)
+            send({"status": f"pulling {model}", "digest": f"sha256:{model}", "total": layer_size,
+                  "completed": layer_size * step // steps})
+        with self._lock:
+            if model not in self.pulled_models:
+                self.pulled_models.append(model)
+        send({"status": "success"})
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
+        return False
+
+    def _stream_chunks(self, handler, final: Dict[str, Any], text: str, generation_time: float, chunks: int = 20):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def send(data):
+            line = (json.dumps(data) + "\n").encode("utf-8")
+            handler.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            handler.wfile.flush()
+
+        try:
+            step = max(1, -(-len(text) // chunks))
+            for start in range(0, len(text), step):
+                time.sleep(generation_time / chunks)
+                send({"model": final["model"], "created_at": final["created_at"],
+                      "response": text[start:start + step], "done": False})
+            send(final)
+            handler.wfile.write(b"0\r\n\r\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the generation
+            handler.close_connection = True
+            with self._lock:
+                self.requests_cancelled += 1
+
+
+class FakeAnthropicServer(FakeServer):
+    """
+    Anthropic /v1/messages. Requests with tools are answered with a tool_use block carrying a valid evaluation;
+    streamed requests get the evaluation as JSON text over server-sent events.
+    Failures are answered as overloaded_error (529), which the SDK retries.
+    """
+
+    def handle(self, handler, payload):
+        if handler.path.split("?")[0] != "/v1/messages":
+            self.send_json(handler, 404, {"type": "error", "error": {"type": "not_found_error", "message": handler.path}})
+            return True
+
+        first_token_delay, generation_time, fail = self.profile.draw()
+        time.sleep(first_token_delay)
+        if fail:
+            self.send_json(handler, 529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+            return True
+
+        with self.profile._lock:
+            evaluation = fake_evaluation(self.profile.random)
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": payload.get("model", ""),
+            "stop_sequence": None,
+            "usage": {"input_tokens": 1500, "output_tokens": self.profile.output_tokens}
+        }
+
+        if payload.get("stream"):
+            self._stream_text(handler, message, json.dumps(evaluation, indent=2), generation_time)
+            return False
+
+        time.sleep(generation_time)
+        tools = payload.get("tools") or []
+        if tools:
+            message["content"] = [{
+                "type": "tool_use",
+                "id": f"toolu_{uuid.uuid4().hex[:24]}",
+                "name": tools[0]["name"],
+                "input": evaluation
+            }]
+            message["stop_reason"] = "tool_use"
+        else:
+            message["content"] = [{"type": "text", "text": json.dumps(evaluation, indent=2)}]
+            message["stop_reason"] = "end_turn"
+        self.send_json(handler, 200, message)
+        return False
+
+    def _stream_text(self, handler, message: Dict[str, Any], text: str, generation_time: float, chunks: int = 20):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        def send(event, data):
+            handler.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+
+        try:
+            send("message_start", {"type": "message_start", "message": dict(message, content=[], stop_reason=None)})
+            send("content_block_start", {"type": "content_block_start", "index": 0,
+                                         "content_block": {"type": "text", "text": ""}})
+            step = max(1, -(-len(text) // chunks))
+            for start in range(0, len(text), step):
+                time.sleep(generation_time / chunks)
+                send("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                             "delta": {"type": "text_delta", "text": text[start:start + step]}})
+            send("content_block_stop", {"type": "content_block_stop", "index": 0})
+            send("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                   "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+            send("message_stop", {"type": "message_stop"})
+        except (BrokenPipeError, ConnectionResetError):
+            # The judge closes the stream as soon as the evaluation object is complete
+            pass
+
+
+def fake_component(output_tokens: int) -> str:
+    # Roughly four characters per token
+    rows = max(1, output_tokens * 4 // 60)
+    items = "\n".join(f'      <div className="row-{i}"><span>Item {i}</span></div>' for i in range(rows))
+    return f"  return (\n    <div className=\"screen\">\n{items}\n    </div>\n  );\n"
+
+
+def fake_evaluation(rng: random.Random) -> Dict[str, Any]:
+    evaluation = {
+        criterion: {"score": rng.randint(3, 10), "explanation": f"Simulated assessment of {criterion.replace('_', ' ')}."}
+        for criterion in JUDGE_CRITERIA
+    }
+    evaluation["overall_score"] = round(sum(evaluation[c]["score"] for c in JUDGE_CRITERIA) / len(JUDGE_CRITERIA), 1)
+    evaluation["summary"] = "Simulated evaluation."
+    evaluation["strengths"] = ["Layout structure"]
+    evaluation["weaknesses"] = ["Styling details"]
+    return evaluation
@@ -0,0 +1,320 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Any, Sequence
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config.constants import JUDGE_CRITERIA
+
+"""
+Microbenchmarks for the local hot paths, in the asv style: every benchmark is a setup function
+that receives one parameter and returns the callable to time.
+
+    python benchmarks/microbenchmarks.py [--filter summary] [--sizes 1000 10000 100000 1000000]
+    python benchmarks/microbenchmarks.py --save-baseline
+
+Result-set benchmarks read synthetic evaluations from a results store, the way the pipeline does.
+"""
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+REGRESSION_TOLERANCE = 0.2
+DEFAULT_SIZES = (1000, 10000, 100000)
+IMAGE_SIZES = ("360x640", "1080x2340", "1440x3200")
+CODE_TOKENS = (400, 3000)
+JUDGE_RESPONSE_STYLES = ("json", "fenced", "prose", "streamed")
+
+BENCHMARKS = []
+
+
+def benchmark(name: str, params: Callable[[argparse.Namespace], Sequence[Any]]):
+    def register(setup):
+        BENCHMARKS.append((name, params, setup))
+        return setup
+    return register
+
+
+class Workspace:
+    """
+    Temporary files shared by the benchmarks; synthetic inputs are built once per parameter.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._cache: Dict[tuple, Any] = {}
+
+    def cached(self, key: tuple, build: Callable[[], Any]) -> Any:
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def image(self, size: str) -> str:
+        def build():
+            import numpy as np
+            from PIL import Image
+
+            width, height = (int(value) for value in size.split("x"))
+            # Flat UI blocks with noise on top, so the PNG does not compress to nothing
+            rng = np.random.default_rng(0)
+            pixels = np.full((height, width, 3), 245, dtype=np.uint8)
+            pixels[: height // 10] = (33, 150, 243)
+            noise = rng.integers(0, 24, size=pixels.shape, dtype=np.uint8)
+            path = self.root / f"screen_{size}.png"
+            Image.fromarray(pixels - noise).save(path)
+            return str(path)
+        return self.cached(("image", size), build)
+
+    def results_store(self, rows: int) -> str:
+        return self.cached(("store", rows), lambda: write_synthetic_store(str(self.root / "runs"), rows))
+
+
+def synthetic_evaluation(rng: random.Random, model_name: str, bias: float) -> Dict[str, Any]:
+    evaluation = {}
+    for criterion in JUDGE_CRITERIA:
+        score = min(10, max(0, round(rng.gauss(6 + bias, 1.8))))
+        evaluation[criterion] = {"score": score, "explanation": f"{criterion} assessment"}
+    evaluation["overall_score"] = round(sum(evaluation[c]["score"] for c in JUDGE_CRITERIA) / len(JUDGE_CRITERIA), 1)
+    evaluation["summary"] = f"Synthetic evaluation of {model_name}"
+    evaluation["strengths"] = ["Layout"]
+    evaluation["weaknesses"] = ["Styling"]
+    return evaluation
+
+
+def write_synthetic_store(store_dir: str, rows: int, prompts: int = 2, samples: int = 2,
+                          error_rate: float = 0.02) -> str:
+    """
+    Write `rows` evaluations for two models, `prompts` prompts and `samples` samples per (model, prompt, image).
+    Returns the path of the rows file.
+    """
+    from utils.results_store import ResultsStore
+
+    rng = random.Random(rows)
+    models = [("Model 1", 0.4), ("Model 2", -0.2)]
+    per_image = len(models) * prompts * samples
+
+    with ResultsStore(store_dir, run_id=f"synthetic_{rows}") as store:
+        for row in range(rows):
+            image, slot = divmod(row, per_image)
+            model_name, bias = models[slot % len(models)]
+            if rng.random() < error_rate:
+                evaluation = {"error": "Failed to parse JSON response", "overall_score": 0}
+            else:
+                evaluation = synthetic_evaluation(rng, model_name, bias)
+            evaluation["meta"] = {
+                "image_name": f"mobile_ui_{image + 1:06d}.png",
+                "model_name": model_name,
+                "prompt_id": f"prompt_{slot // len(models) % prompts}"
+            }
+            store.append(evaluation)
+        return str(store.rows_path)
+
+
+def judge_response_text(style: str) -> str:
+    evaluation = synthetic_evaluation(random.Random(0), "Model 1", 0)
+    # Braces and quotes inside explanations are what make naive extraction slow or wrong
+    evaluation["code_quality"]["explanation"] = 'Uses {styles} objects and "inline" handlers; ' * 20
+    text = json.dumps(evaluation, indent=2)
+    if style == "fenced":
+        return f"```json\n{text}\n```"
+    if style == "prose":
+        return f"Here is my evaluation of the component {{ see below }}.\n\n{text}\n\nLet me know if anything is unclear."
+    return text
+
+
+@benchmark("encode_image_to_base64", lambda args: IMAGE_SIZES)
+def setup_encode_image(size: str, workspace: Workspace):
+    from utils.image_utils import encode_image_to_base64
+
+    path = workspace.image(size)
+    return lambda: encode_image_to_base64(path)
+
+
+@benchmark("wrap_generated_code", lambda args: CODE_TOKENS)
+def setup_wrap_generated_code(tokens: int, workspace: Workspace):
+    from benchmarks.fake_servers import fake_component
+    from model_runner.ollama_models_runner import OllamaModelRunner
+
+    code = fake_component(tokens)
+    return lambda: OllamaModelRunner.wrap_generated_code(code, "mobile_ui_001")
+
+
+@benchmark("process_single_image", lambda args: CODE_TOKENS)
+def setup_process_single_image(tokens: int, workspace: Workspace):
+    from benchmarks.fake_servers import fake_component
+    from model_runner.ollama_models_runner import OllamaModelRunner
+
+    runner = OllamaModelRunner()
+    runner.output_dir = str(workspace.root / "output")
+    code = fake_component(tokens)
+    # Only the local work is timed: encoding, validation, wrapping and writing the file
+    runner.call_ollama_api = lambda **kwargs: code
+    image_path = workspace.image("1080x2340")
+    return lambda: runner.process_single_image(image_path, "gemma3:4b-it-qat", "system", "user {image_path}", 3000, 0.7)
+
+
+@benchmark("parse_judge_response", lambda args: JUDGE_RESPONSE_STYLES)
+def setup_parse_judge_response(style: str, workspace: Workspace):
+    from utils.judge_response_parser import JudgeResponseParser, parse_judge_response
+
+    text = judge_response_text("json" if style == "streamed" else style)
+    if style != "streamed":
+        return lambda: parse_judge_response(text)
+
+    chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+
+    def parse_stream():
+        parser = JudgeResponseParser()
+        for chunk in chunks:
+            if parser.feed(chunk) is not None:
+                break
+        return parser.finish()
+    return parse_stream
+
+
+@benchmark("generate_summary", lambda args: args.sizes)
+def setup_generate_summary(rows: int, workspace: Workspace):
+    from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+    from utils.results_store import ResultsStore
+
+    store = ResultsStore.from_path(workspace.results_store(rows))
+    # _generate_summary does not use the API client, so the runner is not initialised
+    runner = object.__new__(LLMAsJudgeRunner)
+    return lambda: runner._generate_summary(store.iter_rows())
+
+
+@benchmark("generate_model_comparison_report", lambda args: args.sizes)
+def setup_comparison_report(rows: int, workspace: Workspace):
+    from utils.evaluation_helper import generate_model_comparison_report
+
+    evaluation_results = {"meta": {"results_store": workspace.results_store(rows)}}
+    return lambda: generate_model_comparison_report(evaluation_results)
+
+
+@benchmark("calculate_pass_at_k_metrics", lambda args: args.sizes)
+def setup_pass_at_k(rows: int, workspace: Workspace):
+    from utils.evaluation_analyzer import EvaluationAnalyzer
+
+    analyzer = EvaluationAnalyzer()
+    analyzer.results = {"meta": {"results_store": workspace.results_store(rows)}}
+    return lambda: analyzer.calculate_pass_at_k_metrics()
+
+
+def time_callable(function: Callable[[], Any], min_time: float, max_repeats: int) -> Dict[str, Any]:
+    """
+    Call once to warm up, then repeat until min_time has passed (at least 3 and at most max_repeats calls).
+    """
+    timings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        function()
+        budget_start = time.perf_counter()
+        while len(timings) < max_repeats and (len(timings) < 3 or time.perf_counter() - budget_start < min_time):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+
+    return {
+        "repeats": len(timings),
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings)
+    }
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="microbench_") as root:
+        workspace = Workspace(root)
+        for name, params, setup in BENCHMARKS:
+            if args.filter and not any(pattern in name for pattern in args.filter):
+                continue
+            for param in params(args):
+                key = f"{name}[{param}]"
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    function = setup(param, workspace)
+                timing = time_callable(function, args.min_time, args.max_repeats)
+                results[key] = timing
+                print(f"{key:<48} median {format_seconds(timing['median_s']):>10}   "
+                      f"min {format_seconds(timing['min_s']):>10}   ({timing['repeats']} runs)")
+    return results
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                          tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    regressions = []
+    for key, timing in results.items():
+        previous = baseline.get("benchmarks", {}).get(key)
+        if not previous:
+            continue
+        change = (timing["median_s"] - previous["median_s"]) / previous["median_s"]
+        if change > tolerance:
+            regressions.append(f"{key}: {format_seconds(previous['median_s'])} -> "
+                               f"{format_seconds(timing['median_s'])} ({change:+.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the local hot paths")
+    parser.add_argument("--filter", nargs="+", default=None, help="Only run benchmarks whose name contains one of these")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Result-set sizes (rows) for the summary, report and pass@k benchmarks")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to spend timing each benchmark")
+    parser.add_argument("--max-repeats", type=int, default=1000)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    report = {"created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+              "platform": sys.platform, "benchmarks": results}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {"benchmarks": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update({key: value for key, value in report.items() if key != "benchmarks"})
+        baseline["benchmarks"].update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
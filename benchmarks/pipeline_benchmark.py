@@ -0,0 +1,561 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config.constants import IMAGES_DIR, GENERATED_CODE_DIR
+from config.model_registry import get_model_registry
+
+"""
+End-to-end pipeline benchmark against the local Ollama and Anthropic stand-ins.
+Every scenario runs in a fresh workspace and a separate process, so peak RSS is the scenario's own.
+
+    python benchmarks/pipeline_benchmark.py [--sizes 5 500 5000] [--stages ollama judge pipeline]
+    python benchmarks/pipeline_benchmark.py --save-baseline    # record the current numbers as the baseline
+
+Stages: "ollama" runs OllamaModelRunner on every registered model, "judge" runs LLMAsJudgeRunner on pre-generated
+code, "pipeline" runs main() (generation, judging and the comparison report). The opt-in "sharded" stage runs
+`main.py run --shard i/N` in --shards parallel processes, each against its own Ollama stand-in, then `main.py merge`,
+and checks that the merged results hold every evaluation exactly once.
+"""
+
+STAGES = ("ollama", "judge", "pipeline", "sharded")
+DEFAULT_STAGES = ("ollama", "judge", "pipeline")
+DEFAULT_SHARDS = 3
+DEFAULT_SIZES = (5, 500, 5000)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+REGRESSION_TOLERANCE = 0.2  # Relative slowdown or memory growth reported as a regression
+
+PERCENTILES = (50, 90, 95, 99)
+
+# The stand-in that serves each service, and the services each stage must reach
+SERVICE_SERVERS = {"generation": "ollama", "judge": "anthropic"}
+STAGE_SERVICES = {
+    "ollama": ("generation",),
+    "judge": ("judge",),
+    "pipeline": ("generation", "judge"),
+    "sharded": ("generation", "judge")
+}
+
+
+def write_sample_image(path: Path):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (390, 844), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 390, 90), fill=(33, 150, 243))
+    for row in range(8):
+        top = 110 + row * 88
+        draw.rectangle((16, top, 374, top + 72), outline=(200, 200, 200), fill=(245, 245, 245))
+        draw.ellipse((28, top + 12, 76, top + 60), fill=(255, 152, 0))
+    image.save(path)
+
+
+def prepare_workspace(workspace: Path, image_count: int, with_code: bool):
+    images_dir = workspace / IMAGES_DIR
+    images_dir.mkdir(parents=True, exist_ok=True)
+    sample = workspace / "sample.png"
+    write_sample_image(sample)
+
+    code_dir = workspace / GENERATED_CODE_DIR
+    code_dir.mkdir(parents=True, exist_ok=True)
+
+    for i in range(1, image_count + 1):
+        image_stem = f"mobile_ui_{i:05d}"
+        shutil.copyfile(sample, images_dir / f"{image_stem}.png")
+        if with_code:
+            from benchmarks.fake_servers import fake_component
+            component = "".join(word.capitalize() for word in image_stem.split("_"))
+            code = f"import React from 'react';\n\nconst {component} = () => {{{fake_component(400)}}}\n\nexport default {component};"
+            for suffix in (spec.suffix for spec in get_model_registry()):
+                (code_dir / f"{image_stem}_{suffix}.jsx").write_text(code, encoding="utf-8")
+
+    sample.unlink()
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return getattr(psutil.Process().memory_info(), "peak_wset", None)
+        except ImportError:
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_worker(stage: str, result_path: str, shard: Optional[str] = None, use_async: bool = False):
+    """
+    Runs inside the scenario process (cwd is the workspace) and records per-call latencies.
+    """
+    import asyncio
+    from model_runner.ollama_models_runner import OllamaModelRunner
+    from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+    from model_runner.async_ollama_models_runner import AsyncOllamaModelRunner
+    from model_runner.async_llm_as_a_judge_runner import AsyncLLMAsJudgeRunner
+    from utils.concurrency_limiter import AdaptiveConcurrencyLimiter
+
+    latencies: Dict[str, List[float]] = {"generation": [], "judge": []}
+    limiters: List[AdaptiveConcurrencyLimiter] = []
+
+    def timed(method, service):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                latencies[service].append(time.perf_counter() - started)
+        return wrapper
+
+    def timed_async(method, service):
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                latencies[service].append(time.perf_counter() - started)
+        return wrapper
+
+    OllamaModelRunner.call_ollama_api = timed(OllamaModelRunner.call_ollama_api, "generation")
+    LLMAsJudgeRunner.call_claude_api = timed(LLMAsJudgeRunner.call_claude_api, "judge")
+    AsyncOllamaModelRunner.call_ollama_api_async = timed_async(AsyncOllamaModelRunner.call_ollama_api_async, "generation")
+    AsyncLLMAsJudgeRunner.call_claude_api_async = timed_async(AsyncLLMAsJudgeRunner.call_claude_api_async, "judge")
+
+    limiter_init = AdaptiveConcurrencyLimiter.__init__
+
+    def tracked_init(self, *args, **kwargs):
+        limiter_init(self, *args, **kwargs)
+        limiters.append(self)
+
+    AdaptiveConcurrencyLimiter.__init__ = tracked_init
+
+    started = time.perf_counter()
+    if stage == "ollama":
+        from prompts.prompt_constants import PROMPT_DICT, PROMPT_NUMBER
+        prompt = PROMPT_DICT[0 if PROMPT_NUMBER == "All" else PROMPT_NUMBER]
+        if use_async:
+            asyncio.run(AsyncOllamaModelRunner().run_all_models_on_images_async(prompt["system_prompt"],
+                                                                                prompt["user_prompt"]))
+        else:
+            OllamaModelRunner().run_all_models_on_images(prompt["system_prompt"], prompt["user_prompt"])
+    elif stage == "judge":
+        if use_async:
+            asyncio.run(AsyncLLMAsJudgeRunner().evaluate_all_generated_code_async())
+        else:
+            LLMAsJudgeRunner().evaluate_all_generated_code()
+    elif stage == "merge":
+        import main
+        main.main(["merge"])
+    else:
+        import main
+        main.main(["run"] + (["--shard", shard] if shard else []) + (["--async"] if use_async else []))
+    wall_time = time.perf_counter() - started
+
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump({"wall_time": wall_time, "latencies": latencies, "peak_rss_bytes": peak_rss_bytes(),
+                   "concurrency": concurrency_summary(limiters)}, f)
+
+
+def concurrency_summary(limiters) -> Dict[str, Any]:
+    """
+    Final limit, peak limit and back-offs of every adaptive limiter the scenario created, by limiter name.
+    """
+    summary = {}
+    for limiter in limiters:
+        stats = limiter.stats()
+        if not stats["requests"]:
+            continue
+        entry = summary.setdefault(stats["name"], {"limit": 0, "peak_limit": 0, "decreases": 0, "requests": 0})
+        entry["limit"] = stats["limit"]
+        entry["peak_limit"] = max(entry["peak_limit"], stats["peak_limit"])
+        entry["decreases"] += stats["decreases"]
+        entry["requests"] += stats["requests"]
+    return summary
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, Any]:
+    import numpy as np
+
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000
+    summary = {"count": len(latencies), "mean_ms": round(float(values.mean()), 3)}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}_ms"] = round(float(value), 3)
+    return summary
+
+
+def worker_env(ollama_urls: List[str], anthropic_url: str, endpoint_concurrency: int = 4,
+               hedge: bool = False) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_HEDGE_REQUESTS": "1" if hedge else "0",
+        "OLLAMA_BASE_URL": ollama_urls[0],
+        "OLLAMA_BASE_URLS": ",".join(ollama_urls),
+        "OLLAMA_ENDPOINT_CONCURRENCY": str(endpoint_concurrency),
+        "OLLAMA_REQUEST_DELAY": "0",
+        "OLLAMA_MANAGE_SERVER": "0",
+        "ANTHROPIC_BASE_URL": anthropic_url,
+        "ANTHROPIC_API_KEY": "benchmark",
+        "PYTHONPATH": project_root
+    })
+    return env
+
+
+def start_worker(stage: str, workspace: Path, result_path: Path, env: Dict[str, str],
+                 shard: Optional[str] = None, use_async: bool = False) -> subprocess.Popen:
+    command = [sys.executable, os.path.abspath(__file__), "--worker", stage, "--result", str(result_path)]
+    if shard:
+        command += ["--shard", shard]
+    if use_async:
+        command.append("--async")
+    return subprocess.Popen(command, cwd=workspace, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+
+
+def finish_worker(process: subprocess.Popen, result_path: Path) -> Dict[str, Any]:
+    _, stderr = process.communicate()
+    if process.returncode != 0 or not result_path.exists():
+        return {"error": stderr.strip().splitlines()[-1] if stderr.strip() else "worker failed"}
+    with open(result_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def served_since(servers: Dict[str, Any], before: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """
+    Requests that reached each stand-in, plus an "ollama" total over every Ollama stand-in.
+    A stage whose client fails before sending shows up here as zero.
+    """
+    served = {}
+    for name, server in servers.items():
+        stats = server.stats()
+        served[name] = {
+            "requests": stats["requests"] - before[name]["requests"],
+            "failed_requests": stats["failed_requests"] - before[name]["failed_requests"],
+            "cancelled_requests": stats.get("cancelled_requests", 0) - before[name].get("cancelled_requests", 0)
+        }
+    served["ollama"] = {key: sum(counts[key] for name, counts in served.items() if name.startswith("ollama_"))
+                        for key in ("requests", "failed_requests", "cancelled_requests")}
+    return served
+
+
+def unserved_requests(stage: str, result: Dict[str, Any]) -> List[str]:
+    """
+    Services of the stage whose stand-in served nothing, or fewer requests than the stage's clients sent
+    (hedged and retried requests only add to the served count). Such a scenario timed something other than
+    the service, e.g. a client failing before it sends, so its numbers are not comparable.
+    """
+    problems = []
+    for service in STAGE_SERVICES[stage]:
+        sent = result["latency"].get(service, {}).get("count", 0)
+        server = SERVICE_SERVERS[service]
+        served = result["served"][server]["requests"]
+        if served == 0 or served < sent:
+            problems.append(f"{server} served {served} of {sent} {service} requests")
+    return problems
+
+
+def scenario_result(image_count: int, wall_time: float, latencies: Dict[str, List[float]],
+                    peak_rss: Optional[int], served: Dict[str, Dict[str, int]],
+                    concurrency: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    requests_made = sum(len(values) for values in latencies.values())
+    return {
+        "images": image_count,
+        "wall_time_s": round(wall_time, 3),
+        "images_per_second": round(image_count / wall_time, 3) if wall_time else None,
+        "requests_per_second": round(requests_made / wall_time, 3) if wall_time else None,
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1) if peak_rss else None,
+        "latency": {service: summarize_latencies(values) for service, values in latencies.items()},
+        "served": served,
+        "concurrency": concurrency or {}
+    }
+
+
+def run_scenario(stage: str, image_count: int, ollama_servers: List[Any], anthropic_server,
+                 endpoint_concurrency: int = 4, hedge: bool = False, use_async: bool = False) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"bench_{stage}_{image_count}_") as workspace:
+        workspace = Path(workspace)
+        prepare_workspace(workspace, image_count, with_code=(stage == "judge"))
+        result_path = workspace / "worker_result.json"
+
+        servers = {f"ollama_{index}": server for index, server in enumerate(ollama_servers, 1)}
+        servers["anthropic"] = anthropic_server
+        before = {name: server.stats() for name, server in servers.items()}
+        env = worker_env([server.url for server in ollama_servers], anthropic_server.url, endpoint_concurrency, hedge)
+        process = start_worker(stage, workspace, result_path, env, use_async=use_async)
+        worker_result = finish_worker(process, result_path)
+        if "error" in worker_result:
+            return worker_result
+
+    result = scenario_result(image_count, worker_result["wall_time"], worker_result["latencies"],
+                             worker_result["peak_rss_bytes"], served_since(servers, before),
+                             worker_result.get("concurrency"))
+    problems = unserved_requests(stage, result)
+    if problems:
+        result["error"] = "; ".join(problems)
+    return result
+
+
+def expected_evaluations(image_count: int) -> int:
+    # The workers read the same registry (MODEL_REGISTRY_PATH is absolute) and prompt settings as this process
+    from prompts.prompt_constants import PROMPT_DICT, PROMPT_NUMBER
+
+    prompt_count = len(PROMPT_DICT) if PROMPT_NUMBER == "All" else 1
+    return len(get_model_registry()) * prompt_count * image_count
+
+
+def run_sharded_scenario(image_count: int, ollama_servers: List[Any], anthropic_server,
+                         use_async: bool = False) -> Dict[str, Any]:
+    """
+    One `run --shard i/N` process per Ollama stand-in, all sharing a workspace, followed by `merge`.
+    """
+    shard_count = len(ollama_servers)
+    with tempfile.TemporaryDirectory(prefix=f"bench_sharded_{image_count}_") as workspace:
+        workspace = Path(workspace)
+        prepare_workspace(workspace, image_count, with_code=False)
+
+        servers = {f"ollama_{index}": server for index, server in enumerate(ollama_servers, 1)}
+        servers["anthropic"] = anthropic_server
+        before = {name: server.stats() for name, server in servers.items()}
+
+        started = time.perf_counter()
+        workers = []
+        for index, server in enumerate(ollama_servers, 1):
+            result_path = workspace / f"worker_result_{index}.json"
+            env = worker_env([server.url], anthropic_server.url)
+            workers.append((start_worker("pipeline", workspace, result_path, env, f"{index}/{shard_count}", use_async),
+                            result_path))
+        worker_results = [finish_worker(process, result_path) for process, result_path in workers]
+
+        merge_result_path = workspace / "worker_result_merge.json"
+        merge_process = start_worker("merge", workspace, merge_result_path,
+                                     worker_env([ollama_servers[0].url], anthropic_server.url))
+        worker_results.append(finish_worker(merge_process, merge_result_path))
+        wall_time = time.perf_counter() - started
+
+        errors = [result["error"] for result in worker_results if "error" in result]
+        if errors:
+            return {"error": errors[0]}
+
+        merged_path = workspace / "evaluation_results" / "evaluation_results.json"
+        if not merged_path.exists():
+            return {"error": "merge did not write the results index"}
+        with open(merged_path, "r", encoding="utf-8") as f:
+            merged_meta = json.load(f).get("meta", {})
+
+    served = served_since(servers, before)
+
+    latencies = {"generation": [], "judge": []}
+    for result in worker_results:
+        for service, values in result["latencies"].items():
+            latencies[service].extend(values)
+    peak_rss = max((result["peak_rss_bytes"] or 0) for result in worker_results)
+
+    result = scenario_result(image_count, wall_time, latencies, peak_rss, served)
+    result["shards"] = shard_count
+    result["merged_evaluations"] = merged_meta.get("total_evaluations", 0)
+    problems = unserved_requests("sharded", result)
+    # Every (model, prompt, image) is judged exactly once across all shards together
+    expected = expected_evaluations(image_count)
+    if result["merged_evaluations"] != expected:
+        problems.append(f"merged {result['merged_evaluations']} evaluations, expected {expected}")
+    if problems:
+        result["error"] = "; ".join(problems)
+    return result
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                          tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Regressions against the baseline: lower throughput, higher p95 latency or higher peak RSS beyond the tolerance.
+    """
+    regressions = []
+    for scenario, current in results.items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous or "error" in current or "error" in previous:
+            continue
+
+        def check(name, now, before, higher_is_better):
+            if not now or not before:
+                return
+            change = (now - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{scenario}: {name} {before} -> {now} ({change:+.0%})")
+
+        check("images_per_second", current["images_per_second"], previous.get("images_per_second"), True)
+        check("peak_rss_mb", current["peak_rss_mb"], previous.get("peak_rss_mb"), False)
+        for service, latency in current["latency"].items():
+            check(f"{service} p95_ms", latency.get("p95_ms"),
+                  previous.get("latency", {}).get(service, {}).get("p95_ms"), False)
+    return regressions
+
+
+def print_results(results: Dict[str, Any]):
+    print(f"\n{'scenario':<18} {'wall s':>9} {'images/s':>10} {'req/s':>9} {'rss MB':>8} "
+          f"{'gen p50/p95 ms':>16} {'judge p50/p95 ms':>18} {'served ollama/judge':>20} {'peak limit gen/judge':>21}")
+    for scenario, result in results.items():
+        if "error" in result and "latency" not in result:
+            print(f"{scenario:<18} error: {result['error']}")
+            continue
+
+        def latency(service):
+            summary = result["latency"].get(service, {})
+            return f"{summary['p50_ms']:.1f}/{summary['p95_ms']:.1f}" if summary.get("count") else "-"
+
+        def peak_limit(name):
+            return str(result.get("concurrency", {}).get(name, {}).get("peak_limit", "-"))
+
+        print(f"{scenario:<18} {result['wall_time_s']:>9.2f} {result['images_per_second']:>10.1f} "
+              f"{result['requests_per_second']:>9.1f} {result['peak_rss_mb'] or 0:>8.1f} "
+              f"{latency('generation'):>16} {latency('judge'):>18} "
+              f"{result['served']['ollama']['requests']:>10}/{result['served']['anthropic']['requests']:<9} "
+              f"{peak_limit('ollama'):>11}/{peak_limit('judge'):<9}")
+        if "error" in result:
+            print(f"{'':<18} error: {result['error']}")
+
+
+def main(argv=None):
+    from benchmarks.fake_servers import FakeOllamaServer, FakeAnthropicServer, ServiceProfile
+
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark with local service stand-ins")
+    parser.add_argument("--worker", choices=STAGES + ("merge",), help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--shard", help=argparse.SUPPRESS)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Image counts to run")
+    parser.add_argument("--stages", choices=STAGES, nargs="+", default=list(DEFAULT_STAGES), help="Stages to run")
+    parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS, help="Workers and Ollama stand-ins for the sharded stage")
+    parser.add_argument("--ollama-latency", type=float, default=0.005, help="Seconds before the first token")
+    parser.add_argument("--ollama-tokens-per-second", type=float, default=50000)
+    parser.add_argument("--ollama-failure-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-outlier-rate", type=float, default=0.0,
+                        help="Share of generations that take --ollama-outlier-delay seconds longer")
+    parser.add_argument("--ollama-outlier-delay", type=float, default=0.0)
+    parser.add_argument("--hedge", action="store_true", help="Run the pipeline with OLLAMA_HEDGE_REQUESTS=1")
+    parser.add_argument("--async", action="store_true", dest="use_async",
+                        help="Run the asyncio runners instead of the threaded ones")
+    parser.add_argument("--judge-latency", type=float, default=0.005, help="Seconds before the first token")
+    parser.add_argument("--judge-tokens-per-second", type=float, default=50000)
+    parser.add_argument("--judge-failure-rate", type=float, default=0.0)
+    parser.add_argument("--output-tokens", type=int, default=400, help="Tokens per generated response")
+    parser.add_argument("--model-load-time", type=float, default=0.0,
+                        help="Extra seconds for the first request of a model on each Ollama stand-in")
+    parser.add_argument("--ollama-endpoints", type=int, default=1,
+                        help="Ollama stand-ins the non-sharded stages balance over (OLLAMA_BASE_URLS)")
+    parser.add_argument("--endpoint-concurrency", type=int, default=4,
+                        help="Upper bound on requests in flight per Ollama endpoint (OLLAMA_ENDPOINT_CONCURRENCY)")
+    parser.add_argument("--ollama-parallel", type=int, default=0,
+                        help="Generations each Ollama stand-in serves at once, queueing the rest (0: unlimited)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker, args.result, args.shard, args.use_async)
+        return 0
+
+    config = {
+        "ollama": {"latency": args.ollama_latency, "tokens_per_second": args.ollama_tokens_per_second,
+                   "failure_rate": args.ollama_failure_rate, "outlier_rate": args.ollama_outlier_rate,
+                   "outlier_delay": args.ollama_outlier_delay},
+        "judge": {"latency": args.judge_latency, "tokens_per_second": args.judge_tokens_per_second,
+                  "failure_rate": args.judge_failure_rate},
+        "output_tokens": args.output_tokens,
+        "model_load_time": args.model_load_time,
+        "ollama_endpoints": args.ollama_endpoints,
+        "endpoint_concurrency": args.endpoint_concurrency,
+        "ollama_parallel": args.ollama_parallel,
+        "hedge": args.hedge,
+        "async": args.use_async,
+        "shards": args.shards
+    }
+    judge_profile = ServiceProfile(args.judge_latency, args.judge_tokens_per_second, args.output_tokens,
+                                   args.judge_failure_rate, seed=2)
+
+    def ollama_servers(count, first_seed):
+        return [FakeOllamaServer(ServiceProfile(args.ollama_latency, args.ollama_tokens_per_second, args.output_tokens,
+                                                args.ollama_failure_rate, seed=first_seed + index,
+                                                outlier_rate=args.ollama_outlier_rate,
+                                                outlier_delay=args.ollama_outlier_delay),
+                                 model_load_time=args.model_load_time, parallel=args.ollama_parallel).start()
+                for index in range(count)]
+
+    results = {}
+    with FakeAnthropicServer(judge_profile) as anthropic_server:
+        pool_servers = ollama_servers(args.ollama_endpoints, 1)
+        shard_servers = ollama_servers(args.shards, 10) if "sharded" in args.stages else []
+        try:
+            for image_count in args.sizes:
+                for stage in args.stages:
+                    scenario = f"{stage}/{image_count}"
+                    print(f"Running {scenario}...")
+                    if stage == "sharded":
+                        results[scenario] = run_sharded_scenario(image_count, shard_servers, anthropic_server,
+                                                                 args.use_async)
+                    else:
+                        results[scenario] = run_scenario(stage, image_count, pool_servers, anthropic_server,
+                                                         args.endpoint_concurrency, args.hedge, args.use_async)
+        finally:
+            for server in pool_servers + shard_servers:
+                server.stop()
+
+    print_results(results)
+    failed = [scenario for scenario, result in results.items() if "error" in result]
+    if failed:
+        print(f"\nFailed scenarios: {', '.join(failed)}")
+    report = {"created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+              "platform": sys.platform, "config": config, "scenarios": results}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {"scenarios": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update({key: value for key, value in report.items() if key != "scenarios"})
+        baseline["scenarios"].update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 1 if failed else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 1 if failed else 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print("\nWarning: the baseline was recorded with a different service profile")
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    if failed:
+        return 1
+
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
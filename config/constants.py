@@ -1,13 +1,62 @@
-﻿import os
+import os
 
 DATASET_NAME = "mrtoy/mobile-ui-design"
 SPLIT_NAME = "train" 
 IMAGES_DIR = "./dataset/mobile_ui_design_images"
 GENERATED_CODE_DIR = "./output"
 NUM_SAMPLES = 5
+# "first" - the first NUM_SAMPLES rows of the split; "stratified" - rows drawn from clusters of cheap image features
+# (colour histogram, edge density, aspect ratio, pHash) in proportion to the cluster sizes
+SAMPLE_STRATEGY = os.environ.get("SAMPLE_STRATEGY", "first")
+SAMPLE_SEED = int(os.environ.get("SAMPLE_SEED", 42))
+SAMPLE_STRATA = 20  # Feature clusters the stratified sample is drawn from
+SAMPLE_POOL_SIZE = int(os.environ["SAMPLE_POOL_SIZE"]) if os.environ.get("SAMPLE_POOL_SIZE") else None  # Rows considered; None - the whole split
+# Inference calls the run may spend; the sample size is the budget divided by the calls one image costs.
+# Without a budget NUM_SAMPLES images are selected
+SAMPLE_BUDGET_CALLS = int(os.environ["SAMPLE_BUDGET_CALLS"]) if os.environ.get("SAMPLE_BUDGET_CALLS") else None
+SAMPLE_MANIFEST_FILE = "sample_manifest.json"  # Written next to the saved images
+# With DEDUP_ENABLED=1, near-duplicate screenshots are collapsed before generation: two images whose 64-bit
+# perceptual hashes differ in at most DEDUP_MAX_DISTANCE bits are one cluster. "representative" keeps the first image
+# of each cluster, "sample" keeps up to DEDUP_SAMPLES_PER_CLUSTER images drawn at random from it
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "0") == "1"  # Off by default, since it changes the evaluated images
+DEDUP_MAX_DISTANCE = 6
+DEDUP_KEEP = "representative"
+DEDUP_SAMPLES_PER_CLUSTER = 2
+DEDUP_SEED = 0
+DEDUP_REPORT_FILE = "dedup_report.json"  # Written next to the saved images
 
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_REQUEST_TIMEOUT = 600  # Timeout in seconds for Ollama API requests
+OLLAMA_REQUEST_DELAY = float(os.environ.get("OLLAMA_REQUEST_DELAY", 1))  # Pause in seconds between generation requests
+OLLAMA_MANAGE_SERVER = os.environ.get("OLLAMA_MANAGE_SERVER", "1") != "0"  # "0" - the server at OLLAMA_BASE_URL is started and provisioned elsewhere
+OLLAMA_PULL_CONCURRENCY = int(os.environ.get("OLLAMA_PULL_CONCURRENCY", 3))  # Missing models pulled at once
+OLLAMA_PULL_PROGRESS_INTERVAL = 5  # Seconds between progress lines of the pulls
+# Comma-separated Ollama servers sharing the generation load; defaults to OLLAMA_BASE_URL alone
+OLLAMA_BASE_URLS = [url.strip() for url in os.environ.get("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if url.strip()]
+OLLAMA_ENDPOINT_CONCURRENCY = int(os.environ.get("OLLAMA_ENDPOINT_CONCURRENCY", 4))  # Upper bound on requests in flight per server
+OLLAMA_HEALTH_CHECK_INTERVAL = 30  # Seconds between health and resident-model checks of a server
+OLLAMA_HEALTH_CHECK_TIMEOUT = 5
+# Per-request deadlines: once a model has OLLAMA_DEADLINE_MIN_SAMPLES completed generations, a request gets
+# OLLAMA_DEADLINE_SLACK times its expected duration (overhead + expected tokens / observed tokens per second),
+# at least OLLAMA_MIN_DEADLINE and at most OLLAMA_REQUEST_TIMEOUT seconds. Requests past the deadline are cancelled
+# and retried up to OLLAMA_MAX_RETRIES times.
+OLLAMA_DEADLINE_SLACK = 3.0
+OLLAMA_MIN_DEADLINE = 5
+OLLAMA_DEADLINE_MIN_SAMPLES = 5
+OLLAMA_MAX_RETRIES = 1
+# Hedged requests: a request still running after the OLLAMA_HEDGE_QUANTILE latency of its model is sent a second
+# time; the first answer wins and the other request is cancelled
+OLLAMA_HEDGE_REQUESTS = os.environ.get("OLLAMA_HEDGE_REQUESTS", "0") == "1"
+OLLAMA_HEDGE_QUANTILE = 0.95
+# A server started by OllamaManager has its output written to OLLAMA_LOG_PATH, rotated at OLLAMA_LOG_MAX_BYTES with
+# OLLAMA_LOG_BACKUPS old files kept, and the CPU, RSS and threads of its process tree sampled every
+# OLLAMA_MONITOR_INTERVAL seconds. The samples are saved to OLLAMA_MONITOR_PATH and, next to the generation requests
+# in flight at each sample, to the generation metrics
+OLLAMA_LOG_PATH = "./logs/ollama_server.log"
+OLLAMA_LOG_MAX_BYTES = 10 * 2 ** 20
+OLLAMA_LOG_BACKUPS = 3
+OLLAMA_MONITOR_INTERVAL = float(os.environ.get("OLLAMA_MONITOR_INTERVAL", 1))
+OLLAMA_MONITOR_PATH = "./logs/ollama_resources.jsonl"
 
 MODEL_NAME_1 = "gemma3:4b-it-qat"
 MAX_TOKENS_1 = 3000
@@ -16,16 +65,79 @@ TEMPERATURE_1 = 0.7
 MODEL_NAME_2 = "qwen2:7b"
 MAX_TOKENS_2 = 3000
 TEMPERATURE_2 = 0.7
+# The models under evaluation, their parameters, servers and concurrency (see config/model_registry.py).
+# Without the file the registry holds the two models above
+MODEL_REGISTRY_PATH = os.environ.get("MODEL_REGISTRY_PATH",
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.json"))
 
 LLM_AS_JUDGE_MODEL_NAME = "claude-sonnet-4-5-20250929"
 LLM_AS_JUDGE_MODEL_MAX_TOKENS = 3000
 LLM_AS_JUDGE_MODEL_TEMPERATURE = 0.7
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
+LLM_AS_JUDGE_MODE = "tool"  # "tool" - scores are returned as structured tool input, "text" - JSON is parsed from the streamed text
+LLM_AS_JUDGE_MAX_REPAIR_ATTEMPTS = 1  # Targeted repair requests per evaluation when the judge response is unusable
+LLM_AS_JUDGE_INITIAL_CONCURRENCY = 2  # Judge requests in flight at the start; adjusted by the adaptive limiter
+LLM_AS_JUDGE_MAX_CONCURRENCY = int(os.environ.get("LLM_AS_JUDGE_MAX_CONCURRENCY", 8))
+# With --async a judge request is a coroutine rather than a thread, so the limiter may go much higher. The default is
+# the connection limit of the anthropic client; rate limits and latency spikes bring the limit down from there
+LLM_AS_JUDGE_ASYNC_MAX_CONCURRENCY = int(os.environ.get("LLM_AS_JUDGE_ASYNC_MAX_CONCURRENCY", 1000))
+
+# Adaptive concurrency (AIMD): the in-flight limit grows by one per limit's worth of requests while latency stays
+# within CONCURRENCY_LATENCY_TOLERANCE of the lowest recent latency, and is multiplied by CONCURRENCY_BACKOFF_RATIO
+# on a latency spike, timeout, 429 or overload response. Generation requests are judged by their time to the first
+# token, which unlike the full latency does not grow with the length of the answer
+CONCURRENCY_LATENCY_TOLERANCE = 1.5
+CONCURRENCY_BACKOFF_RATIO = 0.7
+CONCURRENCY_LATENCY_WINDOW = 50  # Recent requests the no-load latency is taken from
+CONCURRENCY_HISTORY_LENGTH = 200  # Most recent limit changes kept per limiter in the run metrics
+
+JUDGE_CRITERIA = ["element_detection", "structural_accuracy", "layout_accuracy", "code_quality", "completeness"]
+JUDGE_SCORE_MIN = 0
+JUDGE_SCORE_MAX = 10
+
+SIGNIFICANCE_ALPHA = 0.05  # Significance level for the paired model comparisons
+BOOTSTRAP_RESAMPLES = 10000  # Resamples for bootstrap confidence intervals and permutation tests
+STATISTICS_SEED = 42
+
+# Sequential mode (run --sequential): (prompt, image) cells are generated and judged for every model in random order,
+# and the paired overall-score tests look at the scores after SEQUENTIAL_MIN_PAIRS pairs, then every time the pairs
+# double. A pair is decided once the interval of its mean difference excludes zero, or once it is narrower than
+# SEQUENTIAL_CI_WIDTH points. 1 - SEQUENTIAL_CONFIDENCE is the chance of any false winner in the run: it is split over
+# the model pairs, and over the looks of each pair (half to the first look, a quarter to the second, ...)
+SEQUENTIAL_CONFIDENCE = 0.99
+SEQUENTIAL_CI_WIDTH = 0.5
+SEQUENTIAL_MIN_PAIRS = 10  # Pairs judged before the first look
+SEQUENTIAL_BATCH_SIZE = 4  # Cells generated and judged together, so generation and judging stay concurrent
+SEQUENTIAL_SEED = 42
+
+# Prompt sweep (main.py sweep): successive halving over PROMPT_DICT. The first round scores every prompt on
+# SWEEP_INITIAL_IMAGES images; each round keeps the best 1/SWEEP_ETA of the prompts and multiplies the images by SWEEP_ETA
+SWEEP_INITIAL_IMAGES = 4
+SWEEP_ETA = 2
+SWEEP_SEED = 42
+SWEEP_RESULTS_PATH = "./evaluation_results/prompt_sweep"  # Evaluations and the per-round results of the sweep
+
+# Model benchmark (main.py benchmark): every registered model and its "variants" (e.g. other quantizations) generate
+# for the dataset one after another, each starting unloaded, with at most MODEL_BENCHMARK_CONCURRENCY requests in
+# flight so that latency is not queueing. Load time, time to first token, tokens/s and the peak memory of the local
+# Ollama process tree are saved with the judge scores, and the comparison report gets the quality/latency frontier
+MODEL_BENCHMARK_CONCURRENCY = int(os.environ.get("MODEL_BENCHMARK_CONCURRENCY", 1))
+MODEL_BENCHMARK_MEMORY_INTERVAL = 0.5  # Seconds between memory samples of the Ollama server
+MODEL_BENCHMARK_RESULTS_PATH = "./evaluation_results/benchmark"
 
 DATASET_PATH = "dataset\\mobile_ui_design_images"
 GENERATED_OUTPUT_PATH = "output"
 EVALUATION_RESULTS_PATH = "./evaluation_results"
 EVALUATION_REPORT_PATH = "./evaluation_results/detailed_report.txt"
 EVALUATION_RESULTS_JSON_PATH = "./evaluation_results/evaluation_results.json"
+EVALUATION_STORE_PATH = "./evaluation_results/runs"  # Append-only JSONL rows, one file per run
+# Incremental runs: generated code and judgments whose inputs (prompt, model settings, image, code, judge prompts)
+# are unchanged since they were recorded in BUILD_GRAPH_FILE are reused instead of being recomputed.
+# "0" regenerates and re-judges everything
+INCREMENTAL_BUILD = os.environ.get("INCREMENTAL_BUILD", "1") != "0"
+BUILD_GRAPH_FILE = "build_graph.json"  # Written to the code directory and to the results directory
+# Warm bundle (main.py snapshot / restore): the images, generated code and build caches of a working directory in
+# one memory-mappable file, so that a fresh worker restores them instead of downloading and regenerating
+WARM_BUNDLE_PATH = "./warm_bundle.bin"
 
 IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.PNG', '.JPG', '.JPEG', '.GIF', '.BMP']
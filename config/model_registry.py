@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import (
+    MODEL_NAME_1, MODEL_NAME_2,
+    MAX_TOKENS_1, MAX_TOKENS_2,
+    TEMPERATURE_1, TEMPERATURE_2,
+    MODEL_REGISTRY_PATH
+)
+
+"""
+The Ollama models under evaluation, read from the JSON file at MODEL_REGISTRY_PATH:
+
+    {"models": [
+        {"name": "gemma3:4b-it-qat", "max_tokens": 3000, "temperature": 0.7, "variants": ["gemma3:4b-it-q8_0"]},
+        {"name": "qwen2:7b", "base_urls": ["http://gpu-2:11434"], "concurrency": 2}
+    ]}
+
+Only "name" is required. The n-th model (counting from 1) is labelled "Model n" in evaluations and its code is
+saved as <image>_model<n>.jsx unless "label" and "suffix" say otherwise. A model with "base_urls" is sent to its
+own Ollama servers instead of the shared ones; "concurrency" caps its requests in flight. "variants" are other
+builds of the same model, e.g. other quantizations; only the model benchmark (main.py benchmark) runs them.
+"""
+
+
+class ModelSpec:
+
+    def __init__(self, choice: int, name: str, max_tokens: int = MAX_TOKENS_1, temperature: float = TEMPERATURE_1,
+                 label: Optional[str] = None, suffix: Optional[str] = None, base_urls: Optional[List[str]] = None,
+                 concurrency: Optional[int] = None, variants: Optional[List[str]] = None, family: Optional[str] = None):
+        self.choice = choice  # 1-based position in the registry, the model_choice of the runners
+        self.name = name
+        self.max_tokens = int(max_tokens)
+        self.temperature = float(temperature)
+        self.label = label or f"Model {choice}"
+        self.suffix = suffix or f"model{choice}"
+        self.base_urls = [url.strip() for url in base_urls or [] if url.strip()] or None
+        self.concurrency = int(concurrency) if concurrency else None
+        self.variants = list(variants or [])
+        # The label of the registered model a variant was expanded from; a model is its own family
+        self.family = family or self.label
+
+    @classmethod
+    def from_dict(cls, choice: int, entry: Dict[str, Any]) -> "ModelSpec":
+        if not entry.get("name"):
+            raise ValueError(f"Model {choice} of the registry has no name")
+        unknown = set(entry) - {"name", "max_tokens", "temperature", "label", "suffix", "base_urls", "concurrency",
+                                "variants"}
+        if unknown:
+            raise ValueError(f"Unknown settings for model {entry['name']}: {', '.join(sorted(unknown))}")
+        return cls(choice, **entry)
+
+    @property
+    def has_own_resources(self) -> bool:
+        return bool(self.base_urls or self.concurrency)
+
+    def copy(self, **changes) -> "ModelSpec":
+        settings = dict(choice=self.choice, name=self.name, max_tokens=self.max_tokens, temperature=self.temperature,
+                        label=self.label, suffix=self.suffix, base_urls=self.base_urls, concurrency=self.concurrency,
+                        variants=self.variants, family=self.family)
+        settings.update(changes)
+        return ModelSpec(**settings)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "label": self.label,
+            "family": self.family,
+            "name": self.name,
+            "suffix": self.suffix,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "base_urls": self.base_urls,
+            "concurrency": self.concurrency,
+            "variants": self.variants
+        }
+
+    def __repr__(self):
+        return f"ModelSpec({self.label}: {self.name})"
+
+
+class ModelRegistry:
+
+    def __init__(self, specs: List[ModelSpec]):
+        if not specs:
+            raise ValueError("The model registry is empty")
+        for field in ("label", "suffix"):
+            values = [getattr(spec, field) for spec in specs]
+            duplicates = sorted({value for value in values if values.count(value) > 1})
+            if duplicates:
+                raise ValueError(f"Model {field}s should be unique, repeated: {', '.join(duplicates)}")
+        self.specs = specs
+
+    @classmethod
+    def load(cls, path: str = MODEL_REGISTRY_PATH) -> "ModelRegistry":
+        if not Path(path).exists():
+            return cls.default()
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f).get("models", [])
+        return cls([ModelSpec.from_dict(choice, entry) for choice, entry in enumerate(entries, start=1)])
+
+    @classmethod
+    def default(cls) -> "ModelRegistry":
+        return cls([
+            ModelSpec(1, MODEL_NAME_1, MAX_TOKENS_1, TEMPERATURE_1),
+            ModelSpec(2, MODEL_NAME_2, MAX_TOKENS_2, TEMPERATURE_2)
+        ])
+
+    def __iter__(self) -> Iterator[ModelSpec]:
+        return iter(self.specs)
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    @property
+    def choices(self) -> List[int]:
+        return [spec.choice for spec in self.specs]
+
+    @property
+    def names(self) -> List[str]:
+        # Distinct model names, e.g. for pulling; several entries may run one model with other parameters
+        return list(dict.fromkeys(spec.name for spec in self.specs))
+
+    @property
+    def display_names(self) -> Dict[str, str]:
+        # Labels written by the judge runner -> model names shown in reports
+        return {spec.label: spec.name for spec in self.specs}
+
+    def with_variants(self) -> "ModelRegistry":
+        """
+        Every model followed by its variants as models of their own, numbered in that order. A variant keeps the
+        model's settings; its label and suffix get the variant's tag ("Model 1 q8_0", model1_q8_0).
+        """
+        specs = []
+        for spec in self.specs:
+            specs.append(spec.copy(choice=len(specs) + 1, variants=[]))
+            for variant in spec.variants:
+                tag = _variant_tag(spec.name, variant)
+                specs.append(spec.copy(choice=len(specs) + 1, name=variant, label=f"{spec.label} {tag}",
+                                       suffix=f"{spec.suffix}_{re.sub(r'[^A-Za-z0-9]+', '_', tag)}",
+                                       variants=[], family=spec.label))
+        return ModelRegistry(specs)
+
+    def get(self, choice: int) -> ModelSpec:
+        if not 1 <= choice <= len(self.specs):
+            raise ValueError(f"model_choice should be between 1 and {len(self.specs)}, got {choice}")
+        return self.specs[choice - 1]
+
+    def by_name(self, model_name: str) -> Optional[ModelSpec]:
+        return next((spec for spec in self.specs if spec.name == model_name), None)
+
+    def by_suffix(self, suffix: str) -> Optional[ModelSpec]:
+        return next((spec for spec in self.specs if spec.suffix == suffix), None)
+
+    def by_label(self, label: str) -> Optional[ModelSpec]:
+        return next((spec for spec in self.specs if spec.label == label), None)
+
+    def for_code_file(self, code_file_path: str) -> Optional[ModelSpec]:
+        """
+        The model whose suffix ends the file name; the longest suffix wins, so "model1" does not claim "_model11.jsx".
+        """
+        stem = Path(code_file_path).stem
+        matches = [spec for spec in self.specs if stem.endswith(f"_{spec.suffix}")]
+        return max(matches, key=lambda spec: len(spec.suffix)) if matches else None
+
+
+def _variant_tag(model_name: str, variant: str) -> str:
+    # The part of the variant's tag that differs from the model's: gemma3:4b-it-qat, gemma3:4b-it-q8_0 -> q8_0
+    model_parts = model_name.split(":")[-1].split("-")
+    variant_parts = variant.split(":")[-1].split("-")
+    common = 0
+    while common < min(len(model_parts), len(variant_parts)) - 1 and model_parts[common] == variant_parts[common]:
+        common += 1
+    return "-".join(variant_parts[common:])
+
+
+_registry: Optional[ModelRegistry] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    The registry of MODEL_REGISTRY_PATH, read once per process.
+    """
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry.load()
+    return _registry
@@ -1,12 +1,42 @@
+import os
+import sys
 import subprocess
+import threading
 import time
 import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import (
+    OLLAMA_BASE_URL,
+    OLLAMA_REQUEST_TIMEOUT,
+    OLLAMA_HEALTH_CHECK_TIMEOUT,
+    OLLAMA_MANAGE_SERVER,
+    OLLAMA_PULL_CONCURRENCY,
+    OLLAMA_PULL_PROGRESS_INTERVAL,
+    OLLAMA_LOG_PATH, OLLAMA_LOG_MAX_BYTES, OLLAMA_LOG_BACKUPS,
+    OLLAMA_MONITOR_PATH
+)
+from utils.process_monitor import ProcessTreeMonitor
 
 class OllamaManager:
     def __init__(self):
         self.process = None
+        # CPU, RSS and threads of the local server while it runs; None when the server is managed elsewhere
+        self.monitor = None
+        self._log_thread = None
+        self._pulls = []  # (model name, future) of the pulls still running
 
     def start(self):
+        if not OLLAMA_MANAGE_SERVER:
+            print("Ollama server is managed externally.")
+            return
+
         print("Starting Ollama server...")
         if self.process is None:
             try:
@@ -14,71 +44,183 @@ class OllamaManager:
                 result = subprocess.run(["ollama", "list"], capture_output=True, text=True, check=False)
                 if result.returncode == 0:
                     print("Ollama server is already running.")
+                    # Its logs go elsewhere, but a local server can still be watched
+                    self.monitor = ProcessTreeMonitor().start()
                     return
             except FileNotFoundError:
                 print("Error: 'ollama' command not found. Make sure Ollama is installed and in your PATH.")
                 raise
 
+            # The output is drained by a thread: a full pipe would block the server
             self.process = subprocess.Popen(
                 ["ollama", "serve"],
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
+                stderr=subprocess.STDOUT
             )
+            self._log_thread = threading.Thread(target=self._drain_logs, args=(self.process.stdout,),
+                                                name="ollama-logs", daemon=True)
+            self._log_thread.start()
+            self.monitor = ProcessTreeMonitor(self.process.pid).start()
             print("Waiting for Ollama server to be ready...")
             time.sleep(10)  # Wait for the server to start
             print("Ollama server started.")
 
     def stop(self):
         
+        if self.monitor is not None:
+            self.monitor.stop()
+            if self.monitor.samples:
+                self.monitor.save(OLLAMA_MONITOR_PATH)
+                print(f"Ollama resource samples saved: {OLLAMA_MONITOR_PATH}")
+            self.monitor = None
+
         if self.process is not None:
             print("Stopping Ollama server...")
             self.process.terminate()
             self.process.wait()
+            # The pipe closes once the server and its model runners have exited, which ends the log thread
+            self._log_thread.join(timeout=5)
+            self._log_thread = None
             self.process = None
             print("Ollama server stopped.")
 
+    @staticmethod
+    def _drain_logs(stream):
+        Path(OLLAMA_LOG_PATH).parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(OLLAMA_LOG_PATH, maxBytes=OLLAMA_LOG_MAX_BYTES, backupCount=OLLAMA_LOG_BACKUPS,
+                                      encoding="utf-8")
+        logger = logging.getLogger("ollama.server")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            # The server's lines carry their own timestamps
+            for line in iter(stream.readline, b''):
+                logger.info(line.decode(errors="replace").rstrip())
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
     def list_models(self):
-        
+        # Models on the server, from its /api/tags
+        import requests
+
         try:
-            result = subprocess.run(["ollama", "list"], capture_output=True, text=True, check=True)
-            lines = result.stdout.strip().split('\n')
-            models = [line.split()[0] for line in lines[1:]]
-            return models
-        except (subprocess.CalledProcessError, FileNotFoundError):
+            response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=OLLAMA_HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            return [model["name"] for model in response.json().get("models", [])]
+        except (requests.exceptions.RequestException, ValueError, KeyError):
             return []
 
-    def pull_model(self, model_name: str):
-        
-        available_models = self.list_models()
-        if model_name in available_models:
-            print(f"Model '{model_name}' is already available.")
-            return
+    def pull_model(self, model_name: str, progress: Optional["PullProgress"] = None) -> bool:
+        """
+        Pull one model through the server's /api/pull, following its streamed progress.
+        """
+        import requests
 
-        print(f"Model '{model_name}' not found. Pulling from Ollama...")
+        progress = progress or PullProgress([model_name])
         try:
-            process = subprocess.Popen(
-                ["ollama", "pull", model_name],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            if process.stdout:
-                for line in iter(process.stdout.readline, b''):
-                    print(f"> {line.decode().strip()}")
-            
-            process.wait()
-            if process.returncode == 0:
-                print(f"Model '{model_name}' pulled successfully.")
-            else:
-                if process.stderr:
-                    stderr = process.stderr.read().decode()
-                    print(f"Error pulling model '{model_name}': {stderr}")
-        except FileNotFoundError:
-            print("Error: 'ollama' command not found.")
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-
-    def ensure_models_are_pulled(self, model_names: list):
-        
+            succeeded = False
+            # Older servers read the model from "name"
+            with requests.post(f"{OLLAMA_BASE_URL}/api/pull",
+                               json={"model": model_name, "name": model_name, "stream": True}, stream=True,
+                               timeout=(OLLAMA_HEALTH_CHECK_TIMEOUT, OLLAMA_REQUEST_TIMEOUT)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    update = json.loads(line)
+                    if "error" in update:
+                        raise ValueError(update["error"])
+                    progress.update(model_name, update)
+                    succeeded = succeeded or update.get("status") == "success"
+            # A stream cut short, e.g. by a server restart, ends without an error but the model is incomplete
+            if not succeeded:
+                raise ValueError("the pull ended before the server reported success")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            progress.update(model_name, {"status": "failed"})
+            print(f"Error pulling model '{model_name}': {e}")
+            return False
+
+        print(f"Model '{model_name}' pulled successfully.")
+        return True
+
+    def ensure_models_are_pulled(self, model_names: list, wait: bool = True):
+        """
+        Pull the missing models, OLLAMA_PULL_CONCURRENCY at a time. With wait=False the pulls run in the background
+        until wait_for_pulls().
+        """
+        if not OLLAMA_MANAGE_SERVER:
+            return
+
+        # One list for the whole batch
+        available_models = {_with_tag(model_name) for model_name in self.list_models()}
+        missing_models = []
         for model_name in model_names:
-            self.pull_model(model_name)
+            if _with_tag(model_name) in available_models:
+                print(f"Model '{model_name}' is already available.")
+            else:
+                missing_models.append(model_name)
+
+        if missing_models:
+            print(f"Pulling {', '.join(missing_models)} from Ollama...")
+            progress = PullProgress(missing_models)
+            executor = ThreadPoolExecutor(max_workers=min(OLLAMA_PULL_CONCURRENCY, len(missing_models)),
+                                          thread_name_prefix="ollama-pull")
+            self._pulls.extend((model_name, executor.submit(self.pull_model, model_name, progress))
+                               for model_name in missing_models)
+            executor.shutdown(wait=False)
+
+        if wait:
+            self.wait_for_pulls()
+
+    def wait_for_pulls(self):
+        pulls, self._pulls = self._pulls, []
+        failed_models = [model_name for model_name, future in pulls if not future.result()]
+        if failed_models:
+            print(f"Could not pull {', '.join(failed_models)}; generations with these models will fail.")
+
+
+class PullProgress:
+    """
+    Combined progress of concurrent pulls: for each model, the bytes completed over the layers it has reported so
+    far. Printed as one line at most every OLLAMA_PULL_PROGRESS_INTERVAL seconds, and when a pull ends.
+    """
+
+    def __init__(self, model_names: List[str]):
+        self.layers: Dict[str, Dict[str, Tuple[int, int]]] = {model_name: {} for model_name in model_names}
+        self.status = {model_name: "waiting" for model_name in model_names}
+        self._printed = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, model_name: str, update: Dict[str, Any]):
+        with self._lock:
+            status = update.get("status", self.status[model_name])
+            self.status[model_name] = status
+            if update.get("digest") and update.get("total"):
+                self.layers[model_name][update["digest"]] = (update.get("completed", 0), update["total"])
+
+            now = time.monotonic()
+            if now - self._printed < OLLAMA_PULL_PROGRESS_INTERVAL and status not in ("success", "failed"):
+                return
+            self._printed = now
+            line = self.line()
+        print(line)
+
+    def line(self) -> str:
+        parts = []
+        for model_name, layers in self.layers.items():
+            completed = sum(layer[0] for layer in layers.values())
+            total = sum(layer[1] for layer in layers.values())
+            if self.status[model_name] == "success":
+                parts.append(f"{model_name} done")
+            elif total and self.status[model_name] != "failed":
+                parts.append(f"{model_name} {completed / total:.0%} of {total / 2 ** 30:.1f} GB")
+            else:
+                parts.append(f"{model_name} {self.status[model_name]}")
+        return "Pulling: " + ", ".join(parts)
+
+
+def _with_tag(model_name: str) -> str:
+    # "qwen2" and "qwen2:latest" are one model
+    return model_name if ":" in model_name else f"{model_name}:latest"
@@ -1,9 +1,14 @@
-from datasets import load_dataset
-from PIL import Image
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config.constants import DATASET_NAME, SPLIT_NAME, IMAGES_DIR, NUM_SAMPLES
+import json
+import random
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config.constants import (
+    DATASET_NAME, SPLIT_NAME, IMAGES_DIR, NUM_SAMPLES,
+    SAMPLE_STRATEGY, SAMPLE_SEED, SAMPLE_STRATA, SAMPLE_POOL_SIZE, SAMPLE_BUDGET_CALLS, SAMPLE_MANIFEST_FILE,
+    DEDUP_ENABLED, DEDUP_MAX_DISTANCE, DEDUP_KEEP, DEDUP_SAMPLES_PER_CLUSTER, DEDUP_SEED, DEDUP_REPORT_FILE
+)
 
 """
 Dataset loading exceptions
@@ -17,15 +22,31 @@ class ImageProcessingError(Exception):
 
 
 """
-Load images from dataset. If the next object is not an image, skip it and move to the next one.
+Load the dataset split.
 """
-def load_first_images():
+def load_split():
+    # Imported here: `datasets` takes seconds to import and most commands never load the dataset
+    from datasets import load_dataset
 
     try:
-        dataset = load_dataset(DATASET_NAME, split=SPLIT_NAME)
+        return load_dataset(DATASET_NAME, split=SPLIT_NAME)
     except Exception as e:
         error_msg = f"Failed to load dataset {DATASET_NAME}: {str(e)}"
         raise DatasetLoadingError(error_msg) from e
+
+
+def _sample_image(sample):
+    from PIL import Image
+
+    image = sample.get('image')
+    return image if isinstance(image, Image.Image) else None
+
+
+"""
+Load images from dataset. If the next object is not an image, skip it and move to the next one.
+"""
+def load_first_images(num_samples: int = NUM_SAMPLES):
+    dataset = load_split()
     
     images = []
     skipped_samples = 0
@@ -33,19 +54,16 @@ def load_first_images():
     
     try:
         for i, sample in enumerate(dataset):
-            if i >= NUM_SAMPLES:
+            if i >= num_samples:
                 break
 
-            if 'image' in sample:
-                image = sample['image']
-                if isinstance(image, Image.Image):
-                    images.append(image)
-                else:
-                    skipped_samples += 1
-                    error_msg = f"Sample #{i+1} contains invalid image data (type: {type(image)})"
+            image = _sample_image(sample)
+            if image is not None:
+                images.append(image)
+            elif 'image' in sample:
+                skipped_samples += 1
             else:
                 missing_image_field += 1
-                error_msg = f"Sample #{i+1} missing 'image' field. Available fields: {list(sample.keys())}"
     
     except Exception as e:
         error_msg = f"Error during image processing: {str(e)}"
@@ -55,9 +73,349 @@ def load_first_images():
         error_msg = "No valid images were loaded from the dataset"
         raise ImageProcessingError(error_msg)
     
+    if skipped_samples or missing_image_field:
+        print(f"Skipped {skipped_samples} samples with invalid image data and "
+              f"{missing_image_field} samples without an 'image' field")
     return images
 
 
+"""
+Cheap features of a batch of images, one row per image: a 64-bin colour histogram, edge density, log aspect ratio
+and the 64 pHash bits. Everything except the pHash is computed on 64x64 thumbnails stacked into one array.
+Each group is standardised and weighted so that it counts the same in distances whatever its width.
+"""
+_FEATURE_THUMBNAIL_SIZE = 64
+_EDGE_THRESHOLD = 24  # Gray-level step that counts as an edge
+
+def image_features(images: List) -> "np.ndarray":
+    import numpy as np
+    from PIL import Image
+
+    size = _FEATURE_THUMBNAIL_SIZE
+    thumbnails = np.stack([
+        np.asarray(image.resize((size, size), Image.BOX, reducing_gap=2.0).convert("RGB")) for image in images
+    ])
+    count = len(images)
+
+    # 4 levels per channel -> 64 colour bins
+    bins = (thumbnails[..., 0] // 64).astype(np.int64) * 16 + (thumbnails[..., 1] // 64) * 4 + thumbnails[..., 2] // 64
+    bins = bins.reshape(count, -1) + np.arange(count)[:, None] * 64
+    histograms = np.bincount(bins.ravel(), minlength=count * 64).reshape(count, 64) / (size * size)
+
+    gray = thumbnails @ np.array([0.299, 0.587, 0.114])
+    edges = (np.abs(np.diff(gray, axis=1))[:, :, :-1] > _EDGE_THRESHOLD) | \
+            (np.abs(np.diff(gray, axis=2))[:, :-1, :] > _EDGE_THRESHOLD)
+    edge_density = edges.mean(axis=(1, 2))[:, None]
+
+    aspect_ratio = np.log([image.width / image.height for image in images])[:, None]
+
+    hashes = np.array([perceptual_hash(image).to_bytes(8, "big") for image in images], dtype="S8")
+    hash_bits = np.unpackbits(np.frombuffer(hashes.tobytes(), dtype=np.uint8).reshape(count, 8), axis=1)
+
+    return np.hstack([histograms, edge_density, aspect_ratio, hash_bits.astype(np.float64)])
+
+_FEATURE_GROUPS = [(0, 64), (64, 65), (65, 66), (66, 130)]  # Column ranges of the feature groups
+
+
+def _normalize_features(features):
+    import numpy as np
+
+    spread = features.std(axis=0)
+    normalized = (features - features.mean(axis=0)) / np.where(spread > 0, spread, 1)
+    for start, end in _FEATURE_GROUPS:
+        normalized[:, start:end] /= np.sqrt(end - start)
+    return normalized
+
+
+"""
+k-means with k-means++ seeding. Returns the cluster of every row.
+"""
+def kmeans(points, k: int, rng, iterations: int = 25):
+    import numpy as np
+
+    k = max(1, min(k, len(points)))
+    squared_norms = (points ** 2).sum(axis=1)
+    centres = [points[rng.integers(len(points))]]
+    nearest = ((points - centres[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = nearest.sum()
+        index = rng.choice(len(points), p=nearest / total) if total > 0 else rng.integers(len(points))
+        centres.append(points[index])
+        nearest = np.minimum(nearest, ((points - points[index]) ** 2).sum(axis=1))
+    centres = np.array(centres)
+
+    labels = np.zeros(len(points), dtype=np.int64)
+    for iteration in range(iterations):
+        distances = squared_norms[:, None] - 2 * points @ centres.T + (centres ** 2).sum(axis=1)[None, :]
+        new_labels = distances.argmin(axis=1)
+        if iteration and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for cluster in range(k):
+            members = labels == cluster
+            if members.any():
+                centres[cluster] = points[members].mean(axis=0)
+    return labels
+
+
+"""
+Split sample_size over the strata in proportion to their sizes (largest remainder). Every stratum gets at least
+one image while the sample is large enough, so small clusters of unusual screens are not left out.
+"""
+def allocate_sample(strata_sizes: List[int], sample_size: int) -> List[int]:
+    sample_size = min(sample_size, sum(strata_sizes))
+    non_empty = sum(1 for size in strata_sizes if size)
+    allocation = [1 if size and sample_size >= non_empty else 0 for size in strata_sizes]
+
+    room = [size - allocated for size, allocated in zip(strata_sizes, allocation)]
+    remaining = sample_size - sum(allocation)
+    quotas = [remaining * free / sum(room) if remaining else 0 for free in room]
+    for stratum, quota in enumerate(quotas):
+        allocation[stratum] += int(quota)
+
+    # The rest goes to the largest remainders, one image each
+    leftover = sample_size - sum(allocation)
+    by_remainder = sorted(range(len(quotas)), key=lambda stratum: (int(quotas[stratum]) - quotas[stratum], -strata_sizes[stratum]))
+    for stratum in by_remainder:
+        if leftover <= 0:
+            break
+        if allocation[stratum] < strata_sizes[stratum]:
+            allocation[stratum] += 1
+            leftover -= 1
+    return allocation
+
+
+"""
+Pick sample_size rows of the split: cluster the feature rows of the first pool_size images into strata and draw
+from every stratum in proportion to its size. Features are computed in batches while streaming over the split,
+so only the feature matrix is kept in memory. The same seed, pool and sample size select the same rows.
+Returns the selected images and a manifest of the selection.
+"""
+_FEATURE_BATCH_SIZE = 256
+
+def load_stratified_images(sample_size: int, seed: int = SAMPLE_SEED, strata: int = SAMPLE_STRATA,
+                           pool_size: Optional[int] = SAMPLE_POOL_SIZE):
+    import numpy as np
+
+    dataset = load_split()
+    
+    rows = []
+    feature_batches = []
+    batch, batch_rows = [], []
+    try:
+        for i, sample in enumerate(dataset):
+            if pool_size is not None and i >= pool_size:
+                break
+            image = _sample_image(sample)
+            if image is None:
+                continue
+            batch.append(image)
+            batch_rows.append(i)
+            if len(batch) == _FEATURE_BATCH_SIZE:
+                feature_batches.append(image_features(batch))
+                rows.extend(batch_rows)
+                batch, batch_rows = [], []
+        if batch:
+            feature_batches.append(image_features(batch))
+            rows.extend(batch_rows)
+    except Exception as e:
+        error_msg = f"Error during image processing: {str(e)}"
+        raise ImageProcessingError(error_msg) from e
+
+    if not rows:
+        raise ImageProcessingError("No valid images were loaded from the dataset")
+
+    rng = np.random.default_rng(seed)
+    labels = kmeans(_normalize_features(np.vstack(feature_batches)), strata, rng)
+    strata_rows = [[rows[position] for position in np.flatnonzero(labels == stratum)]
+                   for stratum in range(int(labels.max()) + 1)]
+    allocation = allocate_sample([len(members) for members in strata_rows], sample_size)
+
+    selected = []
+    strata_manifest = []
+    for members, count in zip(strata_rows, allocation):
+        chosen = sorted(int(row) for row in rng.choice(members, size=count, replace=False)) if count else []
+        selected.extend(chosen)
+        strata_manifest.append({"size": len(members), "selected": chosen})
+    selected.sort()
+
+    manifest = {
+        "strategy": "stratified",
+        "dataset": DATASET_NAME,
+        "split": SPLIT_NAME,
+        "seed": seed,
+        "pool_size": len(rows),
+        "sample_size": len(selected),
+        "strata": strata_manifest,
+        "selected_rows": selected
+    }
+    return [dataset[row]["image"] for row in selected], manifest
+
+
+"""
+Perceptual hash (pHash) of an image: the signs of the lowest 8x8 DCT coefficients of a 32x32 grayscale copy,
+relative to their median, packed into a 64-bit integer. Re-encoded, rescaled or slightly edited copies of a
+screen differ in only a few bits.
+"""
+_HASH_SIZE = 8
+_HASH_IMAGE_SIZE = 32
+_dct_matrix = None
+
+def perceptual_hash(image) -> int:
+    import numpy as np
+    from PIL import Image
+
+    global _dct_matrix
+    if _dct_matrix is None:
+        n = _HASH_IMAGE_SIZE
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        _dct_matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+        _dct_matrix[0] /= np.sqrt(2)
+
+    # Screenshots are large: reducing_gap shrinks by an integer factor first, BOX then averages every source pixel
+    small = image.resize((_HASH_IMAGE_SIZE, _HASH_IMAGE_SIZE), Image.BOX, reducing_gap=2.0).convert("L")
+    pixels = np.asarray(small, dtype=np.float64)
+    low = (_dct_matrix @ pixels @ _dct_matrix.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    # The DC term is the mean brightness and says nothing about structure
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+"""
+Multi-index hash table for near-duplicate lookup. Hashes are split into max_distance + 1 chunks; two hashes within
+max_distance bits of each other agree exactly on at least one chunk, so a lookup only compares against the hashes
+that share a chunk with the query instead of against every stored hash.
+"""
+class MultiIndexHashTable:
+    def __init__(self, max_distance: int, hash_bits: int = _HASH_SIZE * _HASH_SIZE):
+        self.max_distance = max_distance
+        chunk_count = min(hash_bits, max_distance + 1)
+        bounds = [round(i * hash_bits / chunk_count) for i in range(chunk_count + 1)]
+        # (shift, mask) of every chunk
+        self.chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in self.chunks]
+        self.hashes: List[int] = []
+        self.items: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, value: int, item: Any):
+        entry = len(self.hashes)
+        self.hashes.append(value)
+        self.items.append(item)
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            table.setdefault((value >> shift) & mask, []).append(entry)
+
+    def search(self, value: int) -> List[Tuple[int, Any]]:
+        """
+        (distance, item) for every stored hash within max_distance of value, nearest first.
+        """
+        seen = set()
+        matches = []
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            for entry in table.get((value >> shift) & mask, ()):
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                distance = hamming_distance(value, self.hashes[entry])
+                if distance <= self.max_distance:
+                    matches.append((distance, self.items[entry]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+"""
+Collapse near-duplicate images. Each image joins the cluster of the nearest earlier cluster representative within
+max_distance, or starts a new cluster; only representatives are indexed, so a cluster cannot drift by chaining.
+keep="representative" keeps the first image of every cluster, keep="sample" keeps up to samples_per_cluster images
+of each cluster chosen by reservoir sampling. Images are consumed one at a time, so any iterable can be passed.
+Returns the kept images in their original order and a report of the clusters.
+"""
+def deduplicate_images(images: Iterable, max_distance: int = DEDUP_MAX_DISTANCE, keep: str = DEDUP_KEEP,
+                       samples_per_cluster: int = DEDUP_SAMPLES_PER_CLUSTER,
+                       seed: int = DEDUP_SEED) -> Tuple[List, Dict[str, Any]]:
+    if keep not in ("representative", "sample"):
+        raise ValueError("keep should be 'representative' or 'sample'")
+    samples_per_cluster = 1 if keep == "representative" else max(1, samples_per_cluster)
+
+    rng = random.Random(seed)
+    index = MultiIndexHashTable(max_distance)
+    clusters: List[Dict[str, Any]] = []
+    # Per cluster: the kept (position, image) pairs
+    reservoirs: List[List[Tuple[int, Any]]] = []
+    total = 0
+
+    for position, image in enumerate(images):
+        total += 1
+        image_hash = perceptual_hash(image)
+        matches = index.search(image_hash)
+        if not matches:
+            index.add(image_hash, len(clusters))
+            clusters.append({"representative": position, "hash": f"{image_hash:016x}", "members": [position]})
+            reservoirs.append([(position, image)])
+            continue
+
+        cluster_id = matches[0][1]
+        cluster = clusters[cluster_id]
+        cluster["members"].append(position)
+        reservoir = reservoirs[cluster_id]
+        if len(reservoir) < samples_per_cluster:
+            reservoir.append((position, image))
+        elif keep == "sample":
+            slot = rng.randrange(len(cluster["members"]))
+            if slot < samples_per_cluster:
+                reservoir[slot] = (position, image)
+
+    kept = sorted((entry for reservoir in reservoirs for entry in reservoir), key=lambda entry: entry[0])
+    for cluster, reservoir in zip(clusters, reservoirs):
+        cluster["kept"] = sorted(position for position, _ in reservoir)
+
+    report = {
+        "total_images": total,
+        "clusters": len(clusters),
+        "kept_images": len(kept),
+        "removed_images": total - len(kept),
+        "max_distance": max_distance,
+        "keep": keep,
+        "samples_per_cluster": samples_per_cluster,
+        "duplicate_clusters": [cluster for cluster in clusters if len(cluster["members"]) > 1],
+        "kept_positions": [position for position, _ in kept]
+    }
+    return [image for _, image in kept], report
+
+
+"""
+Save the dedup report next to the images, with the saved file name of every kept image.
+inference_calls_per_image is what one image costs downstream (generation and judge requests); the report says how
+many calls the removed images would have taken.
+"""
+def save_dedup_report(report: Dict[str, Any], output_dir: str, inference_calls_per_image: int = 0) -> Dict[str, Any]:
+    report = dict(report)
+    report["inference_calls_per_image"] = inference_calls_per_image
+    report["inference_calls_saved"] = report["removed_images"] * inference_calls_per_image
+
+    # save_images() numbers the kept images in dataset order
+    file_names = {position: image_filename(rank) for rank, position in enumerate(report.pop("kept_positions"))}
+    report["duplicate_clusters"] = [dict(cluster, kept_files=[file_names[position] for position in cluster["kept"]])
+                                    for cluster in report["duplicate_clusters"]]
+
+    os.makedirs(output_dir, exist_ok=True)
+    report["report_path"] = os.path.join(output_dir, DEDUP_REPORT_FILE)
+    with open(report["report_path"], "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def image_filename(index: int) -> str:
+    return f"mobile_ui_{index+1:03d}.png"
+
+
 """
 Save images to output directory.
 """
@@ -73,7 +431,7 @@ def save_images(images, output_dir):
     
     for i, image in enumerate(images):           
         try:
-            filename = f"mobile_ui_{i+1:03d}.png"
+            filename = image_filename(i)
             filepath = os.path.join(output_dir, filename)
             image.save(filepath)
             saved_count += 1
@@ -88,19 +446,68 @@ def save_images(images, output_dir):
     return saved_count, save_errors
 
 """
-Combine loading and saving images.
+Combine selecting, loading, deduplicating and saving images. With SAMPLE_BUDGET_CALLS the number of images is the
+budget divided by inference_calls_per_image. The dedup report is None when DEDUP_ENABLED is off; the sample
+manifest is None for the "first" strategy.
 """
-def load_and_save_first_images():
-    images = load_first_images()
+def load_and_save_first_images(inference_calls_per_image: int = 0):
+    sample_size = NUM_SAMPLES
+    if SAMPLE_BUDGET_CALLS is not None and inference_calls_per_image:
+        sample_size = max(1, SAMPLE_BUDGET_CALLS // inference_calls_per_image)
+
+    manifest = None
+    if SAMPLE_STRATEGY == "stratified":
+        images, manifest = load_stratified_images(sample_size)
+    elif SAMPLE_STRATEGY == "first":
+        images = load_first_images(sample_size)
+    else:
+        raise ValueError("SAMPLE_STRATEGY should be 'first' or 'stratified'")
+
+    dedup_report = None
+    kept_positions = range(len(images))
+    if DEDUP_ENABLED:
+        images, dedup_report = deduplicate_images(images)
+        kept_positions = dedup_report["kept_positions"]
     saved_count, save_errors = save_images(images, IMAGES_DIR)
+    if dedup_report is not None:
+        dedup_report = save_dedup_report(dedup_report, IMAGES_DIR, inference_calls_per_image)
+    if manifest is not None:
+        save_sample_manifest(manifest, IMAGES_DIR, sample_size, inference_calls_per_image, kept_positions)
     
-    return images, saved_count, save_errors
+    return images, saved_count, save_errors, dedup_report
+
+
+"""
+Save the sample manifest next to the images, with the dataset row of every saved file, so that runs on the same
+selection can be compared and the selection can be rebuilt from the seed.
+"""
+def save_sample_manifest(manifest: Dict[str, Any], output_dir: str, sample_size: int,
+                         inference_calls_per_image: int = 0, kept_positions: Optional[Iterable[int]] = None) -> str:
+    manifest = dict(manifest)
+    manifest["requested_sample_size"] = sample_size
+    manifest["budget_calls"] = SAMPLE_BUDGET_CALLS
+    manifest["inference_calls_per_image"] = inference_calls_per_image
+
+    # kept_positions: the positions in the selection that survived deduplication, in saved order
+    if kept_positions is None:
+        kept_positions = range(len(manifest["selected_rows"]))
+    manifest["files"] = {image_filename(rank): manifest["selected_rows"][position]
+                         for rank, position in enumerate(kept_positions)}
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, SAMPLE_MANIFEST_FILE)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
 
 
 def main():
     try:
-        images, saved_count, save_errors = load_and_save_first_images()
+        images, saved_count, save_errors, dedup_report = load_and_save_first_images()
         
+        if dedup_report is not None:
+            print(f"Removed {dedup_report['removed_images']} near-duplicate images "
+                  f"({dedup_report['clusters']} clusters of {dedup_report['total_images']} images)")
         print(f"Successfully loaded {len(images)} images")
         print(f"Successfully saved {saved_count} images to {IMAGES_DIR}")
         if save_errors > 0:
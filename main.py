@@ -1,54 +1,130 @@
+import argparse
 import os
 import sys
 import time
-from pathlib import Path
 
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
 from config.constants import (
-    MODEL_NAME_1,
-    MODEL_NAME_2,
-)
-from config.ollama_manager import OllamaManager
-from utils.evaluation_helper import (
-    ensure_images_exist,
-    generate_code_with_ollama,
-    evaluate_with_llm_judge,
-    generate_model_comparison_report,
-    save_comparison_report,
-    print_summary
+    EVALUATION_REPORT_PATH,
+    EVALUATION_RESULTS_JSON_PATH,
+    WARM_BUNDLE_PATH,
 )
 
+from utils.sharding import parse_shard
+
+# Only lightweight modules are imported at startup. Sub-commands import what they need,
+# so `report` does not pay for datasets, PIL, anthropic or requests
+# (check with: python -X importtime main.py report).
+
+
+def prepare_generation(ollama_manager, registry=None):
+    from config.model_registry import get_model_registry
+    from utils.evaluation_helper import ensure_images_exist
+
+    # Start Ollama server and ensure models are pulled; models with their own servers are provisioned there
+    ollama_manager.start()
+    registry = registry or get_model_registry()
+    # The pulls run in the background while the images are prepared
+    ollama_manager.ensure_models_are_pulled(list(dict.fromkeys(spec.name for spec in registry if not spec.base_urls)),
+                                            wait=False)
+
+    # Ensure images exist. The pulls are waited for even when this fails: their threads would otherwise keep the
+    # process alive at exit, and their failures would go unreported
+    try:
+        return ensure_images_exist()
+    finally:
+        ollama_manager.wait_for_pulls()
+
+
+def generate_code(ollama_manager, shard=None, ollama_base_url=None):
+    from utils.evaluation_helper import generate_code_with_ollama
+
+    if not prepare_generation(ollama_manager):
+        return False
+
+    # Generate code with Ollama
+    return generate_code_with_ollama(shard, ollama_base_url, ollama_manager.monitor)
+
+
+async def generate_code_async(ollama_manager, shard=None, ollama_base_url=None):
+    from utils.evaluation_helper import generate_code_with_ollama_async
+
+    if not prepare_generation(ollama_manager):
+        return False
+
+    return await generate_code_with_ollama_async(shard, ollama_base_url, ollama_manager.monitor)
+
+
+def judge_code(shard=None):
+    from utils.evaluation_helper import evaluate_with_llm_judge
+
+    # Evaluate with LLM as a Judge
+    return report_evaluation(evaluate_with_llm_judge(shard), shard)
+
+
+async def judge_code_async(shard=None):
+    from utils.evaluation_helper import evaluate_with_llm_judge_async
+
+    return report_evaluation(await evaluate_with_llm_judge_async(shard), shard)
+
+
+def report_evaluation(evaluation_results, shard=None):
+    from utils.evaluation_helper import generate_model_comparison_report, save_comparison_report
+    from utils.sharding import shard_results_dir
+
+    if not evaluation_results:
+        return None, None
+
+    # Generate and save the comparison report
+    comparison_report = generate_model_comparison_report(evaluation_results)
+    report_path = save_comparison_report(comparison_report, shard_results_dir(shard))
+    return comparison_report, report_path
+
+
+def run_stages(ollama_manager, args):
+    if args.sequential:
+        return run_sequential(ollama_manager, args)
+    if not generate_code(ollama_manager, args.shard, args.ollama_url):
+        return None, None
+    return judge_code(args.shard)
+
+
+def run_sequential(ollama_manager, args):
+    from utils.evaluation_helper import evaluate_sequentially
+
+    if not prepare_generation(ollama_manager):
+        return None, None
+    # Generation and judging alternate, so that the run can stop as soon as the winner is decided
+    return report_evaluation(evaluate_sequentially(args.shard, args.ollama_url, ollama_manager.monitor), args.shard)
+
+
+async def run_stages_async(ollama_manager, args):
+    # Both stages share one event loop
+    if not await generate_code_async(ollama_manager, args.shard, args.ollama_url):
+        return None, None
+    return await judge_code_async(args.shard)
+
+
+def run_pipeline(args):
+    from config.ollama_manager import OllamaManager
+    from utils.evaluation_helper import print_summary
 
-def main():
-    
     ollama_manager = OllamaManager()
     try:
-        # Start Ollama server and ensure models are pulled
-        ollama_manager.start()
-        ollama_manager.ensure_models_are_pulled([MODEL_NAME_1, MODEL_NAME_2])
-        
         start_time = time.time()
-        
-        # Ensure images exist
-        if not ensure_images_exist():
-            return
 
-        # Generate code with Ollama
-        ollama_results = generate_code_with_ollama()
-        if not ollama_results:
+        if args.use_async and args.sequential:
+            print("--sequential runs on threads; --async is ignored")
+        if args.use_async and not args.sequential:
+            import asyncio
+            comparison_report, report_path = asyncio.run(run_stages_async(ollama_manager, args))
+        else:
+            comparison_report, report_path = run_stages(ollama_manager, args)
+        if comparison_report is None:
             return
 
-        # Evaluate with LLM as a Judge
-        evaluation_results = evaluate_with_llm_judge()
-        if not evaluation_results:
-            return
-
-        # Generate and save the comparison report
-        comparison_report = generate_model_comparison_report(evaluation_results)
-        report_path = save_comparison_report(comparison_report)
-        
         # Final summary
         elapsed_time = time.time() - start_time
         print("\n" + "=" * 70)
@@ -58,15 +134,242 @@ def main():
         print(f"Report saved: {report_path}")
 
         print_summary(comparison_report)
-        
+
+    finally:
+        ollama_manager.stop()
+
+
+def generate_command(args):
+    from config.ollama_manager import OllamaManager
+
+    ollama_manager = OllamaManager()
+    try:
+        if args.use_async:
+            import asyncio
+            generated = asyncio.run(generate_code_async(ollama_manager, args.shard, args.ollama_url))
+        else:
+            generated = generate_code(ollama_manager, args.shard, args.ollama_url)
+        if generated:
+            print("Code generation completed")
+    finally:
+        ollama_manager.stop()
+
+
+def judge_command(args):
+    from utils.evaluation_helper import print_summary
+
+    if args.use_async:
+        import asyncio
+        comparison_report, report_path = asyncio.run(judge_code_async(args.shard))
+    else:
+        comparison_report, report_path = judge_code(args.shard)
+    if comparison_report is not None:
+        print(f"Report saved: {report_path}")
+        print_summary(comparison_report)
+
+
+def sweep_command(args):
+    from config.ollama_manager import OllamaManager
+    from utils.evaluation_helper import sweep_prompts
+
+    ollama_manager = OllamaManager()
+    try:
+        if prepare_generation(ollama_manager):
+            sweep_prompts(args.ollama_url, ollama_manager.monitor)
+    finally:
+        ollama_manager.stop()
+
+
+def benchmark_command(args):
+    from config.constants import MODEL_BENCHMARK_RESULTS_PATH
+    from config.model_registry import get_model_registry
+    from config.ollama_manager import OllamaManager
+    from utils.evaluation_helper import (benchmark_models, generate_model_comparison_report,
+                                         save_comparison_report, print_summary)
+
+    ollama_manager = OllamaManager()
+    try:
+        # The variants are pulled too
+        if not prepare_generation(ollama_manager, get_model_registry().with_variants()):
+            return
+        evaluation_results = benchmark_models(args.ollama_url, ollama_manager.monitor)
+        if not evaluation_results:
+            return
+
+        comparison_report = generate_model_comparison_report(evaluation_results)
+        report_path = save_comparison_report(comparison_report, MODEL_BENCHMARK_RESULTS_PATH)
+        print(f"Report saved: {report_path}")
+        print_summary(comparison_report)
+    finally:
+        ollama_manager.stop()
+
+
+def snapshot_command(args):
+    from config.model_registry import get_model_registry
+    from utils.warm_bundle import create_bundle
+
+    index = create_bundle(args.output, extra_meta={"models": get_model_registry().names})
+    total_size = sum(entry["size"] for entry in index["files"].values())
+    print(f"Bundled {len(index['files'])} files ({total_size / 2 ** 20:.1f} MB) into {args.output}")
+
+
+def restore_command(args):
+    from utils.warm_bundle import WarmBundle, restore_bundle
+
+    started = time.time()
+    counts = restore_bundle(args.path)
+    print(f"Restored {counts['restored']} files, {counts['unchanged']} already up to date"
+          + (f", {counts['corrupted']} corrupted" if counts["corrupted"] else "")
+          + (f", {counts['rejected']} rejected outside the working directory" if counts["rejected"] else "")
+          + f" in {time.time() - started:.1f} seconds")
+    with WarmBundle(args.path) as bundle:
+        models = bundle.index.get("models")
+    if models:
+        # Model weights are not bundled; the next run pulls whichever of them the server lacks
+        print(f"Bundle made with models: {', '.join(models)}")
+
+
+def merge_command(args):
+    from utils.evaluation_helper import generate_model_comparison_report, save_comparison_report, print_summary
+    from utils.sharding import find_shard_results, merge_shard_results
+
+    results_files = args.results or find_shard_results()
+    merged = merge_shard_results(results_files, args.output)
+    if "error" in merged:
+        print(merged["error"])
+        return
+
+    comparison_report = generate_model_comparison_report(merged)
+    report_path = save_comparison_report(comparison_report, os.path.dirname(args.output))
+    print(f"Report saved: {report_path}")
+    print_summary(comparison_report)
+
+
+def report_command(args):
+    from utils.evaluation_helper import load_comparison_report, print_summary
+
+    report = load_comparison_report(args.path)
+    if report is not None:
+        print_summary(report)
+
+
+def analyze_command(args):
+    import json
+    from utils.evaluation_analyzer import EvaluationAnalyzer
+
+    analyzer = EvaluationAnalyzer(args.results)
+    if not analyzer.load_results():
+        return
+
+    analyzer.save_report(args.output, top_n=args.top, image_names=args.images)
+
+    best_and_worst = analyzer.find_best_and_worst_results()
+    if "error" not in best_and_worst:
+        print("\nBest results:")
+        for result in best_and_worst["best_results"]:
+            print(f"  {result['image_name']} ({result['model_name']}): {result['overall_score']}/10")
+        print("Worst results:")
+        for result in best_and_worst["worst_results"]:
+            print(f"  {result['image_name']} ({result['model_name']}): {result['overall_score']}/10")
+
+    pass_at_k = analyzer.calculate_pass_at_k_metrics(k_values=args.k, thresholds=args.thresholds)
+    if "error" in pass_at_k:
+        print(pass_at_k["error"])
+    else:
+        print("\npass@k:")
+        print(json.dumps(pass_at_k["pass_at_k_metrics"], indent=2))
+
+
+def shard_argument(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mobile UI to React code generation and evaluation pipeline")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Generate code, judge it and report (default)")
+    generate_parser = subparsers.add_parser("generate", help="Prepare images and generate code with the Ollama models")
+    judge_parser = subparsers.add_parser("judge", help="Judge the generated code and save the comparison report")
+    sweep_parser = subparsers.add_parser("sweep", help="Find the best prompt by successive halving over PROMPT_DICT")
+    benchmark_parser = subparsers.add_parser("benchmark", help="Measure quality against latency, load time and memory "
+                                                               "of every model and its variants")
+
+    # Accepted before or after the command; the sub-command copies do not reset a value given before it
+    for stage_parser in (parser, run_parser, generate_parser, judge_parser):
+        stage_parser.add_argument("--shard", type=shard_argument, metavar="i/N",
+                                  default=None if stage_parser is parser else argparse.SUPPRESS,
+                                  help="Only process shard i of N of the (model, prompt, image) work list")
+    for stage_parser in (parser, run_parser, generate_parser, sweep_parser, benchmark_parser):
+        stage_parser.add_argument("--ollama-url", default=None if stage_parser is parser else argparse.SUPPRESS,
+                                  help="Ollama server(s) for this worker, comma-separated (default: OLLAMA_BASE_URLS)")
+    for stage_parser in (parser, run_parser, generate_parser, judge_parser):
+        stage_parser.add_argument("--async", action="store_true", dest="use_async",
+                                  default=False if stage_parser is parser else argparse.SUPPRESS,
+                                  help="Run generation and judging as coroutines of one event loop instead of threads")
+
+    for stage_parser in (parser, run_parser):
+        stage_parser.add_argument("--sequential", action="store_true",
+                                  default=False if stage_parser is parser else argparse.SUPPRESS,
+                                  help="Generate and judge images in random order and stop once the winner is decided")
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Bundle the images, generated code and build caches "
+                                                             "into one file for fast cold starts")
+    snapshot_parser.add_argument("--output", default=WARM_BUNDLE_PATH, help="Bundle file to write")
+    restore_parser = subparsers.add_parser("restore", help="Unpack a warm bundle into the working directory")
+    restore_parser.add_argument("path", nargs="?", default=WARM_BUNDLE_PATH, help="Bundle file to restore")
+
+    merge_parser = subparsers.add_parser("merge", help="Combine shard results into one results index and report")
+    merge_parser.add_argument("results", nargs="*", help="Shard results files (default: every shard under the results directory)")
+    merge_parser.add_argument("--output", default=EVALUATION_RESULTS_JSON_PATH, help="Merged results index to write")
+
+    report_parser = subparsers.add_parser("report", help="Print the summary of a saved comparison report")
+    report_parser.add_argument("path", nargs="?", default=None,
+                               help="Comparison report file (default: the most recent one)")
+
+    analyze_parser = subparsers.add_parser("analyze", help="Write the detailed report and pass@k metrics")
+    analyze_parser.add_argument("--results", default=EVALUATION_RESULTS_JSON_PATH, help="Results index file")
+    analyze_parser.add_argument("--output", default=EVALUATION_REPORT_PATH, help="Detailed report file to write")
+    analyze_parser.add_argument("--top", type=int, default=None, metavar="N", help="Only report the N best evaluations")
+    analyze_parser.add_argument("--image", action="append", default=None, dest="images",
+                                help="Only report this image (can be repeated)")
+    analyze_parser.add_argument("--k", type=int, nargs="+", default=None,
+                                help="k values for pass@k (default: the full curve)")
+    analyze_parser.add_argument("--thresholds", type=float, nargs="+", default=[5, 6, 7, 8, 9],
+                                help="Score thresholds for pass@k")
+
+    return parser
+
+
+COMMANDS = {
+    "run": run_pipeline,
+    "generate": generate_command,
+    "judge": judge_command,
+    "sweep": sweep_command,
+    "benchmark": benchmark_command,
+    "snapshot": snapshot_command,
+    "restore": restore_command,
+    "merge": merge_command,
+    "report": report_command,
+    "analyze": analyze_command,
+}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        COMMANDS[args.command or "run"](args)
     except KeyboardInterrupt:
         print("\n\nPipeline interrupted by user")
     except Exception as e:
         print(f"\nCritical pipeline error: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        ollama_manager.stop()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import os
+import sys
+from typing import Dict, List, Optional, Any, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import LLM_AS_JUDGE_ASYNC_MAX_CONCURRENCY, LLM_AS_JUDGE_MAX_REPAIR_ATTEMPTS
+from utils.image_utils import encode_image_to_base64
+from utils.results_store import ResultsStore
+from utils.async_utils import map_ordered
+from utils.concurrency_limiter import AsyncAdaptiveConcurrencyLimiter, SUCCESS, ERROR
+from utils.judge_response_parser import JudgeResponseParser
+from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+
+import anthropic
+
+
+class AsyncLLMAsJudgeRunner(LLMAsJudgeRunner):
+    """
+    LLMAsJudgeRunner on asyncio: every judge request is a coroutine on one anthropic.AsyncAnthropic client,
+    so the adaptive limiter can keep many more requests in flight than there would be threads.
+    Prompts, parsing, repair requests and the results store are the threaded runner's.
+    """
+    concurrency_limiter_class = AsyncAdaptiveConcurrencyLimiter
+    max_concurrency = LLM_AS_JUDGE_ASYNC_MAX_CONCURRENCY
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client = anthropic.AsyncAnthropic(api_key=self.api_key)
+    
+    
+    
+    async def call_claude_api_async(self, image_base64: str, generated_code: str,
+                                    image_name: str, model_name: str) -> Dict[str, Any]:
+        self._count("evaluations")
+
+        try:
+            messages_data = self.build_judge_messages(image_base64, generated_code, image_name, model_name)
+            evaluation, problems, response_text, assistant_content = await self._request_evaluation_async(messages_data)
+
+            repair_attempts = 0
+            while problems and repair_attempts < LLM_AS_JUDGE_MAX_REPAIR_ATTEMPTS:
+                repair_attempts += 1
+                repair_messages = self._start_repair(messages_data, assistant_content, problems,
+                                                     image_name, model_name, repair_attempts)
+                evaluation, problems, response_text, assistant_content = await self._request_evaluation_async(repair_messages)
+
+            return self._finish_evaluation(evaluation, problems, response_text, repair_attempts)
+
+        except Exception as e:
+            return self._failed_call(e)
+    
+    
+    
+    async def _request_evaluation_async(self, messages_data: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[str], str, Any]:
+        self._count("judge_requests")
+
+        started = await self.concurrency_limiter.acquire()
+        outcome = ERROR
+        try:
+            if self.judge_mode == "tool":
+                message = await self.client.messages.create(**self._request_kwargs(messages_data))
+                evaluation, problems, raw_response, assistant_content = self._parse_tool_message(message)
+            else:
+                evaluation, problems, raw_response = await self._request_text_evaluation_async(messages_data)
+                assistant_content = raw_response.rstrip()
+            outcome = SUCCESS
+        except Exception as e:
+            outcome = self._limiter_outcome(e)
+            raise
+        finally:
+            self.concurrency_limiter.release(started, outcome)
+
+        if problems:
+            self._count("parse_failures")
+
+        return evaluation, problems, raw_response, assistant_content
+    
+    
+    
+    async def _request_text_evaluation_async(self, messages_data: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[str], str]:
+        parser = JudgeResponseParser()
+        stop_reason = None
+
+        async with self.client.messages.stream(**self._request_kwargs(messages_data)) as stream:
+            async for text in stream.text_stream:
+                if parser.feed(text) is not None:
+                    break
+            else:
+                stop_reason = (await stream.get_final_message()).stop_reason
+
+        evaluation, problems = parser.finish(stop_reason)
+        return evaluation, problems, parser.text
+    
+    
+    
+    async def evaluate_single_code_async(self, image_path: str, code_file_path: str,
+                                         image_base64: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            print(f"Evaluating: {os.path.basename(code_file_path)} for {os.path.basename(image_path)}")
+
+            image_base64 = image_base64 or await asyncio.to_thread(encode_image_to_base64, image_path)
+            generated_code = await asyncio.to_thread(self.read_generated_code, code_file_path)
+            model_name = self._model_label(code_file_path)
+
+            evaluation = await self.call_claude_api_async(
+                image_base64=image_base64,
+                generated_code=generated_code,
+                image_name=os.path.basename(image_path),
+                model_name=model_name
+            )
+
+            return self._tag_evaluation(evaluation, image_path, code_file_path, model_name)
+
+        except Exception as e:
+            return self._failed_evaluation(e, image_path, code_file_path)
+    
+    
+    
+    async def evaluate_all_generated_code_async(self, extra_meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        image_files = self._find_image_files()
+        if not image_files:
+            return {"error": "No images found", "results": []}
+
+        store = ResultsStore(self.store_dir)
+        print(f"Run ID: {store.run_id}")
+
+        async def evaluate_image(group) -> List[Dict[str, Any]]:
+            (prompt_id, image_path), code_files = group
+            inputs, evaluations = {}, {}
+            for code_file in code_files:
+                inputs[code_file] = await asyncio.to_thread(self.judgment_inputs, str(image_path), code_file)
+                evaluations[code_file] = await asyncio.to_thread(self.reused_evaluation, code_file, inputs[code_file])
+
+            # The image is encoded once for all of its code that has to be judged
+            to_judge = [code_file for code_file in code_files if evaluations[code_file] is None]
+            if to_judge:
+                image_base64 = await asyncio.to_thread(self.encode_image, str(image_path))
+                judged = await asyncio.gather(*(self.evaluate_single_code_async(str(image_path), code_file, image_base64)
+                                                for code_file in to_judge))
+                evaluations.update(zip(to_judge, judged))
+            return [self._with_task_meta(evaluations[code_file], prompt_id, inputs[code_file]) for code_file in code_files]
+
+        # The tasks of one image are consecutive; enough images in flight to fill the limiter with every model's code
+        groups = ((key, [code_file for _, _, code_file in tasks])
+                  for key, tasks in itertools.groupby(self._iter_evaluation_tasks(image_files),
+                                                      key=lambda task: (task[0], task[1])))
+        images_in_flight = max(1, self.concurrency_limiter.max_limit // len(self.registry))
+        try:
+            with store:
+                async for evaluations in map_ordered(evaluate_image, groups, images_in_flight):
+                    for evaluation in evaluations:
+                        self.store_evaluation(store, evaluation)
+        finally:
+            await self.aclose()
+
+        return self.finish_run(store, image_files, extra_meta)
+    
+    
+    
+    @staticmethod
+    def encode_image(image_path: str) -> Optional[str]:
+        # An unreadable image is left to evaluate_single_code_async, which reports the error for every code file
+        try:
+            return encode_image_to_base64(image_path)
+        except Exception:
+            return None
+    
+    
+    
+    async def aclose(self):
+        await self.client.close()
@@ -0,0 +1,194 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import OLLAMA_REQUEST_DELAY, OLLAMA_MAX_RETRIES
+from utils.image_utils import encode_image_to_base64
+from utils.async_utils import map_ordered
+from utils.concurrency_limiter import AsyncAdaptiveConcurrencyLimiter, SUCCESS, TIMEOUT, RATE_LIMITED, ERROR
+from model_runner.ollama_models_runner import OllamaModelRunner
+from model_runner.ollama_pool import OllamaEndpointPool, DeadlineExceeded
+from model_runner.async_ollama_pool import AsyncOllamaEndpointPool
+
+import httpx
+import requests
+
+
+class AsyncOllamaModelRunner(OllamaModelRunner):
+    """
+    OllamaModelRunner on asyncio: every generation is a coroutine streaming over one httpx.AsyncClient,
+    so dozens of streams are in flight without a thread each. Image and code files are read and written
+    on worker threads, off the event loop. Prompts, validation, file names and metrics are the threaded runner's.
+    """
+    endpoint_pool_class = AsyncOllamaEndpointPool
+    concurrency_limiter_class = AsyncAdaptiveConcurrencyLimiter
+    
+    
+    
+    async def call_ollama_api_async(self, model_name: str, system_prompt: str, user_prompt: str,
+                                    image_base64: str, max_tokens: int = 3000, temperature: float = 0.7,
+                                    model_suffix: Optional[str] = None) -> str:
+        payload = self.build_payload(model_name, system_prompt, user_prompt, image_base64, max_tokens, temperature)
+        endpoint_pool, concurrency_limiter = self.resources_for(model_suffix, model_name)
+
+        started = await concurrency_limiter.acquire()
+        span_started = time.time()
+        outcome = ERROR
+        first_token_latency = None
+        try:
+            result = await self._generate_with_deadline_async(payload, max_tokens, endpoint_pool)
+            outcome = SUCCESS
+            first_token_latency = self._first_token_latency(result, time.perf_counter() - started)
+            return result.get("response", "")
+
+        except (httpx.HTTPError, requests.exceptions.RequestException) as e:
+            outcome = self._limiter_outcome(e)
+            print(f"Ollama API Error: {e}")
+            return f"API error: {str(e)}"
+
+        finally:
+            concurrency_limiter.release(started, outcome, first_token_latency)
+            self.performance.record_span(model_name, span_started, time.time(), outcome)
+    
+    
+    
+    async def _generate_with_deadline_async(self, payload: dict, max_tokens: int,
+                                            endpoint_pool: Optional[OllamaEndpointPool] = None) -> dict:
+        model_name = payload["model"]
+        endpoint_pool = endpoint_pool or self.endpoint_pool
+
+        for attempt in range(OLLAMA_MAX_RETRIES + 1):
+            timeout, hedge_after = self._request_timing(model_name, max_tokens, endpoint_pool)
+            started = time.time()
+            try:
+                result = await endpoint_pool.generate_async(payload, timeout=timeout, hedge_after=hedge_after)
+            except DeadlineExceeded:
+                if attempt == OLLAMA_MAX_RETRIES:
+                    raise
+                self._count_deadline_retry(model_name, timeout, attempt)
+                continue
+
+            latency = time.time() - started
+            self.deadline_estimator.observe(model_name, result, latency)
+            self.performance.observe(model_name, result, latency)
+            return result
+    
+    
+    
+    @staticmethod
+    def _limiter_outcome(error: Exception) -> str:
+        if isinstance(error, httpx.TimeoutException):
+            return TIMEOUT
+        if isinstance(error, httpx.HTTPStatusError):
+            return RATE_LIMITED if error.response.status_code in (429, 503) else ERROR
+        if isinstance(error, httpx.HTTPError):
+            return ERROR
+        return OllamaModelRunner._limiter_outcome(error)
+    
+    
+    
+    async def process_single_image_async(self, image_path: str, model_name: str,
+                                         system_prompt: str, user_prompt: str,
+                                         max_tokens: int, temperature: float, model_suffix: Optional[str] = None,
+                                         image_base64: Optional[str] = None) -> Tuple[str, str]:
+        try:
+            print(f"Processing {image_path} with model {model_name}...")
+
+            image_base64 = image_base64 or await asyncio.to_thread(encode_image_to_base64, image_path)
+            formatted_user_prompt = user_prompt.format(image_path=os.path.basename(image_path))
+
+            generated_code = await self.call_ollama_api_async(
+                model_name=model_name,
+                system_prompt=system_prompt,
+                user_prompt=formatted_user_prompt,
+                image_base64=image_base64,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                model_suffix=model_suffix
+            )
+
+            return await asyncio.to_thread(self.save_generated_code, generated_code, image_path, model_name, model_suffix)
+
+        except Exception as e:
+            error_msg = f"Error processing {image_path}: {str(e)}"
+            print(error_msg)
+            return "", error_msg
+    
+    
+    
+    async def _generate_for_image_async(self, image_path: Path, model_name: str, model_suffix: str,
+                                        system_prompt: str, user_prompt: str, max_tokens: int, temperature: float,
+                                        image_base64: Optional[str] = None) -> dict:
+        generated_code, output_or_error = await self.process_single_image_async(
+            str(image_path), model_name, system_prompt, user_prompt, max_tokens, temperature, model_suffix, image_base64
+        )
+        result_info = await asyncio.to_thread(self.record_result, image_path, model_name, model_suffix,
+                                              generated_code, output_or_error)
+        await asyncio.sleep(OLLAMA_REQUEST_DELAY)
+        return result_info
+    
+    
+    
+    async def run_model_on_images_async(self, system_prompt, user_prompt, model_choice: int = 1,
+                                        image_files: Optional[List[str]] = None) -> List[dict]:
+
+        (model_name, max_tokens, temperature, model_suffix), image_files = self.prepare_run(model_choice, image_files)
+        if not image_files:
+            return []
+
+        async def generate(image_path: Path) -> dict:
+            return await self._generate_for_image_async(image_path, model_name, model_suffix, system_prompt,
+                                                        user_prompt, max_tokens, temperature)
+
+        # Images are only encoded once they are among the next max_limit to run; the limiter decides how many
+        # of those are actually generating
+        return [result async for result in map_ordered(generate, image_files, self.max_in_flight([model_choice]))]
+    
+    
+    
+    async def run_models_on_images_async(self, system_prompt, user_prompt, model_choices: Optional[List[int]] = None,
+                                         image_files: Optional[List[str]] = None) -> Dict[int, List[dict]]:
+        """
+        run_models_on_images() on the event loop: the models' requests for one image share its payload.
+        """
+        model_choices = list(model_choices or self.registry.choices)
+        settings, image_files = self.prepare_models(model_choices, image_files)
+        results = {model_choice: [] for model_choice in model_choices}
+        if not image_files:
+            return results
+
+        async def generate(image_path: Path) -> List[dict]:
+            image_base64 = await asyncio.to_thread(self.encode_image, image_path)
+            return await asyncio.gather(*(
+                self._generate_for_image_async(image_path, model_name, model_suffix, system_prompt, user_prompt,
+                                               max_tokens, temperature, image_base64)
+                for model_name, max_tokens, temperature, model_suffix in settings.values()
+            ))
+
+        # Enough images in flight to fill every model's limiter
+        images_in_flight = max(1, self.max_in_flight(model_choices) // len(model_choices))
+        async for image_results in map_ordered(generate, image_files, images_in_flight):
+            for model_choice, result in zip(settings, image_results):
+                results[model_choice].append(result)
+        return results
+    
+    
+    
+    async def run_all_models_on_images_async(self, system_prompt, user_prompt) -> dict:
+        try:
+            results = await self.run_models_on_images_async(system_prompt, user_prompt)
+            return {self.registry.get(model_choice).suffix: model_results
+                    for model_choice, model_results in results.items()}
+        finally:
+            await self.aclose()
+    
+    
+    
+    async def aclose(self):
+        for endpoint_pool in self.endpoint_pools():
+            await endpoint_pool.aclose()
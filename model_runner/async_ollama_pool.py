@@ -0,0 +1,192 @@
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Any, Set
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import OLLAMA_REQUEST_TIMEOUT, OLLAMA_HEALTH_CHECK_TIMEOUT
+from model_runner.ollama_pool import (
+    OllamaEndpoint,
+    OllamaEndpointPool,
+    NoHealthyEndpointError,
+    DeadlineExceeded
+)
+
+import httpx
+
+
+class AsyncOllamaEndpointPool(OllamaEndpointPool):
+    """
+    OllamaEndpointPool for asyncio. Endpoint choice, failover and statistics are the threaded pool's;
+    health checks, waiting for a free endpoint and streaming are coroutines on one httpx.AsyncClient.
+    Cancelling the task of a generation closes its stream, which makes Ollama stop generating.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client: Optional[httpx.AsyncClient] = None
+        self._freed: Optional[asyncio.Event] = None
+
+    def _client(self) -> httpx.AsyncClient:
+        # Created inside the running event loop; only the deadline limits how long a generation may take
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=OLLAMA_HEALTH_CHECK_TIMEOUT),
+                                            limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.capacity))
+        return self.client
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def check_health_async(self, endpoint: OllamaEndpoint) -> bool:
+        client = self._client()
+        try:
+            response = await client.get(f"{endpoint.base_url}/api/ps", timeout=OLLAMA_HEALTH_CHECK_TIMEOUT)
+            if response.status_code == 404:
+                # Servers without /api/ps: only liveness is known
+                version = await client.get(f"{endpoint.base_url}/api/version", timeout=OLLAMA_HEALTH_CHECK_TIMEOUT)
+                version.raise_for_status()
+                resident = set(endpoint.resident_models)
+            else:
+                response.raise_for_status()
+                resident = self._loaded_models(response.json())
+            healthy = True
+        except (httpx.HTTPError, ValueError):
+            resident = set()
+            healthy = False
+
+        self._set_health(endpoint, healthy, resident)
+        return healthy
+
+    async def refresh_health_async(self, force: bool = False):
+        now = time.time()
+        stale = [endpoint for endpoint in self.endpoints
+                 if force or now - endpoint.last_health_check >= self.health_check_interval]
+        if stale:
+            await asyncio.gather(*(self.check_health_async(endpoint) for endpoint in stale))
+
+    async def acquire_async(self, model_name: str, exclude: Optional[Set[str]] = None) -> OllamaEndpoint:
+        """
+        Reserve an endpoint for one request, waiting while every healthy endpoint is at its in-flight limit.
+        """
+        exclude = exclude or set()
+        await self.refresh_health_async()
+
+        while True:
+            with self._lock:
+                if not self._has_healthy(exclude):
+                    break
+                endpoint = self._pick(model_name, exclude)
+                if endpoint is not None:
+                    self._reserve(endpoint)
+                    return endpoint
+            # Every healthy endpoint is busy
+            if self._freed is None:
+                self._freed = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._freed.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+        # Nothing healthy is left: look again before giving up
+        await self.refresh_health_async(force=True)
+        with self._lock:
+            available = self._has_healthy(exclude)
+        if not available:
+            raise NoHealthyEndpointError(f"No healthy Ollama endpoint among {[e.base_url for e in self.endpoints]}")
+        return await self.acquire_async(model_name, exclude)
+
+    def release(self, *args, **kwargs):
+        super().release(*args, **kwargs)
+        if self._freed is not None:
+            self._freed.set()
+            self._freed = None
+
+    async def generate_async(self, payload: Dict[str, Any], timeout: float = OLLAMA_REQUEST_TIMEOUT,
+                             hedge_after: Optional[float] = None) -> Dict[str, Any]:
+        """
+        generate() as a coroutine: stream one response within timeout seconds, hedged after hedge_after seconds.
+        """
+        deadline = time.monotonic() + timeout
+        if not hedge_after or hedge_after >= timeout:
+            return await self._generate_async(payload, deadline)
+
+        primary = asyncio.ensure_future(self._generate_async(payload, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self.hedged_requests += 1
+        hedge = asyncio.ensure_future(self._generate_async(payload, deadline))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return task.result()
+                    # One attempt failed; the other may still answer in time
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _generate_async(self, payload: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+        model_name = payload.get("model", "")
+        tried: Set[str] = set()
+
+        while True:
+            endpoint = await self.acquire_async(model_name, exclude=tried)
+            started = time.time()
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                result = await asyncio.wait_for(self._stream_generate_async(endpoint, payload), remaining)
+            except asyncio.CancelledError:
+                self.release(endpoint, model_name, time.time() - started, success=False, cancelled=True)
+                raise
+            except asyncio.TimeoutError:
+                with self._lock:
+                    endpoint.deadlines_exceeded += 1
+                self.release(endpoint, model_name, time.time() - started, success=False)
+                raise DeadlineExceeded(f"Generation on {endpoint.base_url} passed its deadline")
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                self.release(endpoint, model_name, time.time() - started, success=False, reachable=False)
+                tried.add(endpoint.base_url)
+                if len(tried) >= len(self.endpoints):
+                    raise
+                print(f"Ollama endpoint {endpoint.base_url} failed ({e.__class__.__name__}), failing over...")
+                continue
+            except Exception:
+                self.release(endpoint, model_name, time.time() - started, success=False)
+                raise
+
+            self.release(endpoint, model_name, time.time() - started, success=True,
+                         generated_tokens=result.get("eval_count", 0))
+            return result
+
+    async def _stream_generate_async(self, endpoint: OllamaEndpoint, payload: Dict[str, Any]) -> Dict[str, Any]:
+        parts: List[str] = []
+        final: Dict[str, Any] = {}
+        sent = time.monotonic()
+        first_token = None
+        async with self._client().stream("POST", f"{endpoint.base_url}/api/generate",
+                                         json=dict(payload, stream=True)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                final = self._read_chunk(line, parts)
+                if first_token is None and parts and parts[-1]:
+                    first_token = time.monotonic() - sent
+                if final:
+                    break
+        return self._final_result(final or {}, parts, first_token)
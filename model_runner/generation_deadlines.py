@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+from collections import deque
+from typing import Dict, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import (
+    OLLAMA_REQUEST_TIMEOUT,
+    OLLAMA_DEADLINE_SLACK,
+    OLLAMA_MIN_DEADLINE,
+    OLLAMA_DEADLINE_MIN_SAMPLES,
+    OLLAMA_HEDGE_QUANTILE
+)
+
+
+class DeadlineEstimator:
+    """
+    Per-model request deadlines and hedge delays from the generations seen so far.
+    A completed generation reports how many tokens it produced (eval_count), how long producing them took
+    (eval_duration) and how long loading the model took (load_duration); the rest of its latency is overhead
+    (queueing, prompt and image processing). Model loading is left out, so a cold start does not stretch
+    every later deadline.
+    """
+
+    def __init__(self, slack: float = OLLAMA_DEADLINE_SLACK, min_samples: int = OLLAMA_DEADLINE_MIN_SAMPLES,
+                 hedge_quantile: float = OLLAMA_HEDGE_QUANTILE, min_deadline: float = OLLAMA_MIN_DEADLINE,
+                 max_deadline: float = OLLAMA_REQUEST_TIMEOUT, window: int = 100):
+        self.slack = slack
+        self.min_samples = min_samples
+        self.hedge_quantile = hedge_quantile
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.window = window
+        self.samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model_name: str, result: Dict[str, Any], latency: float):
+        tokens = result.get("eval_count") or 0
+        eval_seconds = (result.get("eval_duration") or 0) / 1e9
+        load_seconds = (result.get("load_duration") or 0) / 1e9
+        warm_latency = max(latency - load_seconds, 0.0)
+        overhead = max(warm_latency - eval_seconds, 0.0)
+        with self._lock:
+            samples = self.samples.setdefault(model_name, deque(maxlen=self.window))
+            samples.append((tokens, eval_seconds, overhead, warm_latency))
+
+    def _estimate(self, model_name: str, max_tokens: float) -> Optional[Dict[str, float]]:
+        with self._lock:
+            samples = list(self.samples.get(model_name, ()))
+        if len(samples) < self.min_samples:
+            return None
+
+        tokens = sum(sample[0] for sample in samples)
+        eval_seconds = sum(sample[1] for sample in samples)
+        if not tokens or not eval_seconds:
+            return None
+        tokens_per_second = tokens / eval_seconds
+        # The longest recent answer, bounded by num_predict, and the slowest recent overhead
+        expected_tokens = min(max_tokens, max(sample[0] for sample in samples))
+        overhead = max(sample[2] for sample in samples)
+        deadline = self.slack * (overhead + expected_tokens / tokens_per_second)
+
+        latencies = sorted(sample[3] for sample in samples)
+        hedge_index = min(len(latencies) - 1, int(self.hedge_quantile * len(latencies)))
+        return {
+            "samples": len(samples),
+            "tokens_per_second": round(tokens_per_second, 1),
+            "expected_tokens": expected_tokens,
+            "deadline": round(min(self.max_deadline, max(self.min_deadline, deadline)), 3),
+            "hedge_after": round(latencies[hedge_index], 3)
+        }
+
+    def deadline(self, model_name: str, max_tokens: int) -> float:
+        """
+        Seconds the next request of the model may take; the full OLLAMA_REQUEST_TIMEOUT until enough is known.
+        """
+        estimate = self._estimate(model_name, max_tokens)
+        return estimate["deadline"] if estimate else self.max_deadline
+
+    def hedge_delay(self, model_name: str) -> Optional[float]:
+        """
+        Seconds after which a still-running request of the model is hedged; None until enough is known.
+        """
+        estimate = self._estimate(model_name, float("inf"))
+        return estimate["hedge_after"] if estimate else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sample_counts = {model: len(samples) for model, samples in self.samples.items()}
+        # Deadlines as they stand for answers as long as the longest recent one
+        return {model: self._estimate(model, float("inf")) or {"samples": count}
+                for model, count in sample_counts.items()}
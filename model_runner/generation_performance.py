@@ -0,0 +1,75 @@
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class GenerationPerformance:
+    """
+    Per-model speed of every completed generation: end-to-end latency, time to first token as seen by the client,
+    and Ollama's own load_duration, eval_count and eval_duration. Unlike the DeadlineEstimator, which keeps a recent
+    window to set deadlines, every request of the run is kept, so the numbers describe the whole run.
+    The spans of all requests, failed ones included, place the run's requests in time next to the server's
+    resource samples (utils/process_monitor.py).
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[Dict[str, float]]] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def observe(self, model_name: str, result: Dict[str, Any], latency: float):
+        sample = {
+            "latency": latency,
+            "time_to_first_token": result.get("time_to_first_token"),
+            "load_seconds": (result.get("load_duration") or 0) / 1e9,
+            "tokens": result.get("eval_count") or 0,
+            "eval_seconds": (result.get("eval_duration") or 0) / 1e9
+        }
+        with self._lock:
+            self.samples.setdefault(model_name, []).append(sample)
+
+    def record_span(self, model_name: str, started: float, finished: float, outcome: str):
+        # Wall-clock times, like the resource samples; started is when the request got its concurrency slot
+        with self._lock:
+            self.spans.append({"model": model_name, "started": started, "finished": finished, "outcome": outcome})
+
+    def model_stats(self, model_name: str) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self.samples.get(model_name, ()))
+        if not samples:
+            return {"requests": 0}
+
+        latencies = [sample["latency"] for sample in samples]
+        first_tokens = [sample["time_to_first_token"] for sample in samples if sample["time_to_first_token"] is not None]
+        tokens = sum(sample["tokens"] for sample in samples)
+        eval_seconds = sum(sample["eval_seconds"] for sample in samples)
+        return {
+            "requests": len(samples),
+            # A model is loaded by its first request after an unload; later requests report (almost) nothing
+            "load_seconds": round(max(sample["load_seconds"] for sample in samples), 3),
+            "time_to_first_token_p50": _rounded(_percentile(first_tokens, 50)),
+            "latency_p50": _rounded(_percentile(latencies, 50)),
+            "latency_p95": _rounded(_percentile(latencies, 95)),
+            "tokens_per_second": round(tokens / eval_seconds, 1) if eval_seconds else None,
+            "generated_tokens": tokens
+        }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            model_names = list(self.samples)
+        return {model_name: self.model_stats(model_name) for model_name in model_names}
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    # Nearest rank; None for no values
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(percent / 100 * len(values)))]
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
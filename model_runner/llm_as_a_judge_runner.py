@@ -1,34 +1,64 @@
 import os
 import sys
 import json
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 import anthropic
+import numpy as np
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from utils.image_utils import encode_image_to_base64, get_image_mime_type
-from prompts.prompt_constants import JUDGE_SYSTEM_PROMPT, JUDGE_USER_PROMPT
+from utils.results_store import ResultsStore, iter_detailed_results
+from utils.score_aggregator import ScoreTensor, summarize_evaluations
+from utils.concurrency_limiter import AdaptiveConcurrencyLimiter, SUCCESS, TIMEOUT, RATE_LIMITED, ERROR
+from utils.build_graph import BuildGraph, digest, file_digest
+from utils.judge_response_parser import (
+    JudgeResponseParser,
+    JUDGE_TOOL_NAME,
+    build_judge_tool,
+    validate_judge_evaluation
+)
+from prompts.prompt_constants import (
+    JUDGE_SYSTEM_PROMPT,
+    JUDGE_USER_PROMPT,
+    JUDGE_REPAIR_PROMPT,
+    JUDGE_TOOL_REPAIR_PROMPT
+)
 
 from config.constants import (
     LLM_AS_JUDGE_MODEL_NAME,
     LLM_AS_JUDGE_MODEL_MAX_TOKENS,
     LLM_AS_JUDGE_MODEL_TEMPERATURE,
+    LLM_AS_JUDGE_MODE,
+    LLM_AS_JUDGE_MAX_REPAIR_ATTEMPTS,
+    LLM_AS_JUDGE_INITIAL_CONCURRENCY,
+    LLM_AS_JUDGE_MAX_CONCURRENCY,
     ANTHROPIC_API_KEY,
     IMAGES_DIR,
     GENERATED_CODE_DIR,
     EVALUATION_RESULTS_PATH,
-    IMAGE_EXTENSIONS
+    EVALUATION_STORE_PATH,
+    IMAGE_EXTENSIONS,
+    INCREMENTAL_BUILD,
+    BUILD_GRAPH_FILE
 )
+from config.model_registry import ModelRegistry, get_model_registry
 
 
 class LLMAsJudgeRunner:
-    def __init__(self, images_dir: Optional[str] = None, code_dir: Optional[str] = None):
+    concurrency_limiter_class = AdaptiveConcurrencyLimiter
+    max_concurrency = LLM_AS_JUDGE_MAX_CONCURRENCY
+
+    def __init__(self, images_dir: Optional[str] = None, code_dir: Optional[str] = None,
+                 results_dir: Optional[str] = None, registry: Optional[ModelRegistry] = None):
    
         self.images_dir = images_dir or IMAGES_DIR
         self.code_dir = code_dir or GENERATED_CODE_DIR
+        self.registry = registry or get_model_registry()
         self.api_key = ANTHROPIC_API_KEY
         
         if not self.api_key:
@@ -36,8 +66,34 @@ class LLMAsJudgeRunner:
         
         self.client = anthropic.Anthropic(api_key=self.api_key)
         
-        self.evaluation_dir = Path(EVALUATION_RESULTS_PATH)
-        self.evaluation_dir.mkdir(exist_ok=True)
+        self.evaluation_dir = Path(results_dir or EVALUATION_RESULTS_PATH)
+        self.evaluation_dir.mkdir(parents=True, exist_ok=True)
+        # Shard and other scoped runs keep their rows next to their results index
+        self.store_dir = str(self.evaluation_dir / "runs") if results_dir else EVALUATION_STORE_PATH
+
+        if LLM_AS_JUDGE_MODE not in ("tool", "text"):
+            raise ValueError("LLM_AS_JUDGE_MODE should be 'tool' or 'text'")
+        self.judge_mode = LLM_AS_JUDGE_MODE
+        self.judge_tool = build_judge_tool()
+        self.judge_stats = {
+            "mode": self.judge_mode,
+            "evaluations": 0,
+            "judge_requests": 0,
+            "parse_failures": 0,
+            "repair_requests": 0,
+            "rejudged_evaluations": 0,
+            "unparsed_evaluations": 0,
+            "reused_evaluations": 0
+        }
+        self._stats_lock = threading.Lock()
+        self.concurrency_limiter = self.concurrency_limiter_class(
+            "judge", initial_limit=LLM_AS_JUDGE_INITIAL_CONCURRENCY, max_limit=self.max_concurrency
+        )
+        # Judgments of earlier runs whose inputs are unchanged are reused (see utils/build_graph.py)
+        self.build_graph = BuildGraph(str(self.evaluation_dir / BUILD_GRAPH_FILE)) if INCREMENTAL_BUILD else None
+        self.judge_inputs = digest(JUDGE_SYSTEM_PROMPT, JUDGE_USER_PROMPT, JUDGE_REPAIR_PROMPT, JUDGE_TOOL_REPAIR_PROMPT,
+                                   LLM_AS_JUDGE_MODEL_NAME, LLM_AS_JUDGE_MODEL_MAX_TOKENS,
+                                   LLM_AS_JUDGE_MODEL_TEMPERATURE, self.judge_mode, self.judge_tool)
     
 
     
@@ -54,84 +110,264 @@ class LLMAsJudgeRunner:
                        image_name: str, model_name: str) -> Dict[str, Any]:
           
 
+        self._count("evaluations")
+
         try:
-            mime_type = get_image_mime_type(image_name)
-            
-            # Format the user prompt with the generated code
-            formatted_prompt = JUDGE_USER_PROMPT.format(
-                generated_code=generated_code, 
-                model_name=model_name,
-                image_name=image_name
-            )
-            
-            messages_data = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": mime_type,
-                                "data": image_base64
-                            }
-                        },
-                        {
-                            "type": "text", 
-                            "text": formatted_prompt
+            messages_data = self.build_judge_messages(image_base64, generated_code, image_name, model_name)
+            evaluation, problems, response_text, assistant_content = self._request_evaluation(messages_data)
+
+            # Retry only this item with a targeted repair request instead of re-running the evaluation
+            repair_attempts = 0
+            while problems and repair_attempts < LLM_AS_JUDGE_MAX_REPAIR_ATTEMPTS:
+                repair_attempts += 1
+                repair_messages = self._start_repair(messages_data, assistant_content, problems,
+                                                     image_name, model_name, repair_attempts)
+                evaluation, problems, response_text, assistant_content = self._request_evaluation(repair_messages)
+
+            return self._finish_evaluation(evaluation, problems, response_text, repair_attempts)
+
+        except Exception as e:
+            return self._failed_call(e)
+    
+    
+    
+    def build_judge_messages(self, image_base64: str, generated_code: str,
+                             image_name: str, model_name: str) -> List[Dict[str, Any]]:
+        mime_type = get_image_mime_type(image_name)
+        
+        # Format the user prompt with the generated code
+        formatted_prompt = JUDGE_USER_PROMPT.format(
+            generated_code=generated_code, 
+            model_name=model_name,
+            image_name=image_name
+        )
+        
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": mime_type,
+                            "data": image_base64
                         }
-                    ]
-                }
-            ]
-            
-            message = self.client.messages.create(
-                model=LLM_AS_JUDGE_MODEL_NAME,
-                max_tokens=LLM_AS_JUDGE_MODEL_MAX_TOKENS,
-                temperature=LLM_AS_JUDGE_MODEL_TEMPERATURE,
-                system=JUDGE_SYSTEM_PROMPT,
-                messages=messages_data  # type: ignore
-            )
-            
-            response_text = ""
-            for content_block in message.content:
-                try:
-                    response_text += content_block.text  # type: ignore
-                except AttributeError:
-                    response_text += str(content_block)
-            
-            try:
-                # Attempt to parse the entire response as JSON
-                return json.loads(response_text)
-            except json.JSONDecodeError:
-                # If parsing fails, try to extract JSON from markdown
-                try:
-                    json_match = re.search(r"```json\n({.*?})\n```", response_text, re.DOTALL)
-                    if json_match:
-                        return json.loads(json_match.group(1))
-                    
-                    # Fallback to finding the first and last curly brace
-                    first_brace = response_text.find('{')
-                    last_brace = response_text.rfind('}')
-                    if first_brace != -1 and last_brace != -1:
-                        json_str = response_text[first_brace:last_brace+1]
-                        return json.loads(json_str)
-
-                    raise json.JSONDecodeError("No JSON object found", response_text, 0)
-
-                except json.JSONDecodeError:
-                    return {
-                        "error": "Failed to parse JSON response",
-                        "raw_response": response_text,
-                        "overall_score": 0
+                    },
+                    {
+                        "type": "text", 
+                        "text": formatted_prompt
                     }
-        except Exception as e:
-            print(f"API call failed: {e}")
-            import traceback
-            traceback.print_exc()
+                ]
+            }
+        ]
+    
+    
+    
+    def _start_repair(self, messages_data: List[Dict[str, Any]], assistant_content: Any, problems: List[str],
+                      image_name: str, model_name: str, repair_attempt: int) -> List[Dict[str, Any]]:
+        self._count("repair_requests")
+        print(f"Judge response for {image_name} ({model_name}) is unusable: {'; '.join(problems)}. "
+              f"Sending repair request {repair_attempt}/{LLM_AS_JUDGE_MAX_REPAIR_ATTEMPTS}...")
+        return self._build_repair_messages(messages_data, assistant_content, problems)
+    
+    
+    
+    def _finish_evaluation(self, evaluation: Optional[Dict[str, Any]], problems: List[str],
+                           response_text: str, repair_attempts: int) -> Dict[str, Any]:
+        if repair_attempts:
+            self._count("rejudged_evaluations")
+
+        if problems:
+            self._count("unparsed_evaluations")
             return {
-                "error": f"API call failed: {str(e)}",
-                "overall_score": 0
+                "error": "Failed to parse JSON response",
+                "parse_errors": problems,
+                "raw_response": response_text,
+                "overall_score": 0,
+                "meta": {"repair_attempts": repair_attempts, "judge_mode": self.judge_mode}
             }
+
+        evaluation["meta"] = {"repair_attempts": repair_attempts, "judge_mode": self.judge_mode}
+        return evaluation
+    
+    
+    
+    @staticmethod
+    def _failed_call(error: Exception) -> Dict[str, Any]:
+        print(f"API call failed: {error}")
+        import traceback
+        traceback.print_exception(type(error), error, error.__traceback__)
+        return {
+            "error": f"API call failed: {str(error)}",
+            "overall_score": 0
+        }
+    
+    
+    
+    def _request_evaluation(self, messages_data: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[str], str, Any]:
+        """
+        Send one judge request in the configured mode.
+        Returns (evaluation, problems, raw_response, assistant_content); assistant_content is what a repair request replays.
+        """
+        self._count("judge_requests")
+
+        started = self.concurrency_limiter.acquire()
+        outcome = ERROR
+        try:
+            if self.judge_mode == "tool":
+                evaluation, problems, raw_response, assistant_content = self._request_tool_evaluation(messages_data)
+            else:
+                evaluation, problems, raw_response = self._request_text_evaluation(messages_data)
+                assistant_content = raw_response.rstrip()
+            outcome = SUCCESS
+        except Exception as e:
+            outcome = self._limiter_outcome(e)
+            raise
+        finally:
+            self.concurrency_limiter.release(started, outcome)
+
+        if problems:
+            self._count("parse_failures")
+
+        return evaluation, problems, raw_response, assistant_content
+    
+    
+    
+    @staticmethod
+    def _limiter_outcome(error: Exception) -> str:
+        if isinstance(error, anthropic.APITimeoutError):
+            return TIMEOUT
+        # 429 rate limit, 503/529 overloaded; the SDK has already retried these
+        if isinstance(error, anthropic.APIStatusError) and error.status_code in (429, 503, 529):
+            return RATE_LIMITED
+        return ERROR
+    
+    
+    
+    def _request_kwargs(self, messages_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        kwargs = {
+            "model": LLM_AS_JUDGE_MODEL_NAME,
+            "max_tokens": LLM_AS_JUDGE_MODEL_MAX_TOKENS,
+            "temperature": LLM_AS_JUDGE_MODEL_TEMPERATURE,
+            "system": JUDGE_SYSTEM_PROMPT,
+            "messages": messages_data
+        }
+        if self.judge_mode == "tool":
+            kwargs["tools"] = [self.judge_tool]
+            kwargs["tool_choice"] = {"type": "tool", "name": JUDGE_TOOL_NAME}
+        return kwargs
+    
+    
+    
+    def _request_text_evaluation(self, messages_data: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[str], str]:
+        """
+        Stream one judge response through the incremental parser.
+        The stream is closed as soon as a valid object is complete.
+        """
+        parser = JudgeResponseParser()
+        stop_reason = None
+
+        with self.client.messages.stream(**self._request_kwargs(messages_data)) as stream:
+            for text in stream.text_stream:
+                if parser.feed(text) is not None:
+                    break
+            else:
+                stop_reason = stream.get_final_message().stop_reason
+
+        evaluation, problems = parser.finish(stop_reason)
+        return evaluation, problems, parser.text
+    
+    
+    
+    def _request_tool_evaluation(self, messages_data: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], List[str], str, List[Dict[str, Any]]]:
+        """
+        Force the judge to answer through the evaluation tool, so the scores arrive as structured input.
+        """
+        message = self.client.messages.create(**self._request_kwargs(messages_data))
+        return self._parse_tool_message(message)
+    
+    
+    
+    @staticmethod
+    def _parse_tool_message(message: Any) -> Tuple[Optional[Dict[str, Any]], List[str], str, List[Dict[str, Any]]]:
+        assistant_content = []
+        evaluation = None
+        for content_block in message.content:
+            if content_block.type == "tool_use":
+                assistant_content.append({
+                    "type": "tool_use",
+                    "id": content_block.id,
+                    "name": content_block.name,
+                    "input": content_block.input
+                })
+                if content_block.name == JUDGE_TOOL_NAME and evaluation is None:
+                    evaluation = dict(content_block.input)  # type: ignore
+            elif content_block.type == "text":
+                assistant_content.append({"type": "text", "text": content_block.text})
+
+        raw_response = json.dumps(evaluation, ensure_ascii=False) if evaluation is not None else ""
+
+        if evaluation is None:
+            return None, [f"the response did not call the {JUDGE_TOOL_NAME} tool"], raw_response, assistant_content
+
+        problems = validate_judge_evaluation(evaluation)
+        if problems and message.stop_reason == "max_tokens":
+            problems.insert(0, "the response was truncated by the token limit")
+
+        return (None if problems else evaluation), problems, raw_response, assistant_content
+    
+    
+    
+    def _build_repair_messages(self, messages_data: List[Dict[str, Any]], assistant_content: Any,
+                               problems: List[str]) -> List[Dict[str, Any]]:
+        repair_messages = list(messages_data)
+        problems_text = "; ".join(problems)
+
+        tool_use_ids = []
+        if isinstance(assistant_content, list):
+            tool_use_ids = [block["id"] for block in assistant_content if block.get("type") == "tool_use"]
+
+        if assistant_content:
+            repair_messages.append({"role": "assistant", "content": assistant_content})
+
+        if tool_use_ids:
+            # Every tool call has to be answered, so the feedback goes back as an error tool result
+            feedback = JUDGE_TOOL_REPAIR_PROMPT.format(problems=problems_text, tool_name=JUDGE_TOOL_NAME)
+            repair_messages.append({
+                "role": "user",
+                "content": [
+                    {"type": "tool_result", "tool_use_id": tool_use_id, "content": feedback, "is_error": True}
+                    for tool_use_id in tool_use_ids
+                ]
+            })
+        elif self.judge_mode == "tool":
+            repair_messages.append({
+                "role": "user",
+                "content": JUDGE_TOOL_REPAIR_PROMPT.format(problems=problems_text, tool_name=JUDGE_TOOL_NAME)
+            })
+        else:
+            repair_messages.append({"role": "user", "content": JUDGE_REPAIR_PROMPT.format(problems=problems_text)})
+
+        return repair_messages
+    
+    
+    
+    def _count(self, counter: str):
+        # Evaluations run on several threads
+        with self._stats_lock:
+            self.judge_stats[counter] += 1
+    
+    
+    
+    def get_judge_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return _with_judge_rates(dict(self.judge_stats))
+    
+    
+    
+    def get_concurrency_stats(self) -> Dict[str, Any]:
+        return self.concurrency_limiter.stats()
     
     
     
@@ -143,13 +379,7 @@ class LLMAsJudgeRunner:
             image_base64 = encode_image_to_base64(image_path)
             generated_code = self.read_generated_code(code_file_path)
             
-            code_filename = os.path.basename(code_file_path)
-            if "_model1" in code_filename:
-                model_name = "Model 1"
-            elif "_model2" in code_filename:
-                model_name = "Model 2"
-            else:
-                model_name = "Unknown Model"
+            model_name = self._model_label(code_file_path)
             
             evaluation = self.call_claude_api(
                 image_base64=image_base64,
@@ -158,35 +388,53 @@ class LLMAsJudgeRunner:
                 model_name=model_name
             )
             
-            evaluation["meta"] = {
-                "image_path": image_path,
-                "code_file_path": code_file_path,
-                "image_name": os.path.basename(image_path),
-                "code_filename": code_filename,
-                "model_name": model_name
-            }
-            
-            return evaluation
+            return self._tag_evaluation(evaluation, image_path, code_file_path, model_name)
             
         except Exception as e:
-            return {
-                "error": f"Evaluation failed: {str(e)}",
-                "overall_score": 0,
-                "meta": {
-                    "image_path": image_path,
-                    "code_file_path": code_file_path,
-                    "error": str(e)
-                }
+            return self._failed_evaluation(e, image_path, code_file_path)
+    
+    
+    
+    def _model_label(self, code_file_path: str) -> str:
+        spec = self.registry.for_code_file(code_file_path)
+        return spec.label if spec else "Unknown Model"
+    
+    
+    
+    @staticmethod
+    def _tag_evaluation(evaluation: Dict[str, Any], image_path: str, code_file_path: str,
+                        model_name: str) -> Dict[str, Any]:
+        evaluation.setdefault("meta", {}).update({
+            "image_path": image_path,
+            "code_file_path": code_file_path,
+            "image_name": os.path.basename(image_path),
+            "code_filename": os.path.basename(code_file_path),
+            "model_name": model_name
+        })
+        return evaluation
+    
+    
+    
+    @staticmethod
+    def _failed_evaluation(error: Exception, image_path: str, code_file_path: str) -> Dict[str, Any]:
+        return {
+            "error": f"Evaluation failed: {str(error)}",
+            "overall_score": 0,
+            "meta": {
+                "image_path": image_path,
+                "code_file_path": code_file_path,
+                "error": str(error)
             }
+        }
     
     
     
-    def find_code_files_for_image(self, image_name: str) -> List[str]:
+    def find_code_files_for_image(self, image_name: str, code_dir: Optional[str] = None) -> List[str]:
         image_stem = Path(image_name).stem  # "mobile_ui_001"
         code_files = []
         
-        for pattern in [f"{image_stem}_model1.jsx", f"{image_stem}_model2.jsx"]:
-            code_file_path = Path(self.code_dir) / pattern
+        for pattern in [f"{image_stem}_{spec.suffix}.jsx" for spec in self.registry]:
+            code_file_path = Path(code_dir or self.code_dir) / pattern
             if code_file_path.exists():
                 code_files.append(str(code_file_path))
         
@@ -194,8 +442,40 @@ class LLMAsJudgeRunner:
     
     
     
-    def evaluate_all_generated_code(self) -> Dict[str, Any]:
+    def find_prompt_code_dirs(self) -> List[Tuple[Optional[str], str]]:
+        """
+        (prompt_id, code_dir) pairs to judge. Code generated with several prompts lives in prompt_<n> subdirectories;
+        otherwise the code directory itself is judged without a prompt id.
+        """
+        prompt_dirs = sorted(Path(self.code_dir).glob("prompt_*"), key=lambda path: path.name)
+        prompt_dirs = [path for path in prompt_dirs if path.is_dir()]
+        if not prompt_dirs:
+            return [(None, self.code_dir)]
+        return [(path.name[len("prompt_"):], str(path)) for path in prompt_dirs]
+    
+    
+    
+    def evaluate_all_generated_code(self, extra_meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+
+        image_files = self._find_image_files()
+        if not image_files:
+            return {"error": "No images found", "results": []}
 
+        store = ResultsStore(self.store_dir)
+        print(f"Run ID: {store.run_id}")
+        
+        # Evaluations run on enough threads for the highest limit; the adaptive limiter decides how many
+        # judge requests are in flight. Results are stored in the work-list order.
+        workers = self.concurrency_limiter.max_limit
+        with store, ThreadPoolExecutor(max_workers=workers) as executor:
+            for evaluation in executor.map(self.evaluate_task, self._iter_evaluation_tasks(image_files)):
+                self.store_evaluation(store, evaluation)
+        
+        return self.finish_run(store, image_files, extra_meta)
+    
+    
+    
+    def _find_image_files(self) -> List[Path]:
         print(f"Images directory: {self.images_dir}")
         print(f"Code directory: {self.code_dir}")
         print(f"Using model: {LLM_AS_JUDGE_MODEL_NAME}")
@@ -210,141 +490,203 @@ class LLMAsJudgeRunner:
         
         if not image_files:
             print(f"No images found in {self.images_dir}")
-            return {"error": "No images found", "results": []}
-
-        print(f"Found {len(image_files)} images for evaluation")
-
-        all_evaluations = []
+        else:
+            print(f"Found {len(image_files)} images for evaluation")
+        return image_files
+    
+    
+    
+    def evaluate_task(self, task: Tuple[Optional[str], Path, str]) -> Dict[str, Any]:
+        """
+        Evaluate one (prompt_id, image_path, code_file) task, or reuse its judgment when nothing it depends on changed.
+        """
+        prompt_id, image_path, code_file = task
+        inputs = self.judgment_inputs(str(image_path), code_file)
+        evaluation = self.reused_evaluation(code_file, inputs) or self.evaluate_single_code(str(image_path), code_file)
+        return self._with_task_meta(evaluation, prompt_id, inputs)
+    
+    
+    
+    def judgment_inputs(self, image_path: str, code_file_path: str) -> Optional[str]:
+        image_digest, code_digest = file_digest(image_path), file_digest(code_file_path)
+        if image_digest is None or code_digest is None:
+            return None
+        return digest(self.judge_inputs, image_digest, code_digest, self._model_label(code_file_path))
+    
+    
+    
+    def reused_evaluation(self, code_file_path: str, inputs: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        The stored judgment of this code when the graph has it with the same inputs; None when it has to be judged.
+        """
+        if self.build_graph is None or not self.build_graph.is_fresh(code_file_path, inputs):
+            return None
+        location = self.build_graph.value(code_file_path)
+        try:
+            evaluation = ResultsStore.from_path(location["rows_path"]).read_row(location["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            # The run it was stored in is gone
+            return None
         
-        for i, image_path in enumerate(image_files, 1):
-            
-            code_files = self.find_code_files_for_image(image_path.name)
-            
-            if not code_files:
-                print(f"No code files found for {image_path.name}")
-                continue
-            
-            print(f"{len(code_files)} files of code")
-            
-            for code_file in code_files:
-                evaluation = self.evaluate_single_code(str(image_path), code_file)
-                all_evaluations.append(evaluation)
-                
-                if "error" not in evaluation:
-                    score = evaluation.get("overall_score", 0)
-                    model = evaluation.get("meta", {}).get("model_name", "Unknown")
-                    print(f"{model}: {score}/10")
-                else:
-                    print(f"{evaluation['error']}")
+        # The run that judged it, through any number of runs that reused it
+        evaluation["meta"].setdefault("reused_from", evaluation["meta"].get("run_id"))
+        self._count("reused_evaluations")
+        print(f"Up to date: {os.path.basename(code_file_path)}, reusing its judgment from {evaluation['meta']['reused_from']}")
+        return evaluation
+    
+    
+    
+    @staticmethod
+    def _with_task_meta(evaluation: Dict[str, Any], prompt_id: Optional[str],
+                        inputs: Optional[str]) -> Dict[str, Any]:
+        meta = evaluation.setdefault("meta", {})
+        if prompt_id is not None:
+            meta["prompt_id"] = prompt_id
+        # Recorded in the build graph once the evaluation is stored
+        meta["build_inputs"] = inputs
+        return evaluation
+    
+    
+    
+    def store_evaluation(self, store: ResultsStore, evaluation: Dict[str, Any]):
+        offset = store.append(evaluation)
+        
+        meta = evaluation.get("meta", {})
+        if self.build_graph is not None and meta.get("build_inputs") and "error" not in evaluation:
+            self.build_graph.record(meta["code_file_path"], meta["build_inputs"],
+                                    {"rows_path": str(store.rows_path), "offset": offset})
         
+        if "error" not in evaluation:
+            score = evaluation.get("overall_score", 0)
+            model = evaluation.get("meta", {}).get("model_name", "Unknown")
+            print(f"{model}: {score}/10")
+        else:
+            print(f"{evaluation['error']}")
+    
+    
+    
+    def finish_run(self, store: ResultsStore, image_files: List[Path],
+                   extra_meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Summarise the stored evaluations and write the results index; extra_meta is added to its meta.
+        """
+        # The evaluations live in the store; the results file is a small index that references the run
         results = {
-            "evaluation_summary": self._generate_summary(all_evaluations),
-            "detailed_results": all_evaluations,
+            "evaluation_summary": self._generate_summary(store.iter_rows()),
             "meta": {
+                "run_id": store.run_id,
+                "results_store": str(store.rows_path),
                 "total_images": len(image_files),
-                "total_evaluations": len(all_evaluations),
+                "total_evaluations": store.row_count,
                 "model_used": LLM_AS_JUDGE_MODEL_NAME,
+                # The registry the code was judged against; the reports show its model names
+                "models": [spec.to_dict() for spec in self.registry],
                 "images_dir": self.images_dir,
-                "code_dir": self.code_dir
+                "code_dir": self.code_dir,
+                "judge_stats": self.get_judge_stats(),
+                "concurrency": self.get_concurrency_stats(),
+                **(extra_meta or {})
             }
         }
         
+        if self.build_graph is not None:
+            self.build_graph.save()
+        
         results_file = self.evaluation_dir / "evaluation_results.json"
+        results["meta"]["results_file"] = str(results_file)
         with open(results_file, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
         
+        judge_stats = results["meta"]["judge_stats"]
+        print(f"Judge mode: {judge_stats['mode']}, parse failures: {judge_stats['parse_failures']}, "
+              f"re-judge rate: {judge_stats['rejudge_rate']:.1%}, reused judgments: {judge_stats['reused_evaluations']}")
+        concurrency = results["meta"]["concurrency"]
+        print(f"Judge concurrency: limit {concurrency['limit']} (peak {concurrency['peak_limit']}), "
+              f"{concurrency['decreases']} back-offs")
         print(f"Results are saved to {results_file}")
         return results
     
     
     
-    def _generate_summary(self, evaluations: List[Dict[str, Any]]) -> Dict[str, Any]:
-        if not evaluations:
-            return {"error": "No evaluations to summarize"}
-        
-        successful_evals = [e for e in evaluations if "error" not in e]
-        
-        if not successful_evals:
-            return {"error": "No successful evaluations"}
-        
-        model1_evals = [e for e in successful_evals if e.get("meta", {}).get("model_name") == "Model 1"]
-        model2_evals = [e for e in successful_evals if e.get("meta", {}).get("model_name") == "Model 2"]
-        
-        def calc_avg_scores(evals):
-            if not evals:
-                return {}
-            
-            avg_overall = sum(e.get("overall_score", 0) for e in evals) / len(evals)
-            
-            criteria_scores = {}
-            for criterion in ["element_detection", "structural_accuracy", "layout_accuracy", "code_quality", "completeness"]:
-                scores = [e.get(criterion, {}).get("score", 0) for e in evals]
-                criteria_scores[criterion] = sum(scores) / len(scores) if scores else 0
-            
-            return {
-                "average_overall_score": round(avg_overall, 2),
-                "average_criteria_scores": {k: round(v, 2) for k, v in criteria_scores.items()},
-                "count": len(evals)
-            }
-        
-        return {
-            "total_evaluations": len(evaluations),
-            "successful_evaluations": len(successful_evals),
-            "failed_evaluations": len(evaluations) - len(successful_evals),
-            "model1_summary": calc_avg_scores(model1_evals),
-            "model2_summary": calc_avg_scores(model2_evals),
-            "overall_summary": calc_avg_scores(successful_evals)
-        }
+    def _iter_evaluation_tasks(self, image_files: List[Path]) -> Iterable[Tuple[Optional[str], Path, str]]:
+        """
+        (prompt_id, image_path, code_file) for every code file to judge.
+        """
+        for prompt_id, code_dir in self.find_prompt_code_dirs():
+            for image_path in image_files:
+                code_files = self.find_code_files_for_image(image_path.name, code_dir)
+                
+                if not code_files:
+                    print(f"No code files found for {image_path.name}")
+                    continue
+                
+                print(f"{len(code_files)} files of code")
+                for code_file in code_files:
+                    yield prompt_id, image_path, code_file
+    
     
     
+    def _generate_summary(self, evaluations: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        return summarize_evaluations(evaluations)
     
-    def compare_models(self) -> Dict[str, Any]:
+    
+    
+    def compare_models(self, results: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
 
-        results = self.evaluate_all_generated_code()
-        summary = results.get("evaluation_summary", {})
+        if results is None:
+            results = self.evaluate_all_generated_code()
+        scores = ScoreTensor.from_evaluations(iter_detailed_results(results))
         
-        model1_summary = summary.get("model1_summary", {})
-        model2_summary = summary.get("model2_summary", {})
+        model_stats = scores.describe(("model",))
+        evaluated_models = [m for m in range(len(scores.models)) if scores.present[m].any()]
         
-        if not model1_summary or not model2_summary:
+        if len(evaluated_models) < 2:
             return {"error": "Insufficient data for model comparison"}
         
+        mean_scores = np.round(model_stats["mean"], 2)
+        winners = scores.winners()
+        
+        overall = scores.criteria.index("overall_score")
+        ranked = sorted(evaluated_models, key=lambda m: mean_scores[m, overall], reverse=True)
+        
         comparison = {
-            "model1_avg_score": model1_summary.get("average_overall_score", 0),
-            "model2_avg_score": model2_summary.get("average_overall_score", 0),
-            "winner": None,
-            "score_difference": 0,
+            "model_avg_scores": {scores.models[m]: float(mean_scores[m, overall]) for m in evaluated_models},
+            "winner": winners["overall_score"],
+            "score_difference": round(float(mean_scores[ranked[0], overall] - mean_scores[ranked[1], overall]), 2),
             "detailed_comparison": {}
         }
         
-        score1 = comparison["model1_avg_score"]
-        score2 = comparison["model2_avg_score"]
-        
-        if score1 > score2:
-            comparison["winner"] = "Model 1"
-            comparison["score_difference"] = round(score1 - score2, 2)
-        elif score2 > score1:
-            comparison["winner"] = "Model 2"
-            comparison["score_difference"] = round(score2 - score1, 2)
-        else:
-            comparison["winner"] = "Tie"
-            comparison["score_difference"] = 0
-        
-        criteria = ["element_detection", "structural_accuracy", "layout_accuracy", "code_quality", "completeness"]
-        for criterion in criteria:
-            model1_score = model1_summary.get("average_criteria_scores", {}).get(criterion, 0)
-            model2_score = model2_summary.get("average_criteria_scores", {}).get(criterion, 0)
-            
+        for c, criterion in enumerate(scores.criteria):
+            if criterion == "overall_score":
+                continue
             comparison["detailed_comparison"][criterion] = {
-                "model1_score": model1_score,
-                "model2_score": model2_score,
-                "difference": round(model1_score - model2_score, 2),
-                "winner": "Model 1" if model1_score > model2_score else ("Model 2" if model2_score > model1_score else "Tie")
+                "scores": {scores.models[m]: float(mean_scores[m, c]) for m in evaluated_models},
+                "winner": winners[criterion]
             }
         
         return comparison
 
 
+def _with_judge_rates(stats: Dict[str, Any]) -> Dict[str, Any]:
+    evaluations = stats["evaluations"]
+    judge_requests = stats["judge_requests"]
+
+    stats["rejudge_rate"] = round(stats["rejudged_evaluations"] / evaluations, 3) if evaluations else 0
+    stats["parse_failure_rate"] = round(stats["parse_failures"] / judge_requests, 3) if judge_requests else 0
+    return stats
+
+
+def combine_judge_stats(stats_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Sum the judge counters of several runs (e.g. shards) and recompute the rates.
+    """
+    counters = ["evaluations", "judge_requests", "parse_failures", "repair_requests",
+                "rejudged_evaluations", "unparsed_evaluations", "reused_evaluations"]
+    combined = {counter: sum(stats.get(counter, 0) for stats in stats_list) for counter in counters}
+    combined["mode"] = ", ".join(sorted({stats.get("mode") for stats in stats_list if stats.get("mode")}))
+    return _with_judge_rates(combined)
+
+
 def judge_model_performance():
     try:
         judge = LLMAsJudgeRunner()
@@ -356,16 +698,12 @@ def judge_model_performance():
         if "error" not in summary:
             print(f"Total: {summary.get('successful_evaluations', 0)}")
             
-            model1 = summary.get("model1_summary", {})
-            model2 = summary.get("model2_summary", {})
-            
-            if model1:
-                print(f"Model 1 average score: {model1.get('average_overall_score', 0)}/10")
-            if model2:
-                print(f"Model 2 average score: {model2.get('average_overall_score', 0)}/10")
+            for model_name, model_summary in summary.get("model_summaries", {}).items():
+                if model_summary:
+                    print(f"{model_name} average score: {model_summary.get('average_overall_score', 0)}/10")
 
         print("\nStarting model comparison...")
-        comparison = judge.compare_models()
+        comparison = judge.compare_models(results)
         
         if "error" not in comparison:
             print(f"Winner: {comparison.get('winner', 'Unknown')}")
@@ -1,73 +1,204 @@
 import os
 import sys
 import base64
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.constants import (
-    MODEL_NAME_1, MODEL_NAME_2, 
-    MAX_TOKENS_1, MAX_TOKENS_2,
-    TEMPERATURE_1, TEMPERATURE_2,
-    IMAGES_DIR, GENERATED_CODE_DIR, OLLAMA_BASE_URL,
-    OLLAMA_REQUEST_TIMEOUT, IMAGE_EXTENSIONS
+    IMAGES_DIR, GENERATED_CODE_DIR,
+    OLLAMA_REQUEST_TIMEOUT, OLLAMA_REQUEST_DELAY, IMAGE_EXTENSIONS,
+    OLLAMA_MAX_RETRIES, OLLAMA_HEDGE_REQUESTS
 )
+from config.model_registry import ModelRegistry, ModelSpec, get_model_registry
 from prompts.prompt_constants import PROMPT_DICT
 from utils.image_utils import encode_image_to_base64
+from model_runner.ollama_pool import OllamaEndpointPool, DeadlineExceeded
+from model_runner.generation_deadlines import DeadlineEstimator
+from model_runner.generation_performance import GenerationPerformance
+from utils.concurrency_limiter import AdaptiveConcurrencyLimiter, SUCCESS, TIMEOUT, RATE_LIMITED, ERROR
 
 import requests
 
 
 class OllamaModelRunner:
+    # Replaced by the asyncio versions in AsyncOllamaModelRunner
+    endpoint_pool_class = OllamaEndpointPool
+    concurrency_limiter_class = AdaptiveConcurrencyLimiter
        
-    def __init__(self):
+    def __init__(self, base_urls: Optional[List[str]] = None, registry: Optional[ModelRegistry] = None):
         
         self.input_dir = IMAGES_DIR
+        self.registry = registry or get_model_registry()
         self.output_dir = GENERATED_CODE_DIR
-        self.ollama_base_url = OLLAMA_BASE_URL
+        # Requests are spread over every configured Ollama server (OLLAMA_BASE_URLS)
+        self.endpoint_pool = self.endpoint_pool_class(base_urls)
+        self.ollama_base_url = ", ".join(endpoint.base_url for endpoint in self.endpoint_pool.endpoints)
+        # Starts at one request per server and probes upwards to the pool's per-server limits
+        self.concurrency_limiter = self.concurrency_limiter_class(
+            "ollama", initial_limit=len(self.endpoint_pool.endpoints), max_limit=self.endpoint_pool.capacity
+        )
+        # Models with their own servers or concurrency cap get their own pool and limiter, by suffix
+        self.model_resources = {spec.suffix: self._own_resources(spec) for spec in self.registry if spec.has_own_resources}
+        self.deadline_estimator = DeadlineEstimator()
+        self.performance = GenerationPerformance()
+        self.deadline_retries = 0
+        self._stats_lock = threading.Lock()
         
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
     
     
     
-    def call_ollama_api(self, model_name: str, system_prompt: str, user_prompt: str, 
-                       image_base64: str, max_tokens: int = 3000, temperature: float = 0.7) -> str:
-        url = f"{self.ollama_base_url}/api/generate"
-        
-        payload = {
+    def _own_resources(self, spec: ModelSpec) -> Tuple[OllamaEndpointPool, AdaptiveConcurrencyLimiter]:
+        endpoint_pool = self.endpoint_pool_class(spec.base_urls) if spec.base_urls else self.endpoint_pool
+        max_limit = min(endpoint_pool.capacity, spec.concurrency or endpoint_pool.capacity)
+        limiter = self.concurrency_limiter_class(
+            f"ollama {spec.label}", initial_limit=min(len(endpoint_pool.endpoints), max_limit), max_limit=max_limit
+        )
+        return endpoint_pool, limiter
+    
+    
+    
+    def resources_for(self, model_suffix: Optional[str] = None,
+                      model_name: Optional[str] = None) -> Tuple[OllamaEndpointPool, AdaptiveConcurrencyLimiter]:
+        """
+        (endpoint pool, concurrency limiter) serving a model; the shared ones unless the registry gives it its own.
+        """
+        spec = self.registry.by_suffix(model_suffix) if model_suffix else self.registry.by_name(model_name)
+        if spec is not None and spec.suffix in self.model_resources:
+            return self.model_resources[spec.suffix]
+        return self.endpoint_pool, self.concurrency_limiter
+    
+    
+    
+    @staticmethod
+    def build_payload(model_name: str, system_prompt: str, user_prompt: str,
+                      image_base64: str, max_tokens: int, temperature: float) -> dict:
+        return {
             "model": model_name,
             "prompt": f"{system_prompt}\n\n{user_prompt}",
             "images": [image_base64],
-            "stream": False,
+            "stream": True,
             "options": {
                 "num_predict": max_tokens,
                 "temperature": temperature
             }
         }
+    
+    
+    
+    def call_ollama_api(self, model_name: str, system_prompt: str, user_prompt: str, 
+                       image_base64: str, max_tokens: int = 3000, temperature: float = 0.7,
+                       model_suffix: Optional[str] = None) -> str:
+        payload = self.build_payload(model_name, system_prompt, user_prompt, image_base64, max_tokens, temperature)
+        endpoint_pool, concurrency_limiter = self.resources_for(model_suffix, model_name)
         
+        started = concurrency_limiter.acquire()
+        span_started = time.time()
+        outcome = ERROR
+        first_token_latency = None
         try:
-            response = requests.post(url, json=payload, timeout=OLLAMA_REQUEST_TIMEOUT)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._generate_with_deadline(payload, max_tokens, endpoint_pool)
+            outcome = SUCCESS
+            first_token_latency = self._first_token_latency(result, time.perf_counter() - started)
             return result.get("response", "")
             
         except requests.exceptions.RequestException as e:
+            outcome = self._limiter_outcome(e)
             print(f"Ollama API Error: {e}")
             return f"API error: {str(e)}"
+        
+        finally:
+            concurrency_limiter.release(started, outcome, first_token_latency)
+            self.performance.record_span(model_name, span_started, time.time(), outcome)
+    
+    
+    
+    def _generate_with_deadline(self, payload: dict, max_tokens: int,
+                                endpoint_pool: Optional[OllamaEndpointPool] = None) -> dict:
+        """
+        Generate with a deadline from the model's observed speed, retrying requests that pass it.
+        With OLLAMA_HEDGE_REQUESTS, requests slower than the model's usual tail are also sent a second time.
+        """
+        model_name = payload["model"]
+        endpoint_pool = endpoint_pool or self.endpoint_pool
+        
+        for attempt in range(OLLAMA_MAX_RETRIES + 1):
+            timeout, hedge_after = self._request_timing(model_name, max_tokens, endpoint_pool)
+            started = time.time()
+            try:
+                result = endpoint_pool.generate(payload, timeout=timeout, hedge_after=hedge_after)
+            except DeadlineExceeded:
+                if attempt == OLLAMA_MAX_RETRIES:
+                    raise
+                self._count_deadline_retry(model_name, timeout, attempt)
+                continue
+            
+            latency = time.time() - started
+            self.deadline_estimator.observe(model_name, result, latency)
+            self.performance.observe(model_name, result, latency)
+            return result
+    
+    
+    
+    def _request_timing(self, model_name: str, max_tokens: int,
+                        endpoint_pool: OllamaEndpointPool) -> Tuple[float, Optional[float]]:
+        # A model that is not loaded anywhere may need minutes to load, so it gets the full timeout
+        if endpoint_pool.is_resident(model_name):
+            timeout = self.deadline_estimator.deadline(model_name, max_tokens)
+        else:
+            timeout = OLLAMA_REQUEST_TIMEOUT
+        hedge_after = self.deadline_estimator.hedge_delay(model_name) if OLLAMA_HEDGE_REQUESTS else None
+        return timeout, hedge_after
+    
+    
+    
+    def _count_deadline_retry(self, model_name: str, timeout: float, attempt: int):
+        with self._stats_lock:
+            self.deadline_retries += 1
+        print(f"{model_name} request passed its {timeout:.1f}s deadline, "
+              f"retrying ({attempt + 1}/{OLLAMA_MAX_RETRIES})...")
+    
+    
+    
+    @staticmethod
+    def _first_token_latency(result: dict, latency: float) -> float:
+        """
+        Seconds until the first generated token (queueing and prompt processing), without model loading.
+        The concurrency limiter backs off on this rather than the full latency, which grows with the answer's length.
+        """
+        load_seconds = (result.get("load_duration") or 0) / 1e9
+        eval_seconds = (result.get("eval_duration") or 0) / 1e9
+        return max(latency - load_seconds - eval_seconds, 0.0)
+    
+    
+    
+    @staticmethod
+    def _limiter_outcome(error: Exception) -> str:
+        # Timeouts and "server busy" answers mean too many requests in flight; other errors are not about load
+        if isinstance(error, requests.exceptions.Timeout):
+            return TIMEOUT
+        status_code = getattr(error.response, "status_code", None)
+        if status_code in (429, 503):
+            return RATE_LIMITED
+        return ERROR
     
     
     
     def process_single_image(self, image_path: str, model_name: str, 
                              system_prompt: str, user_prompt: str,
-                           max_tokens: int, temperature: float) -> Tuple[str, str]:
+                           max_tokens: int, temperature: float, model_suffix: Optional[str] = None,
+                           image_base64: Optional[str] = None) -> Tuple[str, str]:
         try:
             print(f"Processing {image_path} with model {model_name}...")
             
             # Кодируем изображение
-            image_base64 = encode_image_to_base64(image_path)
+            image_base64 = image_base64 or encode_image_to_base64(image_path)
             formatted_user_prompt = user_prompt.format(image_path=os.path.basename(image_path))
             
             generated_code = self.call_ollama_api(
@@ -76,41 +207,11 @@ class OllamaModelRunner:
                 user_prompt=formatted_user_prompt,
                 image_base64=image_base64,
                 max_tokens=max_tokens,
-                temperature=temperature
+                temperature=temperature,
+                model_suffix=model_suffix
             )
             
-            if generated_code.startswith("API error:"):
-                raise Exception(generated_code)
-                
-            # Check if the generated code looks valid (contains JSX/React code)
-            if not any(keyword in generated_code for keyword in ["return", "<", ">"]):
-                raise Exception(f"Generated code doesn't look valid: {generated_code}")
-            
-            # Generate output filename
-            image_name = os.path.splitext(os.path.basename(image_path))[0]
-            output_filename = f"{image_name}_model2.jsx" if "2" in model_name else f"{image_name}_model1.jsx"
-            output_path = os.path.join(self.output_dir, output_filename)
-            
-            # Clean up the code - add imports and component wrapper if needed
-            if "import React" not in generated_code:
-                final_code = "import React from 'react';\n\n"
-                if "export default" not in generated_code:
-                    component_name = "".join(word.capitalize() for word in image_name.split("_"))
-                    final_code += f"const {component_name} = () => {{"
-                    final_code += generated_code
-                    final_code += f"}}\n\nexport default {component_name};"
-                else:
-                    final_code += generated_code
-            else:
-                final_code = generated_code
-            
-            # Save generated code to file
-            os.makedirs(self.output_dir, exist_ok=True)
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(final_code)
-            
-            print(f"\nSuccessfully saved to: {output_path}")
-            return final_code, output_path
+            return self.save_generated_code(generated_code, image_path, model_name, model_suffix)
             
         except Exception as e:
             error_msg = f"Error processing {image_path}: {str(e)}"
@@ -119,87 +220,289 @@ class OllamaModelRunner:
     
     
     
-    def run_model_on_images(self, system_prompt, user_prompt, model_choice: int = 1) -> List[dict]:
- 
-        if model_choice == 1:
-            model_name = MODEL_NAME_1
-            max_tokens = MAX_TOKENS_1
-            temperature = TEMPERATURE_1
-            model_suffix = "model1"
-        elif model_choice == 2:
-            model_name = MODEL_NAME_2
-            max_tokens = MAX_TOKENS_2
-            temperature = TEMPERATURE_2
-            model_suffix = "model2"
+    def save_generated_code(self, generated_code: str, image_path: str, model_name: str,
+                            model_suffix: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Check the model's answer, wrap it into a component and save it; raises when the answer is unusable.
+        """
+        if generated_code.startswith("API error:"):
+            raise Exception(generated_code)
+            
+        # Check if the generated code looks valid (contains JSX/React code)
+        if not any(keyword in generated_code for keyword in ["return", "<", ">"]):
+            raise Exception(f"Generated code doesn't look valid: {generated_code}")
+        
+        # Generate output filename
+        image_name = os.path.splitext(os.path.basename(image_path))[0]
+        if model_suffix is None:
+            spec = self.registry.by_name(model_name)
+            model_suffix = spec.suffix if spec else model_name.replace(":", "_").replace("/", "_")
+        output_filename = f"{image_name}_{model_suffix}.jsx"
+        output_path = os.path.join(self.output_dir, output_filename)
+        
+        final_code = self.wrap_generated_code(generated_code, image_name)
+        
+        # Save generated code to file
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(final_code)
+        
+        print(f"\nSuccessfully saved to: {output_path}")
+        return final_code, output_path
+    
+    
+    
+    @staticmethod
+    def wrap_generated_code(generated_code: str, image_name: str) -> str:
+        # Clean up the code - add imports and component wrapper if needed
+        if "import React" in generated_code:
+            return generated_code
+
+        final_code = "import React from 'react';\n\n"
+        if "export default" not in generated_code:
+            component_name = "".join(word.capitalize() for word in image_name.split("_"))
+            final_code += f"const {component_name} = () => {{"
+            final_code += generated_code
+            final_code += f"}}\n\nexport default {component_name};"
         else:
-            raise ValueError("model_choice should be 1 or 2")
+            final_code += generated_code
+        return final_code
+    
+    
+    
+    def model_settings(self, model_choice: int) -> Tuple[str, int, float, str]:
+        """
+        (model_name, max_tokens, temperature, model_suffix) of the model_choice-th model of the registry.
+        """
+        spec = self.registry.get(model_choice)
+        return spec.name, spec.max_tokens, spec.temperature, spec.suffix
+    
+    
+    
+    def prepare_run(self, model_choice: int, image_files: Optional[List[str]] = None) -> Tuple[Tuple, List[Path]]:
+        """
+        Model settings and the sorted image list for one run_model_on_images call.
+        """
+        settings, image_files = self.prepare_models([model_choice], image_files)
+        return settings[model_choice], image_files
+    
+    
+    
+    def prepare_models(self, model_choices: List[int],
+                       image_files: Optional[List[str]] = None) -> Tuple[Dict[int, Tuple], List[Path]]:
+        """
+        Settings of every model and the sorted image list for one run over several models.
+        """
+        settings = {model_choice: self.model_settings(model_choice) for model_choice in model_choices}
 
-        print(f"Running model {model_name} with parameters:")
-        print(f"  Max tokens: {max_tokens}")
-        print(f"  Temperature: {temperature}")
+        for model_name, max_tokens, temperature, _ in settings.values():
+            print(f"Running model {model_name} with parameters:")
+            print(f"  Max tokens: {max_tokens}")
+            print(f"  Temperature: {temperature}")
         print(f"  Input dir: {self.input_dir}")
         print(f"  Output dir: {self.output_dir}")
         
-        image_files = []
-
-        for ext in IMAGE_EXTENSIONS:
-            image_files.extend(Path(self.input_dir).glob(f"*{ext}"))
-        
-        image_files = list(set(image_files))
-        image_files.sort() 
+        if image_files is None:
+            image_files = self.find_image_files()
+        else:
+            # An explicit work list, e.g. one shard of a sweep
+            image_files = sorted(Path(image_file) for image_file in image_files)
         
         if not image_files:
             print(f"No images in {self.input_dir}")
+        return settings, image_files
+    
+    
+    
+    def run_model_on_images(self, system_prompt, user_prompt, model_choice: int = 1,
+                            image_files: Optional[List[str]] = None) -> List[dict]:
+ 
+        (model_name, max_tokens, temperature, model_suffix), image_files = self.prepare_run(model_choice, image_files)
+        if not image_files:
             return []
     
-        results = []
+        def generate(image_path):
+            return self._generate_for_image(image_path, model_name, model_suffix, system_prompt, user_prompt,
+                                            max_tokens, temperature)
         
-        for i, image_path in enumerate(image_files, 1):
-
-            generated_code, error_message = self.process_single_image(
-                str(image_path), model_name, system_prompt, user_prompt, max_tokens, temperature
-            )
-            
-            image_stem = image_path.stem 
-            output_filename = f"{image_stem}_{model_suffix}.jsx"
-            output_path = Path(self.output_dir) / output_filename
-            
-            try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    if error_message:
-                        f.write(f"// Code generation error:\n// {error_message}\n")
-                    else:
-                        f.write(generated_code)
-                
-                
-            except Exception as e:
-                print(f"Error saving to {output_path}: {e}")
-                error_message = f"Save error: {str(e)}"
-
-            result_info = {
-                "image_path": str(image_path),
-                "image_name": image_path.name,
-                "model_name": model_name,
-                "output_file": str(output_path),
-                "generated_code": generated_code,
-                "error_message": error_message,
-                "success": not bool(error_message)
-            }
-            results.append(result_info)
-            
-            time.sleep(1)
+        # Enough workers for the highest limit; the adaptive limiter decides how many requests are in flight
+        workers = min(self.max_in_flight([model_choice]), len(image_files))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(generate, image_files))
+        
+        return [generate(image_path) for image_path in image_files]
+    
+    
+    
+    def run_models_on_images(self, system_prompt, user_prompt, model_choices: Optional[List[int]] = None,
+                             image_files: Optional[List[str]] = None) -> Dict[int, List[dict]]:
+        """
+        Run several models (all registered ones by default) on the same images at once. Every image is encoded
+        once and its payload shared by the requests of all models. Results per model choice, in image order.
+        """
+        model_choices = list(model_choices or self.registry.choices)
+        settings, image_files = self.prepare_models(model_choices, image_files)
+        results = {model_choice: [] for model_choice in model_choices}
+        if not image_files:
+            return results
+        
+        workers = min(self.max_in_flight(model_choices), len(image_files) * len(model_choices))
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for image_path in image_files:
+                image_base64 = self.encode_image(image_path)
+                for model_choice in model_choices:
+                    model_name, max_tokens, temperature, model_suffix = settings[model_choice]
+                    future = executor.submit(self._generate_for_image, image_path, model_name, model_suffix,
+                                             system_prompt, user_prompt, max_tokens, temperature, image_base64)
+                    pending.append((model_choice, future))
+                # Only the payloads of images still being generated are kept in memory
+                while len(pending) > workers:
+                    model_choice, future = pending.popleft()
+                    results[model_choice].append(future.result())
+            for model_choice, future in pending:
+                results[model_choice].append(future.result())
         
         return results
+    
+    
+    
+    def max_in_flight(self, model_choices: List[int]) -> int:
+        # Upper bound on requests in flight for these models: the sum of the max limits of their limiters
+        limiters = {}
+        for model_choice in model_choices:
+            _, concurrency_limiter = self.resources_for(self.registry.get(model_choice).suffix)
+            limiters[id(concurrency_limiter)] = concurrency_limiter
+        return sum(concurrency_limiter.max_limit for concurrency_limiter in limiters.values())
+    
+    
+    
+    @staticmethod
+    def encode_image(image_path: Path) -> Optional[str]:
+        # An unreadable image is left to process_single_image, which reports the error for every model
+        try:
+            return encode_image_to_base64(str(image_path))
+        except Exception:
+            return None
+    
+    
+    
+    def _generate_for_image(self, image_path: Path, model_name: str, model_suffix: str, system_prompt: str,
+                            user_prompt: str, max_tokens: int, temperature: float,
+                            image_base64: Optional[str] = None) -> dict:
+        generated_code, output_or_error = self.process_single_image(
+            str(image_path), model_name, system_prompt, user_prompt, max_tokens, temperature,
+            model_suffix, image_base64
+        )
+        result_info = self.record_result(image_path, model_name, model_suffix, generated_code, output_or_error)
+        
+        time.sleep(OLLAMA_REQUEST_DELAY)
+        
+        return result_info
+    
+    
+    
+    def record_result(self, image_path: Path, model_name: str, model_suffix: str,
+                      generated_code: str, output_or_error: str) -> dict:
+        """
+        Write an error stub for failed generations and describe the outcome for one image.
+        """
+        # process_single_image returns (code, output path) on success and ("", error message) on failure
+        error_message = "" if generated_code else output_or_error
+        
+        image_stem = image_path.stem 
+        output_filename = f"{image_stem}_{model_suffix}.jsx"
+        output_path = Path(self.output_dir) / output_filename
+        
+        try:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                if error_message:
+                    f.write(f"// Code generation error:\n// {error_message}\n")
+                else:
+                    f.write(generated_code)
+                
+        except Exception as e:
+            print(f"Error saving to {output_path}: {e}")
+            error_message = f"Save error: {str(e)}"
 
+        result_info = {
+            "image_path": str(image_path),
+            "image_name": image_path.name,
+            "model_name": model_name,
+            "output_file": str(output_path),
+            "generated_code": generated_code,
+            "error_message": error_message,
+            "success": not bool(error_message)
+        }
+        
+        return result_info
 
-    def run_both_models_on_images(self, system_prompt, user_prompt) -> dict:
 
+    def find_image_files(self) -> List[Path]:
+        image_files = []
 
-        results = {
-            "model1": self.run_model_on_images(system_prompt, user_prompt, model_choice=1),
-            "model2": self.run_model_on_images(system_prompt, user_prompt, model_choice=2)
-        }
+        for ext in IMAGE_EXTENSIONS:
+            image_files.extend(Path(self.input_dir).glob(f"*{ext}"))
         
-        return results
+        image_files = list(set(image_files))
+        image_files.sort() 
+        return image_files
+
+
+    def endpoint_pools(self) -> List[OllamaEndpointPool]:
+        # The shared pool first, then the pools of models with their own servers
+        pools = {id(self.endpoint_pool): self.endpoint_pool}
+        for endpoint_pool, _ in self.model_resources.values():
+            pools.setdefault(id(endpoint_pool), endpoint_pool)
+        return list(pools.values())
+
+
+    def get_endpoint_stats(self) -> dict:
+        stats = {}
+        for endpoint_pool in self.endpoint_pools():
+            stats.update(endpoint_pool.stats())
+        return stats
+
+
+    def get_concurrency_stats(self) -> dict:
+        stats = self.concurrency_limiter.stats()
+        if self.model_resources:
+            stats["models"] = {self.registry.by_suffix(suffix).label: concurrency_limiter.stats()
+                               for suffix, (_, concurrency_limiter) in self.model_resources.items()}
+        return stats
+
+
+    def get_performance_stats(self) -> dict:
+        return self.performance.stats()
+
+
+    def unload_models(self):
+        # Evict every registered model from its servers, so that the next run of a model starts cold
+        for spec in self.registry:
+            endpoint_pool, _ = self.resources_for(spec.suffix)
+            endpoint_pool.unload(spec.name)
+
+
+    def get_deadline_stats(self) -> dict:
+        with self._stats_lock:
+            deadline_retries = self.deadline_retries
+        hedge_stats = {}
+        for endpoint_pool in self.endpoint_pools():
+            for key, value in endpoint_pool.hedge_stats().items():
+                hedge_stats[key] = hedge_stats.get(key, 0) + value
+        return {
+            "models": self.deadline_estimator.stats(),
+            "deadline_retries": deadline_retries,
+            **hedge_stats
+        }
+
+
+    def run_all_models_on_images(self, system_prompt, user_prompt) -> dict:
+        """
+        Every registered model on every image, keyed by model suffix.
+        """
+        results = self.run_models_on_images(system_prompt, user_prompt)
+        return {self.registry.get(model_choice).suffix: model_results for model_choice, model_results in results.items()}
 
 
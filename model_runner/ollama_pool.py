@@ -0,0 +1,452 @@
+import functools
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Any, Set
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import (
+    OLLAMA_BASE_URLS,
+    OLLAMA_ENDPOINT_CONCURRENCY,
+    OLLAMA_HEALTH_CHECK_INTERVAL,
+    OLLAMA_HEALTH_CHECK_TIMEOUT,
+    OLLAMA_REQUEST_TIMEOUT
+)
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class NoHealthyEndpointError(requests.exceptions.ConnectionError):
+    pass
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+
+class GenerationCancelled(requests.exceptions.RequestException):
+    pass
+
+
+class Cancellation:
+    """
+    Lets another thread stop one in-flight generation. The request runs on a connection of its own, which is kept
+    here: shutting its socket down wakes a read that is blocked waiting for the response headers or the next token,
+    and the closed connection makes Ollama stop generating.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.connection = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        sock = getattr(self.connection, "sock", None)
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _CancellableConnectionPool(HTTPConnectionPool):
+    """
+    Hands every connection it opens to the Cancellation of its request.
+    """
+
+    def __init__(self, *args, cancellation: Cancellation, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cancellation = cancellation
+
+    def _new_conn(self):
+        connection = super()._new_conn()
+        self.cancellation.connection = connection
+        return connection
+
+
+class _CancellableHTTPSConnectionPool(_CancellableConnectionPool, HTTPSConnectionPool):
+    pass
+
+
+class _CancellableAdapter(HTTPAdapter):
+    """
+    Adapter for a single cancellable request, opening its connections through _CancellableConnectionPool.
+    """
+
+    def __init__(self, cancellation: Cancellation):
+        self.cancellation = cancellation
+        super().__init__(pool_connections=1, pool_maxsize=1)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": functools.partial(_CancellableConnectionPool, cancellation=self.cancellation),
+            "https": functools.partial(_CancellableHTTPSConnectionPool, cancellation=self.cancellation)
+        }
+
+
+class OllamaEndpoint:
+
+    def __init__(self, base_url: str, max_in_flight: int = OLLAMA_ENDPOINT_CONCURRENCY):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.healthy = True
+        self.resident_models: Set[str] = set()
+        self.last_health_check = 0.0
+        self.in_flight = 0
+
+        self.requests = 0
+        self.failures = 0
+        self.connection_errors = 0
+        self.deadlines_exceeded = 0
+        self.cancelled = 0
+        self.total_latency = 0.0
+        self.generated_tokens = 0
+        self.first_request_at: Optional[float] = None
+        self.last_response_at: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        completed = self.requests - self.failures - self.cancelled
+        active_time = (self.last_response_at - self.first_request_at) if self.first_request_at and self.last_response_at else 0
+        return {
+            "healthy": self.healthy,
+            "resident_models": sorted(self.resident_models),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "connection_errors": self.connection_errors,
+            "deadlines_exceeded": self.deadlines_exceeded,
+            "cancelled": self.cancelled,
+            "average_latency": round(self.total_latency / completed, 3) if completed else None,
+            "requests_per_second": round(completed / active_time, 3) if active_time else None,
+            "tokens_per_second": round(self.generated_tokens / active_time, 1) if active_time else None
+        }
+
+
+class OllamaEndpointPool:
+    """
+    Client-side load balancer over several Ollama servers.
+    Each request goes to the healthy endpoint that already has the model loaded and the fewest requests in flight;
+    servers that refuse connections are marked unhealthy and the request fails over to the next one.
+    Health and loaded models are refreshed from /api/ps at most every health_check_interval seconds.
+    """
+
+    def __init__(self, base_urls: Optional[List[str]] = None, max_in_flight: int = OLLAMA_ENDPOINT_CONCURRENCY,
+                 health_check_interval: float = OLLAMA_HEALTH_CHECK_INTERVAL):
+        base_urls = base_urls or OLLAMA_BASE_URLS
+        self.endpoints = [OllamaEndpoint(url, max_in_flight) for url in dict.fromkeys(base_urls)]
+        self.health_check_interval = health_check_interval
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+
+    @property
+    def capacity(self) -> int:
+        return sum(endpoint.max_in_flight for endpoint in self.endpoints)
+
+    def check_health(self, endpoint: OllamaEndpoint) -> bool:
+        try:
+            response = self.session.get(f"{endpoint.base_url}/api/ps", timeout=OLLAMA_HEALTH_CHECK_TIMEOUT)
+            if response.status_code == 404:
+                # Servers without /api/ps: only liveness is known
+                self.session.get(f"{endpoint.base_url}/api/version", timeout=OLLAMA_HEALTH_CHECK_TIMEOUT).raise_for_status()
+                resident = set(endpoint.resident_models)
+            else:
+                response.raise_for_status()
+                resident = self._loaded_models(response.json())
+            healthy = True
+        except (requests.exceptions.RequestException, ValueError):
+            resident = set()
+            healthy = False
+
+        self._set_health(endpoint, healthy, resident)
+        return healthy
+
+    @staticmethod
+    def _loaded_models(ps_response: Dict[str, Any]) -> Set[str]:
+        return {model.get("name") or model.get("model") for model in ps_response.get("models", [])} - {None}
+
+    def _set_health(self, endpoint: OllamaEndpoint, healthy: bool, resident: Set[str]):
+        with self._lock:
+            endpoint.healthy = healthy
+            endpoint.resident_models = resident
+            endpoint.last_health_check = time.time()
+
+    def refresh_health(self, force: bool = False):
+        now = time.time()
+        for endpoint in self.endpoints:
+            if force or now - endpoint.last_health_check >= self.health_check_interval:
+                self.check_health(endpoint)
+
+    def _pick(self, model_name: str, exclude: Set[str]) -> Optional[OllamaEndpoint]:
+        # Among endpoints with a free slot: resident model first, then the lowest load relative to capacity
+        candidates = [e for e in self.endpoints
+                      if e.healthy and e.base_url not in exclude and e.in_flight < e.max_in_flight]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: (model_name not in e.resident_models,
+                                              e.in_flight / e.max_in_flight, e.requests))
+
+    def _has_healthy(self, exclude: Set[str]) -> bool:
+        return any(e.healthy and e.base_url not in exclude for e in self.endpoints)
+
+    def unload(self, model_name: str):
+        """
+        Ask every endpoint to evict the model (keep_alive 0), so that its next request loads it from scratch.
+        """
+        for endpoint in self.endpoints:
+            try:
+                self.session.post(f"{endpoint.base_url}/api/generate", json={"model": model_name, "keep_alive": 0},
+                                  timeout=OLLAMA_REQUEST_TIMEOUT).raise_for_status()
+            except requests.exceptions.RequestException as e:
+                print(f"Could not unload {model_name} on {endpoint.base_url}: {e}")
+        self.refresh_health(force=True)
+
+    def is_resident(self, model_name: str) -> bool:
+        with self._lock:
+            return any(e.healthy and model_name in e.resident_models for e in self.endpoints)
+
+    def acquire(self, model_name: str, exclude: Optional[Set[str]] = None,
+                cancellation: Optional[Cancellation] = None) -> OllamaEndpoint:
+        """
+        Reserve an endpoint for one request, waiting while every healthy endpoint is at its in-flight limit.
+        """
+        exclude = exclude or set()
+        self.refresh_health()
+
+        with self._released:
+            while self._has_healthy(exclude):
+                if cancellation is not None and cancellation.cancelled:
+                    raise GenerationCancelled("Cancelled while waiting for an Ollama endpoint")
+                endpoint = self._pick(model_name, exclude)
+                if endpoint is not None:
+                    self._reserve(endpoint)
+                    return endpoint
+                # Every healthy endpoint is busy
+                self._released.wait(timeout=1)
+
+        # Nothing healthy is left: look again before giving up
+        self.refresh_health(force=True)
+        with self._lock:
+            available = self._has_healthy(exclude)
+        if not available:
+            raise NoHealthyEndpointError(f"No healthy Ollama endpoint among {[e.base_url for e in self.endpoints]}")
+        return self.acquire(model_name, exclude, cancellation)
+
+    @staticmethod
+    def _reserve(endpoint: OllamaEndpoint):
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        endpoint.first_request_at = endpoint.first_request_at or time.time()
+
+    def release(self, endpoint: OllamaEndpoint, model_name: str, latency: float, success: bool,
+                generated_tokens: int = 0, reachable: bool = True, cancelled: bool = False):
+        with self._released:
+            endpoint.in_flight -= 1
+            endpoint.last_response_at = time.time()
+            if success:
+                endpoint.total_latency += latency
+                endpoint.generated_tokens += generated_tokens
+                endpoint.resident_models.add(model_name)
+            elif cancelled:
+                # Not the endpoint's fault: another attempt answered first
+                endpoint.cancelled += 1
+            else:
+                endpoint.failures += 1
+            if not reachable:
+                endpoint.connection_errors += 1
+                endpoint.healthy = False
+                endpoint.last_health_check = time.time()
+            self._released.notify_all()
+
+    def generate(self, payload: Dict[str, Any], timeout: float = OLLAMA_REQUEST_TIMEOUT,
+                 hedge_after: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Stream one /api/generate response, cancelling it once timeout seconds have passed.
+        With hedge_after, a request still running after that many seconds is sent a second time;
+        the first answer is returned and the other request is cancelled.
+        """
+        if not hedge_after or hedge_after >= timeout:
+            return self._generate(payload, time.monotonic() + timeout)
+
+        deadline = time.monotonic() + timeout
+        answers = queue.Queue()
+        attempts: Dict[str, Cancellation] = {}
+
+        def start(name):
+            cancellation = attempts[name] = Cancellation()
+
+            def run():
+                try:
+                    answers.put((name, self._generate(payload, deadline, cancellation), None))
+                except Exception as e:
+                    answers.put((name, None, e))
+
+            threading.Thread(target=run, name=f"ollama-{name}", daemon=True).start()
+
+        start("primary")
+        try:
+            name, result, error = answers.get(timeout=hedge_after)
+        except queue.Empty:
+            with self._lock:
+                self.hedged_requests += 1
+            start("hedge")
+            name, result, error = answers.get()
+            if error is not None:
+                # One attempt failed; the other may still answer in time
+                name, result, error = answers.get()
+
+        for cancellation in attempts.values():
+            cancellation.cancel()
+        if error is not None:
+            raise error
+        if name == "hedge":
+            with self._lock:
+                self.hedge_wins += 1
+        return result
+
+    def _generate(self, payload: Dict[str, Any], deadline: float,
+                  cancellation: Optional[Cancellation] = None) -> Dict[str, Any]:
+        """
+        One request with failover: on a connection error the request is retried on another endpoint.
+        Deadline, cancellation and HTTP errors are returned to the caller as they are.
+        """
+        model_name = payload.get("model", "")
+        tried: Set[str] = set()
+
+        while True:
+            endpoint = self.acquire(model_name, exclude=tried, cancellation=cancellation)
+            started = time.time()
+            try:
+                result = self._stream_generate(endpoint, payload, deadline, cancellation)
+            except GenerationCancelled:
+                self.release(endpoint, model_name, time.time() - started, success=False, cancelled=True)
+                raise
+            except DeadlineExceeded:
+                with self._lock:
+                    endpoint.deadlines_exceeded += 1
+                self.release(endpoint, model_name, time.time() - started, success=False)
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.release(endpoint, model_name, time.time() - started, success=False, reachable=False)
+                tried.add(endpoint.base_url)
+                if len(tried) >= len(self.endpoints):
+                    raise
+                print(f"Ollama endpoint {endpoint.base_url} failed ({e.__class__.__name__}), failing over...")
+                continue
+            except Exception:
+                self.release(endpoint, model_name, time.time() - started, success=False)
+                raise
+
+            self.release(endpoint, model_name, time.time() - started, success=True,
+                         generated_tokens=result.get("eval_count", 0))
+            return result
+
+    def _stream_generate(self, endpoint: OllamaEndpoint, payload: Dict[str, Any], deadline: float,
+                         cancellation: Optional[Cancellation] = None) -> Dict[str, Any]:
+        """
+        Read the streamed response chunk by chunk so that the deadline and cancellation apply to the whole
+        generation, not just to the wait for the next byte. Returns the final chunk with the full response text.
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Deadline passed before the request was sent")
+
+        if cancellation is not None and cancellation.cancelled:
+            raise GenerationCancelled("Cancelled before the request was sent")
+        # A cancellable request gets a connection of its own, so that cancelling it cannot cut off another request
+        session = self._cancellable_session(cancellation) if cancellation is not None else self.session
+
+        sent = time.monotonic()
+        first_token = None
+        try:
+            try:
+                response = session.post(f"{endpoint.base_url}/api/generate", json=dict(payload, stream=True),
+                                        stream=True, timeout=(min(remaining, OLLAMA_HEALTH_CHECK_TIMEOUT), remaining))
+            except requests.exceptions.RequestException as e:
+                if cancellation is not None and cancellation.cancelled:
+                    raise GenerationCancelled("Cancelled before the response started") from e
+                if isinstance(e, requests.exceptions.ReadTimeout):
+                    # Connected, but not even the first token arrived in time
+                    raise DeadlineExceeded(f"No response from {endpoint.base_url} before the deadline") from e
+                raise
+
+            with response:
+                response.raise_for_status()
+                parts = []
+                final: Dict[str, Any] = {}
+                try:
+                    for line in response.iter_lines():
+                        if cancellation is not None and cancellation.cancelled:
+                            raise GenerationCancelled("Cancelled")
+                        if time.monotonic() >= deadline:
+                            raise DeadlineExceeded(f"Generation on {endpoint.base_url} passed its deadline")
+                        final = self._read_chunk(line, parts)
+                        if first_token is None and parts and parts[-1]:
+                            first_token = time.monotonic() - sent
+                        if final:
+                            break
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError) as e:
+                    # The connection was open, so a failed read is a stalled generation or our own cancellation
+                    if cancellation is not None and cancellation.cancelled:
+                        raise GenerationCancelled("Cancelled") from e
+                    if time.monotonic() >= deadline - 0.1:
+                        raise DeadlineExceeded(f"Generation on {endpoint.base_url} passed its deadline") from e
+                    raise
+        finally:
+            if session is not self.session:
+                session.close()
+
+        return self._final_result(final, parts, first_token)
+
+    @staticmethod
+    def _cancellable_session(cancellation: Cancellation) -> requests.Session:
+        session = requests.Session()
+        session.mount("http://", _CancellableAdapter(cancellation))
+        session.mount("https://", _CancellableAdapter(cancellation))
+        return session
+
+    @staticmethod
+    def _read_chunk(line, parts: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Collect the text of one NDJSON chunk; returns the chunk when it is the last one.
+        """
+        if not line:
+            return None
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise requests.exceptions.RequestException(chunk["error"])
+        parts.append(chunk.get("response", ""))
+        return chunk if chunk.get("done") else None
+
+    @staticmethod
+    def _final_result(final: Dict[str, Any], parts: List[str], first_token: Optional[float] = None) -> Dict[str, Any]:
+        if not final:
+            raise requests.exceptions.ChunkedEncodingError("The response ended before the generation was done")
+        final["response"] = "".join(parts)
+        # Seconds from sending the request to the first generated text, as seen by the client
+        final["time_to_first_token"] = first_token
+        return final
+
+    def hedge_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hedged_requests": self.hedged_requests, "hedge_wins": self.hedge_wins}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {endpoint.base_url: endpoint.stats() for endpoint in self.endpoints}
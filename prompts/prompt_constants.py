@@ -236,4 +236,14 @@ Generated React Code:
 {generated_code}
 ```
 
-Please provide your evaluation in the specified JSON format."""
\ No newline at end of file
+Please provide your evaluation in the specified JSON format."""
+
+JUDGE_REPAIR_PROMPT = """Your previous evaluation could not be used: {problems}.
+
+Respond again with only the JSON object in the specified format, without markdown fences or any other text.
+Keep each explanation to one or two sentences so that the whole object fits within the response limit."""
+
+JUDGE_TOOL_REPAIR_PROMPT = """The evaluation you submitted was rejected: {problems}.
+
+Call the {tool_name} tool again with a corrected evaluation.
+Keep each explanation to one or two sentences so that the whole evaluation fits within the response limit."""
@@ -0,0 +1,25 @@
+import io
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.json_stream import JsonStreamReader
+
+
+def read_object(text, chunk_size):
+    reader = JsonStreamReader(io.StringIO(text), chunk_size)
+    return {key: reader.read_value() for key in reader.iter_object()}
+
+
+def test_numbers_split_across_chunks():
+    for text in ('{"a": 12.5}', '{"a": 1e5}', '{"a": -3.25E-2, "b": [1, 22, 333.5e+1]}'):
+        for chunk_size in range(1, len(text) + 1):
+            assert read_object(text, chunk_size) == json.loads(text), (text, chunk_size)
+
+
+def test_array_items_with_small_chunks():
+    items = [{"id": index, "score": index / 3, "text": "x" * index} for index in range(20)]
+    reader = JsonStreamReader(io.StringIO(json.dumps(items)), 3)
+    assert list(reader.iter_array()) == items
@@ -0,0 +1,25 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_servers import FakeOllamaServer, ServiceProfile
+from model_runner.ollama_pool import OllamaEndpointPool, Cancellation, GenerationCancelled
+
+
+def test_cancel_before_the_response_starts():
+    # The fake server sends nothing, not even headers, until its first token is due
+    with FakeOllamaServer(ServiceProfile(latency=5.0, jitter=0)) as server:
+        pool = OllamaEndpointPool([server.url])
+        cancellation = Cancellation()
+        threading.Timer(0.2, cancellation.cancel).start()
+
+        started = time.monotonic()
+        with pytest.raises(GenerationCancelled):
+            pool._generate({"model": "model", "prompt": "prompt"}, time.monotonic() + 30, cancellation)
+        assert time.monotonic() - started < 2
+        assert pool.stats()[server.url]["cancelled"] == 1
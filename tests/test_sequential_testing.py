@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.sequential_testing import SequentialPairedTest, SequentialPairwiseTests, t_quantile
+
+
+def judge_scores(rng, bias=0.0):
+    # Two models judged on the same cell: a shared cell difficulty plus independent judge noise
+    base = rng.integers(4, 9)
+    score_a = np.clip(base + rng.integers(-1, 2) + bias * (rng.random() < 0.5) * 2, 0, 10)
+    score_b = np.clip(base + rng.integers(-1, 2), 0, 10)
+    return float(score_a), float(score_b)
+
+
+def run_test(test, scores):
+    for cell, (score_a, score_b) in enumerate(scores):
+        test.add(str(cell), {"overall_score": score_a, "meta": {"model_name": test.model_a}})
+        if test.add(str(cell), {"overall_score": score_b, "meta": {"model_name": test.model_b}}):
+            break
+    return test.decision
+
+
+def test_false_winner_rate_under_the_null_stays_below_alpha():
+    rng = np.random.default_rng(0)
+    runs, confidence = 1000, 0.95
+    false_winners = 0
+    for _ in range(runs):
+        decision = run_test(SequentialPairedTest(confidence=confidence, ci_width=0),
+                            [judge_scores(rng) for _ in range(320)])
+        false_winners += bool(decision and decision["reason"] == "winner")
+
+    alpha = 1 - confidence
+    # Three binomial standard errors of slack above the nominal rate
+    assert false_winners / runs <= alpha + 3 * np.sqrt(alpha * (1 - alpha) / runs)
+
+
+def test_real_difference_is_found():
+    rng = np.random.default_rng(1)
+    decision = run_test(SequentialPairedTest(), [judge_scores(rng, bias=0.5) for _ in range(320)])
+    assert decision is not None and decision["reason"] == "winner" and decision["winner"] == "Model 1"
+
+
+def test_constant_margin_stops_with_a_winner():
+    test = SequentialPairedTest(min_pairs=10)
+    decision = run_test(test, [(7.0, 6.0)] * 100)
+    assert decision is not None and decision["reason"] == "winner" and decision["winner"] == "Model 1"
+    assert test.looks == 1 and decision["n_pairs"] == 10
+
+
+def test_constant_ties_stop_on_the_interval_width():
+    decision = run_test(SequentialPairedTest(min_pairs=10), [(6.0, 6.0)] * 100)
+    assert decision is not None and decision["reason"] == "ci_width" and decision["winner"] is None
+
+
+def test_looks_follow_the_doubling_schedule():
+    # Alternating differences of +1 and -1: no winner, and a ci_width of 0 can never be reached
+    test = SequentialPairedTest(min_pairs=10, ci_width=0)
+    assert run_test(test, [(7.0, 6.0), (6.0, 7.0)] * 50) is None
+    assert test.looks == 4 and test.next_look == 160 and test.last_look["n_pairs"] == 80
+    assert abs(test.last_look["alpha"] - (1 - test.confidence) / 2 ** test.looks) < 1e-8
+
+
+def test_pairwise_tests_split_the_error_rate():
+    tests = SequentialPairwiseTests(["Model 1", "Model 2", "Model 3"], confidence=0.97)
+    assert len(tests.tests) == 3
+    assert all(abs(test.confidence - 0.99) < 1e-12 for test in tests.tests.values())
+
+
+def test_t_quantile():
+    # Exact values of Student's t distribution
+    assert abs(t_quantile(0.975, 9) - 2.2622) < 1e-3
+    assert abs(t_quantile(0.9975, 9) - 3.6896) < 1e-3
+    assert abs(t_quantile(0.995, 30) - 2.7500) < 1e-3
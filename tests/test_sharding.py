@@ -0,0 +1,36 @@
+import inspect
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_servers import FakeOllamaServer, FakeAnthropicServer, ServiceProfile
+from benchmarks.pipeline_benchmark import run_sharded_scenario, expected_evaluations
+
+
+def _judge_request_supported() -> bool:
+    import anthropic
+    return "temperature" in inspect.signature(anthropic.resources.Messages.create).parameters
+
+
+@pytest.mark.skipif(not _judge_request_supported(),
+                    reason="the installed anthropic SDK does not accept the judge's temperature argument")
+def test_two_shards_merge_every_evaluation_exactly_once():
+    image_count = 3
+    profile = ServiceProfile()
+    ollama_servers = [FakeOllamaServer(profile).start() for _ in range(2)]
+    try:
+        with FakeAnthropicServer(profile) as anthropic_server:
+            # `run --shard i/2` in two processes, one per Ollama stand-in, then `merge`
+            result = run_sharded_scenario(image_count, ollama_servers, anthropic_server)
+    finally:
+        for server in ollama_servers:
+            server.stop()
+
+    assert "error" not in result, result.get("error")
+    assert result["shards"] == 2
+    assert result["merged_evaluations"] == expected_evaluations(image_count)
+    # Every generation reached one of the shards' servers, none was sent twice
+    assert result["served"]["ollama"]["requests"] == expected_evaluations(image_count)
@@ -0,0 +1,48 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def map_ordered(function: Callable[[T], Awaitable[R]], items: Iterable[T], window: int) -> AsyncIterator[R]:
+    """
+    Run function over items with at most window calls running or waiting to be yielded, and yield the results
+    in the order of items. Only window coroutines exist at a time, so a work list of any length can be mapped
+    without holding every pending call in memory.
+    """
+    window = max(1, window)
+    items = iter(items)
+    running: Dict[asyncio.Future, int] = {}
+    finished: Dict[int, R] = {}
+    next_index = 0
+    next_to_yield = 0
+    exhausted = False
+
+    def fill():
+        nonlocal next_index, exhausted
+        while not exhausted and len(running) + len(finished) < window:
+            try:
+                item = next(items)
+            except StopIteration:
+                exhausted = True
+                return
+            running[asyncio.ensure_future(function(item))] = next_index
+            next_index += 1
+
+    fill()
+    try:
+        while running or finished:
+            if next_to_yield in finished:
+                result = finished.pop(next_to_yield)
+                next_to_yield += 1
+                fill()
+                yield result
+                continue
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                finished[running.pop(task)] = task.result()
+            fill()
+    finally:
+        for task in running:
+            task.cancel()
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+Incremental runs. Every generated file and every judgment is a node of a build graph, recorded with a digest of
+its inputs:
+
+    generated code  <- prompt (PROMPT_DICT entry), model settings (name, max_tokens, temperature), image
+    judgment        <- judge prompts and settings, image, generated code, model label
+
+A node whose inputs hash to the recorded digest is up to date and is reused; any other node is recomputed. So a
+changed JUDGE_USER_PROMPT re-judges everything without regenerating, a changed PROMPT_DICT entry regenerates only
+that prompt's code (and then re-judges it, since the code changed), and hand-edited code is re-judged.
+The graph is a JSON file next to what it describes (BUILD_GRAPH_FILE in the code and results directories).
+"""
+
+# (path, size, mtime_ns) -> digest, so that an image is read once per process however many nodes use it
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+
+
+def digest(*parts: Any) -> str:
+    """
+    Digest of JSON-serialisable values, e.g. prompts and settings.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> Optional[str]:
+    # None for a missing file, which makes every node using it stale
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_digests:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        _file_digests[key] = sha.hexdigest()
+    return _file_digests[key]
+
+
+class BuildGraph:
+    """
+    Recorded nodes of one directory: key (a file path) -> {"inputs": digest, "value": ...}.
+    Changes are kept in memory until save().
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.nodes = json.load(f).get("nodes", {})
+            except (OSError, ValueError) as e:
+                # A damaged graph only costs a full rebuild
+                print(f"Ignoring build graph {self.path}: {e}")
+
+    def is_fresh(self, key: str, inputs: Optional[str]) -> bool:
+        """
+        Whether the node was recorded with these inputs and its file still exists.
+        """
+        node = self.nodes.get(str(key))
+        return inputs is not None and node is not None and node["inputs"] == inputs and Path(key).exists()
+
+    def value(self, key: str) -> Any:
+        node = self.nodes.get(str(key))
+        return node.get("value") if node else None
+
+    def record(self, key: str, inputs: str, value: Any = None):
+        self.nodes[str(key)] = {"inputs": inputs, "value": value}
+
+    def save(self):
+        # Written to a temporary file first, so that an interrupted save leaves the previous graph
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_suffix(".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"nodes": self.nodes}, f, ensure_ascii=False)
+        os.replace(temporary_path, self.path)
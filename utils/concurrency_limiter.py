@@ -0,0 +1,203 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import (
+    CONCURRENCY_LATENCY_TOLERANCE,
+    CONCURRENCY_BACKOFF_RATIO,
+    CONCURRENCY_LATENCY_WINDOW,
+    CONCURRENCY_HISTORY_LENGTH
+)
+
+# Request outcomes reported to the limiter
+SUCCESS = "success"
+TIMEOUT = "timeout"
+RATE_LIMITED = "rate_limited"  # 429, 503 or 529 from the service
+ERROR = "error"  # Failures that say nothing about load, e.g. a bad request
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on requests in flight to one service.
+    While latency stays close to the lowest latency seen recently, the limit grows by one per limit's worth of
+    successful requests; a latency spike, a timeout or a rate-limit response multiplies it by backoff_ratio.
+    Only requests started after the last decrease can trigger another one, so one congestion event backs off once.
+    """
+
+    # Grow by one per successful request until the first decrease (see AsyncAdaptiveConcurrencyLimiter)
+    slow_start = False
+
+    def __init__(self, name: str, initial_limit: int = 1, min_limit: int = 1, max_limit: int = 8,
+                 latency_tolerance: float = CONCURRENCY_LATENCY_TOLERANCE,
+                 backoff_ratio: float = CONCURRENCY_BACKOFF_RATIO,
+                 latency_window: int = CONCURRENCY_LATENCY_WINDOW):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+
+        self.in_flight = 0
+        self.recent_latencies = deque(maxlen=latency_window)
+        self.smoothed_latency: Optional[float] = None
+        self.last_decrease_at = 0.0
+        self.started_at = time.perf_counter()
+
+        self.counts = {"requests": 0, "latency_spikes": 0, TIMEOUT: 0, RATE_LIMITED: 0, ERROR: 0}
+        self.peak_limit = int(self.limit)
+        self.decreases = 0
+        # Only the most recent limit changes, so a long run's metrics stay small
+        self.history = deque(maxlen=CONCURRENCY_HISTORY_LENGTH)
+        self._record("initial")
+
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def acquire(self) -> float:
+        """
+        Wait for a free slot; returns the start time to pass back to release().
+        """
+        with self._released:
+            while self.in_flight >= int(self.limit):
+                self._released.wait()
+            self.in_flight += 1
+            self.counts["requests"] += 1
+        return time.perf_counter()
+
+    def release(self, started: float, outcome: str = SUCCESS, latency: Optional[float] = None):
+        """
+        latency is the load signal of a successful request, by default its time since acquire(). Callers whose
+        requests vary in length pass a measure that does not grow with the length, e.g. the time to the first token.
+        """
+        if latency is None:
+            latency = time.perf_counter() - started
+        with self._released:
+            # The request still counts as in flight when deciding whether the limit was actually used
+            limit_reached = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+
+            if outcome == SUCCESS:
+                self._on_success(latency, started, limit_reached)
+            elif outcome in (TIMEOUT, RATE_LIMITED):
+                self.counts[outcome] += 1
+                self._decrease(outcome, started)
+            else:
+                self.counts[ERROR] += 1
+            self._released.notify_all()
+
+    def _on_success(self, latency: float, started: float, limit_reached: bool):
+        self.recent_latencies.append(latency)
+        no_load_latency = min(self.recent_latencies)
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency = 0.8 * self.smoothed_latency + 0.2 * latency
+
+        if self.smoothed_latency > no_load_latency * self.latency_tolerance:
+            if started >= self.last_decrease_at:
+                self.counts["latency_spikes"] += 1
+                self._decrease("latency")
+        elif limit_reached and self.limit < self.max_limit:
+            # Grow only when the current limit is in use; otherwise latency says nothing about a higher one
+            previous = int(self.limit)
+            step = 1 if self.slow_start and not self.last_decrease_at else 1 / self.limit
+            self.limit = min(self.max_limit, self.limit + step)
+            if int(self.limit) != previous:
+                self.peak_limit = max(self.peak_limit, int(self.limit))
+                self._record("increase")
+
+    def _decrease(self, reason: str, started: Optional[float] = None):
+        if started is not None and started < self.last_decrease_at:
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.last_decrease_at = time.perf_counter()
+        # Latencies observed at the old limit should not trigger another decrease
+        self.smoothed_latency = None
+        self.decreases += 1
+        self._record(reason)
+
+    def _record(self, reason: str):
+        self.history.append({
+            "elapsed_s": round(time.perf_counter() - self.started_at, 3),
+            "limit": int(self.limit),
+            "reason": reason
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            no_load_latency = min(self.recent_latencies) if self.recent_latencies else None
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "peak_limit": self.peak_limit,
+                "in_flight": self.in_flight,
+                "no_load_latency": round(no_load_latency, 3) if no_load_latency is not None else None,
+                "decreases": self.decreases,
+                **self.counts,
+                "history": list(self.history)
+            }
+
+
+class AsyncAdaptiveConcurrencyLimiter(AdaptiveConcurrencyLimiter):
+    """
+    The same limit for coroutines: acquire() is awaited instead of blocking a thread.
+    Waiters are queued in order and a freed slot is handed to the first of them, so thousands of waiting requests
+    do not all wake up on every release.
+    Until the first decrease the limit grows by one per successful request (slow start), doubling every round trip,
+    so that a run of thousands of coroutines reaches its limit within the first few requests.
+    """
+
+    slow_start = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters = deque()
+
+    async def acquire(self) -> float:
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self._take_slot()
+                return time.perf_counter()
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just before the cancellation
+                    self.in_flight -= 1
+            self._wake_waiters()
+            raise
+        return time.perf_counter()
+
+    def release(self, started: float, outcome: str = SUCCESS, latency: Optional[float] = None):
+        super().release(started, outcome, latency)
+        self._wake_waiters()
+
+    def _take_slot(self):
+        self.in_flight += 1
+        self.counts["requests"] += 1
+
+    def _wake_waiters(self):
+        with self._lock:
+            while self._waiters and self.in_flight < int(self.limit):
+                waiter = self._waiters.popleft()
+                if waiter.done():
+                    continue
+                self._take_slot()
+                waiter.set_result(None)
@@ -1,14 +1,21 @@
 
-import json
+import argparse
+import heapq
 import sys
 import os
+from itertools import groupby
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Sequence
 
-from config.constants import EVALUATION_REPORT_PATH, EVALUATION_RESULTS_JSON_PATH
+import numpy as np
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from config.constants import EVALUATION_REPORT_PATH, EVALUATION_RESULTS_JSON_PATH, JUDGE_CRITERIA
+from utils.json_stream import load_json_skipping, iter_json_array
+from utils.results_store import iter_detailed_results, filter_rows
+from utils.score_aggregator import DEFAULT_PROMPT_ID, pass_at_k
+
 
 class EvaluationAnalyzer:
  
@@ -16,107 +23,125 @@ class EvaluationAnalyzer:
        
         self.results_path = results_path
         self.results = None
+        self._inline_results = False
         
     def load_results(self) -> bool:
         
         try:
-            with open(self.results_path, 'r', encoding='utf-8') as f:
-                self.results = json.load(f)
+            # Inline evaluations of older results files are left on disk and streamed on demand
+            self.results, streamed_keys = load_json_skipping(self.results_path, ["detailed_results"])
+            self._inline_results = "detailed_results" in streamed_keys
             return True
         except Exception as e:
             print(f"Error loading results: {e}")
             return False
     
-    def generate_detailed_report(self) -> str:
-       
+    def iter_detailed_results(self, image_names: Optional[Iterable[str]] = None,
+                              top_n: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        # Evaluations are streamed from the results store (or the results file) rather than held in memory
         if not self.results:
-            return "Results not loaded"
+            return iter(())
+        if self._inline_results:
+            return filter_rows(iter_json_array(self.results_path, "detailed_results"), image_names, top_n)
+        return iter_detailed_results(self.results, image_names, top_n)
+    
+    def iter_report_lines(self, top_n: Optional[int] = None,
+                          image_names: Optional[Iterable[str]] = None) -> Iterator[str]:
+        """
+        Yield the detailed report line by line, reading one evaluation at a time.
+        top_n limits the detailed section to the N best evaluations; image_names to the given images.
+        Results are grouped under an image header for each consecutive run of the same image,
+        which is one group per image for runs written image by image.
+        """
+        if not self.results:
+            yield "Results not loaded"
+            return
 
-        report_lines = []
-        report_lines.append("=" * 60)
-        report_lines.append("DETAILED REPORT OF LLM AS A JUDGE")
-        report_lines.append("=" * 60)
+        yield "=" * 60
+        yield "DETAILED REPORT OF LLM AS A JUDGE"
+        yield "=" * 60
 
         meta = self.results.get("meta", {})
-        report_lines.append(f"\nGeneral Information:")
-        report_lines.append(f"  Total Images: {meta.get('total_images', 'N/A')}")
-        report_lines.append(f"  Total Evaluations: {meta.get('total_evaluations', 'N/A')}")
-        report_lines.append(f"  Judge Model: {meta.get('model_used', 'N/A')}")
+        yield f"\nGeneral Information:"
+        yield f"  Total Images: {meta.get('total_images', 'N/A')}"
+        yield f"  Total Evaluations: {meta.get('total_evaluations', 'N/A')}"
+        yield f"  Judge Model: {meta.get('model_used', 'N/A')}"
+
+        judge_stats = meta.get("judge_stats", {})
+        if judge_stats:
+            yield f"  Judge Mode: {judge_stats.get('mode', 'N/A')}"
+            yield f"  Parse Failures: {judge_stats.get('parse_failures', 0)} of {judge_stats.get('judge_requests', 0)} requests"
+            yield f"  Re-judge Rate: {judge_stats.get('rejudge_rate', 0):.1%}"
 
         # Summary statistics
         summary = self.results.get("evaluation_summary", {})
         if summary and "error" not in summary:
-            report_lines.append(f"\nSummary Statistics:")
-            report_lines.append(f"  Successful Evaluations: {summary.get('successful_evaluations', 0)}")
-            report_lines.append(f"  Failed Evaluations: {summary.get('failed_evaluations', 0)}")
+            yield f"\nSummary Statistics:"
+            yield f"  Successful Evaluations: {summary.get('successful_evaluations', 0)}"
+            yield f"  Failed Evaluations: {summary.get('failed_evaluations', 0)}"
 
-            # Model statistics
-            for model_key in ["model1_summary", "model2_summary"]:
-                model_data = summary.get(model_key, {})
+            # Model statistics; older results only carry the two fixed model summaries
+            model_summaries = summary.get("model_summaries") or {
+                "Model 1": summary.get("model1_summary", {}),
+                "Model 2": summary.get("model2_summary", {})
+            }
+            for model_name, model_data in model_summaries.items():
                 if model_data:
-                    model_name = "Model 1" if model_key == "model1_summary" else "Model 2"
-                    report_lines.append(f"\n  {model_name}:")
-                    report_lines.append(f"    Average Overall Score: {model_data.get('average_overall_score', 0):.2f}/10")
-                    report_lines.append(f"    Number of Evaluations: {model_data.get('count', 0)}")
+                    yield f"\n  {model_name}:"
+                    yield f"    Average Overall Score: {model_data.get('average_overall_score', 0):.2f}/10"
+                    yield f"    Number of Evaluations: {model_data.get('count', 0)}"
 
                     criteria_scores = model_data.get('average_criteria_scores', {})
                     if criteria_scores:
-                        report_lines.append(f"    Average Scores by Criterion:")
+                        yield f"    Average Scores by Criterion:"
                         for criterion, score in criteria_scores.items():
-                            report_lines.append(f"      {criterion}: {score:.2f}/10")
+                            yield f"      {criterion}: {score:.2f}/10"
         
-        
-        detailed_results = self.results.get("detailed_results", [])
-        if detailed_results:
-            report_lines.append(f"\n" + "=" * 40)
-            report_lines.append("DETAILED RESULTS BY IMAGE")
-            report_lines.append("=" * 40)
+        successful_results = (r for r in self.iter_detailed_results(image_names, top_n) if "error" not in r)
+        results_by_image = groupby(successful_results, key=lambda r: r.get("meta", {}).get("image_name", "unknown"))
 
+        header_written = False
+        for image_name, image_results in results_by_image:
+            if not header_written:
+                yield f"\n" + "=" * 40
+                yield f"TOP {top_n} RESULTS" if top_n is not None else "DETAILED RESULTS BY IMAGE"
+                yield "=" * 40
+                header_written = True
+
+            yield f"\n📱 {image_name}"
+            yield "-" * 40
             
-            results_by_image = {}
-            for result in detailed_results:
-                if "error" not in result:
-                    image_name = result.get("meta", {}).get("image_name", "unknown")
-                    if image_name not in results_by_image:
-                        results_by_image[image_name] = []
-                    results_by_image[image_name].append(result)
-            
-            for image_name, image_results in results_by_image.items():
-                report_lines.append(f"\n📱 {image_name}")
-                report_lines.append("-" * 40)
+            for result in image_results:
+                model_name = result.get("meta", {}).get("model_name", "Unknown")
+                overall_score = result.get("overall_score", 0)
                 
-                for result in image_results:
-                    model_name = result.get("meta", {}).get("model_name", "Unknown")
-                    overall_score = result.get("overall_score", 0)
-                    
-                    report_lines.append(f"\n  {model_name}: {overall_score}/10")
-                    
-                    
-                    criteria = ["element_detection", "structural_accuracy", "layout_accuracy", "code_quality", "completeness"]
-                    for criterion in criteria:
-                        criterion_data = result.get(criterion, {})
-                        if criterion_data:
-                            score = criterion_data.get("score", 0)
-                            explanation = criterion_data.get("explanation", "").strip()
-                            
-                            report_lines.append(f"    {criterion}: {score}/10")
-                            if explanation:
-                                report_lines.append(f"      {explanation}")
-                    
-                    
-                    strengths = result.get("strengths", [])
-                    if strengths:
-                        report_lines.append(f"Strengths: {', '.join(strengths)}")
-                    
-                    weaknesses = result.get("weaknesses", [])
-                    if weaknesses:
-                        report_lines.append(f"Weaknesses: {', '.join(weaknesses)}")
-                    
-                    summary_text = result.get("summary", "").strip()
-                    if summary_text:
-                        report_lines.append(f"Summary: {summary_text}")
-        
-        return "\n".join(report_lines)
+                yield f"\n  {model_name}: {overall_score}/10"
+                
+                for criterion in JUDGE_CRITERIA:
+                    criterion_data = result.get(criterion, {})
+                    if criterion_data:
+                        score = criterion_data.get("score", 0)
+                        explanation = criterion_data.get("explanation", "").strip()
+                        
+                        yield f"    {criterion}: {score}/10"
+                        if explanation:
+                            yield f"      {explanation}"
+                
+                strengths = result.get("strengths", [])
+                if strengths:
+                    yield f"Strengths: {', '.join(strengths)}"
+                
+                weaknesses = result.get("weaknesses", [])
+                if weaknesses:
+                    yield f"Weaknesses: {', '.join(weaknesses)}"
+                
+                summary_text = result.get("summary", "").strip()
+                if summary_text:
+                    yield f"Summary: {summary_text}"
+    
+    def generate_detailed_report(self, top_n: Optional[int] = None,
+                                 image_names: Optional[Iterable[str]] = None) -> str:
+        return "\n".join(self.iter_report_lines(top_n, image_names))
     
         
     def find_best_and_worst_results(self) -> Dict[str, Any]:
@@ -124,17 +149,25 @@ class EvaluationAnalyzer:
         if not self.results:
             return {"error": "Results not loaded"}
         
-        detailed_results = self.results.get("detailed_results", [])
-        successful_results = [r for r in detailed_results if "error" not in r and "overall_score" in r]
+        # Only the current best and worst three are kept while streaming through the results
+        worst_results = []
+        best_results = []
+        for sequence, result in enumerate(self.iter_detailed_results()):
+            if "error" in result or "overall_score" not in result:
+                continue
+            score = result.get("overall_score", 0)
+            heapq.heappush(worst_results, (-score, -sequence, result))
+            if len(worst_results) > 3:
+                heapq.heappop(worst_results)
+            heapq.heappush(best_results, (score, sequence, result))
+            if len(best_results) > 3:
+                heapq.heappop(best_results)
         
-        if not successful_results:
+        if not best_results:
             return {"error": "No successful results for analysis"}
         
-        # Sort by overall score
-        sorted_results = sorted(successful_results, key=lambda x: x.get("overall_score", 0))
-        
-        worst_results = sorted_results[:3]  # 3 worst
-        best_results = sorted_results[-3:][::-1]  # 3 best
+        worst_results = [r for _, _, r in sorted(worst_results, reverse=True)]  # 3 worst
+        best_results = [r for _, _, r in sorted(best_results, reverse=True)]  # 3 best
         
         return {
             "best_results": [
@@ -155,62 +188,113 @@ class EvaluationAnalyzer:
             ]
         }
     
-    def calculate_pass_at_k_metrics(self, k_values: List[int] = [1, 3, 5]) -> Dict[str, Any]:
-        
+    def calculate_pass_at_k_metrics(self, k_values: Optional[Sequence[int]] = None,
+                                    thresholds: Sequence[float] = (5, 6, 7, 8, 9)) -> Dict[str, Any]:
+        """
+        Unbiased pass@k for every threshold and k: pooled over models per image, and per model and per prompt
+        over (model, prompt, image) tasks. Without k_values the full curve k = 1..max samples per image is returned.
+        Images with fewer than k samples are left out of the pass@k average for that k.
+        """
         if not self.results:
             return {"error": "Results not loaded"}
 
-        detailed_results = self.results.get("detailed_results", [])
-        successful_results = [r for r in detailed_results if "error" not in r and "overall_score" in r]
+        # Single grouping pass: each sample becomes a score plus integer image/model/prompt codes
+        scores = []
+        codes = []
+        images, models, prompts = {}, {}, {}
+        for result in self.iter_detailed_results():
+            score = result.get("overall_score")
+            if "error" in result or isinstance(score, bool) or not isinstance(score, (int, float)):
+                continue
+            meta = result.get("meta", {})
+            scores.append(float(score))
+            codes.append((
+                images.setdefault(meta.get("image_name", "unknown"), len(images)),
+                models.setdefault(meta.get("model_name", "Unknown"), len(models)),
+                prompts.setdefault(str(meta.get("prompt_id", DEFAULT_PROMPT_ID)), len(prompts))
+            ))
         
-        if not successful_results:
+        if not scores:
             return {"error": "No data for pass@k calculation"}
 
-        # Define threshold values for "passing" the test
-        thresholds = [5, 6, 7, 8, 9]  # Different success thresholds
+        scores = np.asarray(scores)
+        image_codes, model_codes, prompt_codes = np.asarray(codes, dtype=np.intp).T
+
+        task_keys = (model_codes * len(prompts) + prompt_codes) * len(images) + image_codes
+        tasks, task_ids = np.unique(task_keys, return_inverse=True)
+        task_models = tasks // (len(prompts) * len(images))
+        task_prompts = (tasks // len(images)) % len(prompts)
+
+        if k_values is None:
+            k_values = range(1, int(np.bincount(image_codes).max()) + 1)
+        k_values = list(k_values)
+        thresholds = list(thresholds)
+
+        by_image = pass_at_k(scores, image_codes, thresholds, k_values)
+        by_task = pass_at_k(scores, task_ids, thresholds, k_values)
+
+        def mean_by(values, labels, label_names):
+            # Average (group, threshold, k) estimates over the groups sharing a label, ignoring undefined ones
+            defined = ~np.isnan(values)
+            sums = np.zeros((len(label_names),) + values.shape[1:])
+            counts = np.zeros_like(sums)
+            np.add.at(sums, labels, np.where(defined, values, 0))
+            np.add.at(counts, labels, defined)
+            with np.errstate(invalid="ignore"):
+                means = sums / counts
+            return {name: self._format_pass_at_k(means[i], thresholds, k_values) for i, name in enumerate(label_names)}
+
+        overall = mean_by(by_image, np.zeros(len(by_image), dtype=np.intp), ["all"])["all"]
 
-        pass_at_k_results = {}
-        
-        for threshold in thresholds:
-            pass_at_k_results[f"threshold_{threshold}"] = {}
-
-            # Group results by image
-            results_by_image = {}
-            for result in successful_results:
-                image_name = result.get("meta", {}).get("image_name", "unknown")
-                if image_name not in results_by_image:
-                    results_by_image[image_name] = []
-                results_by_image[image_name].append(result.get("overall_score", 0))
-
-            # Compute pass@k for each k
-            for k in k_values:
-                passed_images = 0
-                total_images = len(results_by_image)
-                
-                for image_name, scores in results_by_image.items():
-                    # Take top-k results for this image
-                    top_k_scores = sorted(scores, reverse=True)[:k]
-                    # Check if there's at least one result above the threshold
-                    if any(score >= threshold for score in top_k_scores):
-                        passed_images += 1
-                
-                pass_rate = passed_images / total_images if total_images > 0 else 0
-                pass_at_k_results[f"threshold_{threshold}"][f"pass@{k}"] = round(pass_rate, 3)
-        
         return {
-            "pass_at_k_metrics": pass_at_k_results,
-            "total_images": len(results_by_image) if 'results_by_image' in locals() else 0
+            "pass_at_k_metrics": overall,
+            "by_model": mean_by(by_task, task_models, list(models)),
+            "by_prompt": mean_by(by_task, task_prompts, list(prompts)),
+            "thresholds": thresholds,
+            "k_values": k_values,
+            "total_images": len(images),
+            "total_samples": len(scores)
         }
     
-    def save_report(self, output_path: str = EVALUATION_REPORT_PATH):
-        
-        report = self.generate_detailed_report()
+    @staticmethod
+    def _format_pass_at_k(values: np.ndarray, thresholds: List[float], k_values: List[int]) -> Dict[str, Dict[str, Any]]:
+        return {
+            f"threshold_{threshold:g}": {
+                f"pass@{k}": (None if np.isnan(values[t, i]) else round(float(values[t, i]), 3))
+                for i, k in enumerate(k_values)
+            }
+            for t, threshold in enumerate(thresholds)
+        }
+    
+    def save_report(self, output_path: str = EVALUATION_REPORT_PATH, top_n: Optional[int] = None,
+                    image_names: Optional[Iterable[str]] = None):
         
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         
+        # Sections are written as they are produced, so memory does not grow with the number of evaluations
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(report)
+            for i, line in enumerate(self.iter_report_lines(top_n, image_names)):
+                f.write(("\n" if i else "") + line)
 
         print(f"Report saved to {output_path}")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Write the detailed LLM-as-a-Judge report")
+    parser.add_argument("--results", default=EVALUATION_RESULTS_JSON_PATH, help="Results index or legacy results file")
+    parser.add_argument("--output", default=EVALUATION_REPORT_PATH, help="Report file to write")
+    parser.add_argument("--top", type=int, default=None, metavar="N", help="Only include the N best evaluations")
+    parser.add_argument("--image", action="append", default=None, dest="images",
+                        help="Only include this image (can be repeated)")
+    args = parser.parse_args()
+
+    analyzer = EvaluationAnalyzer(args.results)
+    if not analyzer.load_results():
+        return False
+
+    analyzer.save_report(args.output, top_n=args.top, image_names=args.images)
+    return True
+
+
+if __name__ == "__main__":
+    main()
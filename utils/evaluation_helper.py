@@ -9,25 +9,54 @@ from prompts.prompt_constants import PROMPT_DICT, PROMPT_NUMBER
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
-from dataset.dataset_loader import load_first_images, save_images
-from model_runner.ollama_models_runner import OllamaModelRunner
-from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+from utils.results_store import iter_detailed_results
 from config.constants import (
     IMAGES_DIR,
+    GENERATED_CODE_DIR,
     EVALUATION_RESULTS_PATH,
-    MODEL_NAME_1,
-    MODEL_NAME_2,
+    EVALUATION_RESULTS_JSON_PATH,
+    JUDGE_CRITERIA,
+    SIGNIFICANCE_ALPHA,
+    SEQUENTIAL_BATCH_SIZE,
+    SEQUENTIAL_CI_WIDTH,
+    SEQUENTIAL_SEED,
+    SWEEP_RESULTS_PATH,
+    MODEL_BENCHMARK_CONCURRENCY,
+    MODEL_BENCHMARK_MEMORY_INTERVAL,
+    MODEL_BENCHMARK_RESULTS_PATH,
+    INCREMENTAL_BUILD,
+    BUILD_GRAPH_FILE,
 )
 from config.ollama_manager import OllamaManager
+from config.model_registry import get_model_registry
+
+# The dataset loader, the runners and NumPy are imported inside the functions that use them,
+# so that commands which only print or analyse saved results start without loading them.
+
+# Labels written by the judge runner -> model names shown in reports
+MODEL_DISPLAY_NAMES = get_model_registry().display_names
+
+
+def model_key(model_label):
+    # "Model 1" -> "model1", the key used in the comparison report: the suffix of a registered model
+    spec = get_model_registry().by_label(model_label)
+    return spec.suffix if spec else model_label.lower().replace(" ", "")
+
 
 def ensure_images_exist():
+    from dataset.dataset_loader import load_and_save_first_images
     
     images_dir = Path(IMAGES_DIR)
     if not images_dir.exists():
         print("Images are not found. Loading from dataset...")
         try:
-            images = load_first_images()
-            saved_count, save_errors = save_images(images, IMAGES_DIR)
+            # Every image costs a generation and a judge request per model and prompt
+            inference_calls_per_image = 2 * len(MODEL_DISPLAY_NAMES) * len(_prompt_indices())
+            _, saved_count, save_errors, dedup_report = load_and_save_first_images(inference_calls_per_image)
+            if dedup_report is not None:
+                print(f"Deduplication: {dedup_report['total_images']} images in {dedup_report['clusters']} clusters, "
+                      f"{dedup_report['removed_images']} near-duplicates removed, "
+                      f"{dedup_report['inference_calls_saved']} inference calls saved")
             print(f"Loaded and saved {saved_count} images")
             if save_errors > 0:
                 print(f"Save errors: {save_errors}")
@@ -40,94 +69,526 @@ def ensure_images_exist():
     
     return True
 
-def generate_code_with_ollama():
+def generate_code_with_ollama(shard=None, ollama_base_url=None, resource_monitor=None):
+    """
+    resource_monitor: the ProcessTreeMonitor of the local Ollama server, whose samples are reported next to the
+    generation requests; None when the server is not watched.
+    """
+    from model_runner.ollama_models_runner import OllamaModelRunner
     
     try:
-        runner = OllamaModelRunner()
+        # ollama_base_url may list several servers separated by commas
+        runner = OllamaModelRunner(ollama_base_url.split(",") if ollama_base_url else None)
+        work_items, code_dir = _plan_generation(runner, shard)
         
-        print(f"Generating code with {MODEL_NAME_1} and {MODEL_NAME_2}...")
+        model_counts = {}
+        graph = _generation_graph(code_dir)
+        stale_items = _skip_fresh_work(runner, work_items, code_dir, graph, model_counts)
+        for prompt_index, model_choices, image_files in _generation_batches(runner, stale_items, code_dir):
+            prompt = PROMPT_DICT[prompt_index]
+            results = runner.run_models_on_images(prompt["system_prompt"], prompt["user_prompt"],
+                                                  model_choices=model_choices, image_files=image_files)
+            _count_results(model_counts, results)
+            _record_generation(runner, graph, prompt_index, results)
 
-        model1_count, model2_count = 0, 0
+        return _report_generation(runner, work_items, code_dir, model_counts, resource_monitor)
+        
+    except Exception as e:
+        print(f"Error generating code: {e}")
+        return False
 
-        if PROMPT_NUMBER == "All":
-            # Iterate through each prompt pair
-            for prompt_pair in PROMPT_DICT:
-                system_prompt = prompt_pair["system_prompt"]
-                user_prompt = prompt_pair["user_prompt"]
-                results = runner.run_both_models_on_images(system_prompt, user_prompt)
+async def generate_code_with_ollama_async(shard=None, ollama_base_url=None, resource_monitor=None):
+    """
+    generate_code_with_ollama() with every generation a coroutine of one event loop.
+    """
+    from model_runner.async_ollama_models_runner import AsyncOllamaModelRunner
+    
+    try:
+        runner = AsyncOllamaModelRunner(ollama_base_url.split(",") if ollama_base_url else None)
+        work_items, code_dir = _plan_generation(runner, shard)
+        
+        model_counts = {}
+        graph = _generation_graph(code_dir)
+        stale_items = _skip_fresh_work(runner, work_items, code_dir, graph, model_counts)
+        try:
+            for prompt_index, model_choices, image_files in _generation_batches(runner, stale_items, code_dir):
+                prompt = PROMPT_DICT[prompt_index]
+                results = await runner.run_models_on_images_async(prompt["system_prompt"], prompt["user_prompt"],
+                                                                  model_choices=model_choices, image_files=image_files)
+                _count_results(model_counts, results)
+                _record_generation(runner, graph, prompt_index, results)
+        finally:
+            await runner.aclose()
 
-                model1_count += len(results.get("model1", []))
-                model2_count += len(results.get("model2", []))
+        return _report_generation(runner, work_items, code_dir, model_counts, resource_monitor)
+        
+    except Exception as e:
+        print(f"Error generating code: {e}")
+        return False
 
-        else:
-            # Test on the chosen prompt only
-            prompt = PROMPT_DICT[PROMPT_NUMBER]
-            system_prompt = prompt["system_prompt"]
-            user_prompt = prompt["user_prompt"]
+def _plan_generation(runner, shard):
+    from utils.sharding import build_work_items, select_shard, shard_code_dir
 
-            results = runner.run_both_models_on_images(system_prompt, user_prompt)
+    print(f"Generating code with {', '.join(spec.name for spec in runner.registry)}...")
 
-            model1_count = len(results.get("model1", []))
-            model2_count = len(results.get("model2", []))
+    # The (model, prompt, image) work list, cut down to this worker's shard
+    work_items = select_shard(build_work_items(runner.registry.choices, _prompt_indices(), runner.find_image_files()),
+                              shard)
+    if shard:
+        print(f"Shard {shard[0]}/{shard[1]}: {len(work_items)} work items, Ollama at {runner.ollama_base_url}")
+    return work_items, shard_code_dir(shard)
 
-        print(f"Model 1 ({MODEL_NAME_1}): {model1_count} files")
-        print(f"Model 2 ({MODEL_NAME_2}): {model2_count} files")
+def _prompt_indices():
+    # "All" tests every prompt; otherwise only the chosen one
+    return list(range(len(PROMPT_DICT))) if PROMPT_NUMBER == "All" else [PROMPT_NUMBER]
+
+def _generation_batches(runner, work_items, code_dir):
+    """
+    (prompt_index, model_choices, image_files) for every run of the models with one prompt; points the runner at the
+    output directory of the prompt before each run. Images are grouped by the models they still need, which is
+    all of them unless the work list is a shard.
+    """
+    for prompt_index in _prompt_indices():
+        _use_prompt_dir(runner, code_dir, prompt_index)
         
-        return model1_count > 0 and model2_count > 0
+        image_models = {}
+        for item in work_items:
+            if item.prompt_index == prompt_index:
+                image_models.setdefault(item.image_path, []).append(item.model_choice)
+        batches = {}
+        for image_path, model_choices in image_models.items():
+            batches.setdefault(tuple(sorted(model_choices)), []).append(image_path)
+        for model_choices, image_files in batches.items():
+            yield prompt_index, list(model_choices), image_files
+
+def _generation_graph(code_dir):
+    # The build graph of the generated code; None regenerates everything
+    from utils.build_graph import BuildGraph
+
+    return BuildGraph(str(Path(code_dir) / BUILD_GRAPH_FILE)) if INCREMENTAL_BUILD else None
+
+def _generation_inputs(runner, prompt_index, model_choice, image_path):
+    # Everything a generated file depends on: the prompt, the model's generation settings and the image
+    from utils.build_graph import digest, file_digest
+
+    image_digest = file_digest(str(image_path))
+    if image_digest is None:
+        return None
+    prompt = PROMPT_DICT[prompt_index]
+    spec = runner.registry.get(model_choice)
+    return digest(prompt["system_prompt"], prompt["user_prompt"], spec.name, spec.max_tokens, spec.temperature,
+                  image_digest)
+
+def _skip_fresh_work(runner, work_items, code_dir, graph, model_counts):
+    """
+    The work items whose code is missing or out of date. Up-to-date code is kept and counted in model_counts.
+    """
+    if graph is None:
+        return work_items
+    
+    stale_items = []
+    for item in work_items:
+        output_file = _output_file(runner, code_dir, item)
+        if graph.is_fresh(output_file, _generation_inputs(runner, item.prompt_index, item.model_choice, item.image_path)):
+            model_counts[item.model_choice] = model_counts.get(item.model_choice, 0) + 1
+        else:
+            stale_items.append(item)
+    if len(stale_items) < len(work_items):
+        print(f"Up to date: {len(work_items) - len(stale_items)} of {len(work_items)} generated files, "
+              f"regenerating {len(stale_items)}")
+    return stale_items
+
+def _output_file(runner, code_dir, item):
+    spec = runner.registry.get(item.model_choice)
+    return str(Path(_prompt_code_dir(code_dir, item.prompt_index)) / f"{Path(item.image_path).stem}_{spec.suffix}.jsx")
+
+def _record_generation(runner, graph, prompt_index, results):
+    # Failed generations are not recorded, so the next run tries them again
+    if graph is None:
+        return
+    for model_choice, model_results in results.items():
+        for result in model_results:
+            if result["success"]:
+                graph.record(result["output_file"],
+                             _generation_inputs(runner, prompt_index, model_choice, result["image_path"]))
+    graph.save()
+
+def _count_results(model_counts, results):
+    for model_choice, model_results in results.items():
+        model_counts[model_choice] = model_counts.get(model_choice, 0) + len(model_results)
+
+def _prompt_code_dir(code_dir, prompt_index):
+    # Code for different prompts goes to separate directories so that files are not overwritten
+    return str(Path(code_dir) / f"prompt_{prompt_index}") if len(_prompt_indices()) > 1 else code_dir
+
+def _use_prompt_dir(runner, code_dir, prompt_index):
+    runner.output_dir = _prompt_code_dir(code_dir, prompt_index)
+    Path(runner.output_dir).mkdir(parents=True, exist_ok=True)
+    return _prompt_id(prompt_index)
+
+def _prompt_id(prompt_index):
+    # The judge tags evaluations with the prompt id of their code directory
+    return str(prompt_index) if len(_prompt_indices()) > 1 else None
+
+def _report_generation(runner, work_items, code_dir, model_counts, resource_monitor=None):
+    for spec in runner.registry:
+        print(f"{spec.label} ({spec.name}): {model_counts.get(spec.choice, 0)} files")
+
+    endpoint_stats = runner.get_endpoint_stats()
+    if len(endpoint_stats) > 1:
+        for base_url, stats in endpoint_stats.items():
+            print(f"  {base_url}: {stats['requests']} requests, {stats['failures']} failed, "
+                  f"{stats['requests_per_second'] or 0:.2f} req/s, healthy: {stats['healthy']}")
+
+    concurrency = runner.get_concurrency_stats()
+    print(f"Generation concurrency: limit {concurrency['limit']} (peak {concurrency['peak_limit']}), "
+          f"{concurrency['decreases']} back-offs")
+    deadlines = runner.get_deadline_stats()
+    print(f"Deadline retries: {deadlines['deadline_retries']}, hedged requests: {deadlines['hedged_requests']} "
+          f"({deadlines['hedge_wins']} answered by the hedge)")
+    server_resources = _server_resources(runner, resource_monitor)
+    with open(Path(code_dir) / "generation_metrics.json", "w", encoding="utf-8") as f:
+        json.dump({"endpoints": endpoint_stats, "concurrency": concurrency, "deadlines": deadlines,
+                   "performance": runner.get_performance_stats(), "server_resources": server_resources}, f, indent=2)
+    
+    # A shard may hold work for only one of the models
+    planned_models = {item.model_choice for item in work_items}
+    return bool(planned_models) and all(model_counts.get(model, 0) > 0 for model in planned_models)
+
+def _server_resources(runner, resource_monitor):
+    # The Ollama server's CPU, RSS and threads next to the generation requests in flight at each sample
+    from utils.process_monitor import correlate_with_spans
+
+    if resource_monitor is None:
+        return {}
+    server_resources = correlate_with_spans(resource_monitor.samples, runner.performance.spans,
+                                            resource_monitor.cpu_count)
+    if server_resources:
+        print(f"Ollama server: peak CPU {server_resources['peak_cpu_percent']}% of "
+              f"{100 * server_resources['cpu_count']}%, peak RSS {server_resources['peak_rss_mb']} MB")
+        print("  CPU by requests in flight: " + ", ".join(
+            f"{in_flight}: {level['cpu_percent_mean']}%" for in_flight, level in server_resources["by_in_flight"].items()
+        ))
+    return server_resources
+
+def evaluate_with_llm_judge(shard=None):
+    from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+
+    print("Evaluating code with LLM as a Judge...")
+    
+    try:
+        judge = _make_judge(LLMAsJudgeRunner, shard)
+        if judge is None:
+            return None
         
+        return _check_evaluation_results(judge.evaluate_all_generated_code())
+            
     except Exception as e:
-        print(f"Error generating code: {e}")
-        return False
+        print(f"Error evaluating: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+async def evaluate_with_llm_judge_async(shard=None):
+    """
+    evaluate_with_llm_judge() with every judge request a coroutine of one event loop.
+    """
+    from model_runner.async_llm_as_a_judge_runner import AsyncLLMAsJudgeRunner
 
-def evaluate_with_llm_judge():
     print("Evaluating code with LLM as a Judge...")
     
     try:
-        judge = LLMAsJudgeRunner()
+        judge = _make_judge(AsyncLLMAsJudgeRunner, shard)
+        if judge is None:
+            return None
         
+        return _check_evaluation_results(await judge.evaluate_all_generated_code_async())
+            
+    except Exception as e:
+        print(f"Error evaluating: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def evaluate_sequentially(shard=None, ollama_base_url=None, resource_monitor=None):
+    """
+    Generate and judge the (prompt, image) cells of the work list in random order, updating paired tests
+    of the overall score for every pair of models after every judgment, and stop once each pair has a winner or a
+    difference known precisely enough. Returns the evaluation results like evaluate_with_llm_judge(); the tests are
+    saved as meta.sequential.
+    """
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from model_runner.ollama_models_runner import OllamaModelRunner
+    from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+    from utils.results_store import ResultsStore
+    from utils.sequential_testing import SequentialPairwiseTests
+
+    print("Generating and evaluating sequentially...")
+
+    try:
+        judge = _make_judge(LLMAsJudgeRunner, shard)
+        if judge is None:
+            return None
+        runner = OllamaModelRunner(ollama_base_url.split(",") if ollama_base_url else None)
+        work_items, code_dir = _plan_generation(runner, shard)
+
+        cells = sorted({(item.prompt_index, item.image_path) for item in work_items})
+        random.Random(SEQUENTIAL_SEED).shuffle(cells)
+        tests = SequentialPairwiseTests([spec.label for spec in runner.registry])
+        model_counts = {}
+        graph = _generation_graph(code_dir)
+        evaluated_images = set()
+        evaluated_cells = evaluated_items = 0
+
+        store = ResultsStore(judge.store_dir)
+        print(f"Run ID: {store.run_id}")
+        with store, ThreadPoolExecutor(max_workers=judge.concurrency_limiter.max_limit) as executor:
+            for start in range(0, len(cells), SEQUENTIAL_BATCH_SIZE):
+                batch = cells[start:start + SEQUENTIAL_BATCH_SIZE]
+                looks = {pair: test.looks for pair, test in tests.tests.items()}
+                # Only this shard's (model, cell) work items; up-to-date code is judged without generating it again
+                batch_cells = set(batch)
+                batch_items = [item for item in work_items if (item.prompt_index, item.image_path) in batch_cells]
+                stale_items = _skip_fresh_work(runner, batch_items, code_dir, graph, model_counts)
+                tasks = [(_prompt_id(item.prompt_index), Path(item.image_path), _output_file(runner, code_dir, item))
+                         for item in batch_items if item not in stale_items]
+                for prompt_index, model_choices, image_files in _generation_batches(runner, stale_items, code_dir):
+                    prompt = PROMPT_DICT[prompt_index]
+                    results = runner.run_models_on_images(prompt["system_prompt"], prompt["user_prompt"],
+                                                          model_choices=model_choices, image_files=image_files)
+                    _count_results(model_counts, results)
+                    _record_generation(runner, graph, prompt_index, results)
+                    for model_results in results.values():
+                        tasks.extend((_prompt_id(prompt_index), Path(result["image_path"]), result["output_file"])
+                                     for result in model_results)
+
+                for task, evaluation in zip(tasks, executor.map(judge.evaluate_task, tasks)):
+                    judge.store_evaluation(store, evaluation)
+                    tests.add(f"{task[0]}|{task[1].name}", evaluation)
+                    evaluated_images.add(task[1])
+                evaluated_cells += len(batch)
+                evaluated_items += len(batch_items)
+
+                for pair, test in tests.tests.items():
+                    look = test.last_look
+                    if test.looks > looks[pair]:
+                        print(f"{pair}, look {look['look']} after {look['n_pairs']} pairs: {look['leader']} leads by "
+                              f"{abs(look['mean_difference'])}, {1 - look['alpha']:.2%} CI "
+                              f"[{look['ci_low']}, {look['ci_high']}]")
+                if tests.stopped:
+                    break
+
+        _report_generation(runner, work_items, code_dir, model_counts, resource_monitor)
+
+        sequential = dict(tests.status(), cells_total=len(cells), cells_evaluated=evaluated_cells,
+                          cells_skipped=len(cells) - evaluated_cells,
+                          # Every skipped work item would have cost a generation and a judge request
+                          inference_calls_saved=2 * (len(work_items) - evaluated_items))
+        for pair, test in tests.tests.items():
+            decision = test.decision
+            if decision is None:
+                print(f"{pair}: undecided after {evaluated_cells} of {len(cells)} cells")
+            elif decision["reason"] == "winner":
+                print(f"{pair}: {decision['winner']} wins by {abs(decision['mean_difference'])} points, "
+                      f"CI [{decision['ci_low']}, {decision['ci_high']}] after {decision['n_pairs']} pairs")
+            else:
+                print(f"{pair}: score difference known within {SEQUENTIAL_CI_WIDTH} points after {decision['n_pairs']} pairs")
+        if len(cells) > evaluated_cells:
+            print(f"Skipped {sequential['cells_skipped']} cells, {sequential['inference_calls_saved']} inference calls saved")
+
+        return _check_evaluation_results(judge.finish_run(store, sorted(evaluated_images),
+                                                          extra_meta={"sequential": sequential}))
+
+    except Exception as e:
+        print(f"Error evaluating sequentially: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def sweep_prompts(ollama_base_url=None, resource_monitor=None):
+    """
+    Find the best prompt of PROMPT_DICT by successive halving: all prompts are generated and judged on a few
+    images, the better half goes on to twice the images, and so on. The rounds are saved to prompt_sweep.json
+    in SWEEP_RESULTS_PATH, next to the results index of the sweep's evaluations.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from model_runner.ollama_models_runner import OllamaModelRunner
+    from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+    from utils.results_store import ResultsStore
+    from utils.prompt_sweep import SuccessiveHalvingSweep
+
+    try:
+        code_dir = str(Path(GENERATED_CODE_DIR) / "prompt_sweep")
+        judge = LLMAsJudgeRunner(code_dir=code_dir, results_dir=SWEEP_RESULTS_PATH)
         if not judge.api_key:
             print("ANTHROPIC_API_KEY is not installed in the environment")
             return None
-        
-        evaluation_results = judge.evaluate_all_generated_code()
-        
-        if evaluation_results:
-            total_evaluations = evaluation_results.get("meta", {}).get("total_evaluations", 0)
-            print(f"Evaluation completed: {total_evaluations} results")
-            return evaluation_results
-        else:
-            print("Error: Failed to retrieve evaluation results")
+        runner = OllamaModelRunner(ollama_base_url.split(",") if ollama_base_url else None)
+
+        sweep = SuccessiveHalvingSweep(list(range(len(PROMPT_DICT))), runner.find_image_files())
+        print(f"Sweeping {len(PROMPT_DICT)} prompts over up to {len(sweep.image_paths)} images, "
+              f"starting with {sweep.initial_images}")
+        model_counts = {}
+        evaluated_images = set()
+
+        store = ResultsStore(judge.store_dir)
+        with store, ThreadPoolExecutor(max_workers=judge.concurrency_limiter.max_limit) as executor:
+            while True:
+                tasks = []
+                for prompt_index, image_files in sweep.round_work().items():
+                    if not image_files:
+                        continue
+                    prompt = PROMPT_DICT[prompt_index]
+                    # Every prompt gets its own directory, whatever PROMPT_NUMBER says
+                    runner.output_dir = str(Path(code_dir) / f"prompt_{prompt_index}")
+                    Path(runner.output_dir).mkdir(parents=True, exist_ok=True)
+                    # Every registered model runs on the round's images at once, sharing their payloads
+                    results = runner.run_models_on_images(prompt["system_prompt"], prompt["user_prompt"],
+                                                          image_files=image_files)
+                    _count_results(model_counts, results)
+                    for model_results in results.values():
+                        tasks.extend((str(prompt_index), Path(result["image_path"]), result["output_file"])
+                                     for result in model_results)
+
+                for task, evaluation in zip(tasks, executor.map(judge.evaluate_task, tasks)):
+                    judge.store_evaluation(store, evaluation)
+                    sweep.record(int(task[0]), str(task[1]), evaluation)
+                    evaluated_images.add(task[1])
+
+                round_result = sweep.finish_round()
+                print(f"Round {round_result['round']}: {round_result['prompts']} prompts on {round_result['images']} "
+                      f"images, kept prompts {', '.join(round_result['kept'])}")
+                if sweep.finished:
+                    break
+
+        # The sweep has no fixed work list; only the generation metrics are reported
+        _report_generation(runner, [], code_dir, model_counts, resource_monitor)
+        report = sweep.report(models=len(runner.registry))
+        results = judge.finish_run(store, sorted(evaluated_images), extra_meta={"prompt_sweep": report})
+
+        report_path = Path(SWEEP_RESULTS_PATH) / "prompt_sweep.json"
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Best prompt: {report['best_prompt']} ({report['inference_calls']} inference calls, "
+              f"{report['inference_calls_saved']} fewer than running every prompt on every image)")
+        print(f"Sweep rounds are saved to {report_path}")
+        return results
+
+    except Exception as e:
+        print(f"Error sweeping prompts: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def benchmark_models(ollama_base_url=None, resource_monitor=None):
+    """
+    Run every registered model and its variants over the dataset, one model at a time and each starting unloaded,
+    then judge all of their code. The load time, time to first token, latency, tokens/s and peak Ollama memory of
+    each model are saved as meta.model_performance, and the comparison report gets the quality/latency frontier.
+    Code and results go to the benchmark directories, away from the regular runs.
+    """
+    from config.model_registry import ModelRegistry
+    from model_runner.ollama_models_runner import OllamaModelRunner
+    from model_runner.llm_as_a_judge_runner import LLMAsJudgeRunner
+    from utils.process_monitor import ProcessTreeMonitor
+
+    try:
+        # The concurrency cap gives every model its own limiter, so each is measured without queueing
+        registry = ModelRegistry([spec.copy(concurrency=MODEL_BENCHMARK_CONCURRENCY)
+                                  for spec in get_model_registry().with_variants()])
+        code_dir = str(Path(GENERATED_CODE_DIR) / "benchmark")
+        judge = LLMAsJudgeRunner(code_dir=code_dir, results_dir=MODEL_BENCHMARK_RESULTS_PATH, registry=registry)
+        if not judge.api_key:
+            print("ANTHROPIC_API_KEY is not installed in the environment")
             return None
-            
+        runner = OllamaModelRunner(ollama_base_url.split(",") if ollama_base_url else None, registry=registry)
+        image_files = runner.find_image_files()
+        print(f"Benchmarking {len(registry)} models on {len(image_files)} images")
+
+        model_performance = {}
+        model_counts = {}
+        for spec in registry:
+            runner.unload_models()
+            started = time.time()
+            with ProcessTreeMonitor(resource_monitor.pid if resource_monitor else None,
+                                    interval=MODEL_BENCHMARK_MEMORY_INTERVAL) as memory:
+                for prompt_index in _prompt_indices():
+                    _use_prompt_dir(runner, code_dir, prompt_index)
+                    prompt = PROMPT_DICT[prompt_index]
+                    results = runner.run_model_on_images(prompt["system_prompt"], prompt["user_prompt"],
+                                                         model_choice=spec.choice, image_files=image_files)
+                    model_counts[spec.choice] = model_counts.get(spec.choice, 0) + len(results)
+            model_performance[spec.label] = dict(runner.performance.model_stats(spec.name),
+                                                 wall_seconds=round(time.time() - started, 1),
+                                                 peak_memory_bytes=memory.peak_rss_bytes)
+            print(f"{spec.label} ({spec.name}): {model_performance[spec.label]}")
+        runner.unload_models()
+
+        _report_generation(runner, [], code_dir, model_counts, resource_monitor)
+        return _check_evaluation_results(judge.evaluate_all_generated_code(
+            extra_meta={"model_performance": model_performance}
+        ))
+
     except Exception as e:
-        print(f"Error evaluating: {e}")
+        print(f"Error benchmarking models: {e}")
         import traceback
         traceback.print_exc()
         return None
 
+def _make_judge(judge_class, shard):
+    from utils.sharding import shard_code_dir, shard_results_dir
+
+    if shard:
+        judge = judge_class(code_dir=shard_code_dir(shard), results_dir=shard_results_dir(shard))
+    else:
+        judge = judge_class()
+    
+    if not judge.api_key:
+        print("ANTHROPIC_API_KEY is not installed in the environment")
+        return None
+    return judge
+
+def _check_evaluation_results(evaluation_results):
+    if evaluation_results:
+        total_evaluations = evaluation_results.get("meta", {}).get("total_evaluations", 0)
+        print(f"Evaluation completed: {total_evaluations} results")
+        return evaluation_results
+    else:
+        print("Error: Failed to retrieve evaluation results")
+        return None
+
 def generate_model_comparison_report(evaluation_results):
+    import numpy as np
+    from utils.score_aggregator import ScoreTensor
+    from utils.significance import compare_models_paired, holm_adjust
+    from utils.model_tradeoff import build_tradeoff
+
     print("Generating model comparison report...")
     
-    if not evaluation_results or "detailed_results" not in evaluation_results:
+    if not evaluation_results or ("detailed_results" not in evaluation_results
+                                  and "results_store" not in evaluation_results.get("meta", {})):
         return {"error": "No data to analyze"}
     
-    detailed_results = evaluation_results["detailed_results"]
+    # Zero overall scores are treated as failed generations and left out of the averages
+    scores = ScoreTensor.from_evaluations(
+        iter_detailed_results(evaluation_results),
+        is_successful=lambda r: "error" not in r and r.get("overall_score", 0) > 0
+    )
     
-    model1_results = []
-    model2_results = []
+    # The registry recorded with the run names its models; older runs fall back to the current registry
+    run_models = evaluation_results.get("meta", {}).get("models")
+    display_names = {model["label"]: model["name"] for model in run_models} if run_models else MODEL_DISPLAY_NAMES
+    suffixes = {model["label"]: model["suffix"] for model in run_models or []}
     
-    for result in detailed_results:
-        if "error" in result:
-            continue
-            
-        model_name = result.get("meta", {}).get("model_name", "")
-        if "Model 1" in model_name or "model1" in model_name.lower():
-            model1_results.append(result)
-        elif "Model 2" in model_name or "model2" in model_name.lower():
-            model2_results.append(result)
+    def report_key(label):
+        return suffixes.get(label) or model_key(label)
+    model_labels = list(display_names) + [m for m in scores.models if m not in display_names]
+    model_stats = scores.describe(("model",))
     
-    def calculate_model_stats(results, model_name):
-        if not results:
+    def calculate_model_stats(model_label):
+        model_name = display_names.get(model_label, model_label)
+        if model_label not in scores.models:
             return {
                 "model_name": model_name,
                 "count": 0,
@@ -136,106 +597,135 @@ def generate_model_comparison_report(evaluation_results):
                 "successful_evaluations": 0
             }
         
-        successful_results = [r for r in results if "error" not in r and r.get("overall_score", 0) > 0]
+        m = scores.models.index(model_label)
+        count = scores.evaluation_counts[model_label] - scores.error_counts.get(model_label, 0)
+        successful = int(scores.present[m].sum())
         
-        if not successful_results:
+        if not successful:
             return {
                 "model_name": model_name,
-                "count": len(results),
+                "count": count,
                 "average_overall_score": 0,
                 "average_criteria_scores": {},
                 "successful_evaluations": 0
             }
         
-        avg_overall = sum(r.get("overall_score", 0) for r in successful_results) / len(successful_results)
-        
-        criteria_scores = {}
-        criteria_names = ["element_detection", "structural_accuracy", "layout_accuracy", "code_quality", "completeness"]
-        
-        for criterion in criteria_names:
-            scores = []
-            for result in successful_results:
-                if criterion in result:
-                    score = result[criterion].get("score", 0)
-                    scores.append(score)
-            
-            if scores:
-                criteria_scores[criterion] = sum(scores) / len(scores)
-            else:
-                criteria_scores[criterion] = 0
+        means = {criterion: float(np.nan_to_num(model_stats["mean"][m, c])) for c, criterion in enumerate(scores.criteria)}
         
         return {
             "model_name": model_name,
-            "count": len(results),
-            "successful_evaluations": len(successful_results),
-            "average_overall_score": round(avg_overall, 2),
-            "average_criteria_scores": {k: round(v, 2) for k, v in criteria_scores.items()}
+            "count": count,
+            "successful_evaluations": successful,
+            "average_overall_score": round(means.pop("overall_score"), 2),
+            "average_criteria_scores": {k: round(v, 2) for k, v in means.items()}
         }
     
-    model1_stats = calculate_model_stats(model1_results, MODEL_NAME_1)
-    model2_stats = calculate_model_stats(model2_results, MODEL_NAME_2)
+    all_model_stats = {report_key(label): calculate_model_stats(label) for label in model_labels}
     
-    model1_score = model1_stats["average_overall_score"]
-    model2_score = model2_stats["average_overall_score"]
+    evaluated_labels = [label for m, label in enumerate(scores.models) if scores.present[m].any()]
+    ranked_labels = sorted(evaluated_labels, key=lambda label: all_model_stats[report_key(label)]["average_overall_score"],
+                           reverse=True)
     
-    if model1_score > model2_score:
-        winner = MODEL_NAME_1
-        winner_score = model1_score
-    elif model2_score > model1_score:
-        winner = MODEL_NAME_2
-        winner_score = model2_score
-    else:
-        winner = "Tie"
-        winner_score = model1_score
+    def display_name(label):
+        return display_names.get(label, label)
+    
+    # Paired bootstrap CIs, permutation tests and effect sizes for every pair of models, on the same (prompt, image) cells
+    statistical_comparison = {}
+    pairwise = {}
+    for i, label_a in enumerate(ranked_labels):
+        for label_b in ranked_labels[i + 1:]:
+            pair_stats = compare_models_paired(scores, label_a, label_b)
+            statistical_comparison[f"{display_name(label_a)} vs {display_name(label_b)}"] = pair_stats
+            pairwise[(label_a, label_b)] = pair_stats
+    # Significance is judged over all pairs and criteria together (Holm), not test by test
+    holm_adjust(statistical_comparison)
+    
+    def significantly_better(label, criterion):
+        # True when the model beats every other evaluated model on the criterion with a significant paired difference
+        others = [other for other in ranked_labels if other != label]
+        for other in others:
+            if (label, other) in pairwise:
+                stats, sign = pairwise[(label, other)][criterion], 1
+            else:
+                stats, sign = pairwise[(other, label)][criterion], -1
+            if not stats["significant"] or sign * stats["mean_difference"] <= 0:
+                return False
+        return bool(others)
     
+    winner = "Tie"
+    winner_score = 0
     recommendations = []
-    if abs(model1_score - model2_score) < 0.5:
-        recommendations.append("Both models show comparable results")
-        recommendations.append("Model selection may depend on specific requirements")
+    if not ranked_labels:
+        recommendations.append("No successful evaluations to compare")
+    elif len(ranked_labels) == 1:
+        winner = display_name(ranked_labels[0])
+        winner_score = all_model_stats[report_key(ranked_labels[0])]["average_overall_score"]
+        recommendations.append(f"Only {winner} has successful evaluations, so no statistical comparison is possible")
     else:
-        recommendations.append(f"Model {winner} shows significantly better results")
-        recommendations.append(f"It is recommended to use {winner} for UI code generation")
-
-    model1_strengths = []
-    model2_strengths = []
-    
-    for criterion in model1_stats["average_criteria_scores"]:
-        score1 = model1_stats["average_criteria_scores"][criterion]
-        score2 = model2_stats["average_criteria_scores"][criterion]
+        top_label, runner_up_label = ranked_labels[0], ranked_labels[1]
+        winner_score = all_model_stats[report_key(top_label)]["average_overall_score"]
+        overall = pairwise[(top_label, runner_up_label)]["overall_score"]
         
-        if score1 > score2 + 0.2:
-            model1_strengths.append(f"{criterion}: {score1} vs {score2}")
-        elif score2 > score1 + 0.2:
-            model2_strengths.append(f"{criterion}: {score2} vs {score1}")
+        if significantly_better(top_label, "overall_score"):
+            winner = display_name(top_label)
+            recommendations.append(
+                f"Model {winner} shows significantly better results "
+                f"(+{overall['mean_difference']} over {display_name(runner_up_label)}, "
+                f"{1 - SIGNIFICANCE_ALPHA:.0%} CI [{overall['ci_low']}, {overall['ci_high']}], "
+                f"Holm-adjusted p = {overall['p_adjusted']})"
+            )
+            recommendations.append(f"It is recommended to use {winner} for UI code generation")
+        else:
+            recommendations.append(
+                f"No statistically significant difference in overall score "
+                f"(Holm-adjusted p = {overall.get('p_adjusted', 'N/A')} over {overall['n_pairs']} paired images)"
+            )
+            recommendations.append("Model selection may depend on specific requirements, or more images are needed")
+
+    model_strengths = {stats["model_name"]: [] for stats in all_model_stats.values()}
+    for criterion in JUDGE_CRITERIA:
+        for label in ranked_labels:
+            if significantly_better(label, criterion):
+                score = all_model_stats[report_key(label)]["average_criteria_scores"][criterion]
+                others = [str(all_model_stats[report_key(other)]["average_criteria_scores"].get(criterion, 0))
+                          for other in ranked_labels if other != label]
+                model_strengths[display_name(label)].append(f"{criterion}: {score} vs {' / '.join(others)}")
     
     comparison_report = {
         "evaluation_summary": {
             "total_images_evaluated": evaluation_results.get("meta", {}).get("total_images", 0),
-            "total_evaluations": len(detailed_results),
-            "successful_evaluations": model1_stats["successful_evaluations"] + model2_stats["successful_evaluations"],
+            "total_evaluations": scores.total_evaluations,
+            "successful_evaluations": scores.successful_evaluations,
             "winner": winner,
-            "winner_score": winner_score
-        },
-        "model_comparison": {
-            "model1": model1_stats,
-            "model2": model2_stats
-        },
-        "model_strengths": {
-            MODEL_NAME_1: model1_strengths,
-            MODEL_NAME_2: model2_strengths
+            "winner_score": winner_score,
+            "judge_stats": evaluation_results.get("meta", {}).get("judge_stats", {})
         },
+        "model_comparison": all_model_stats,
+        "model_strengths": model_strengths,
+        "statistical_comparison": statistical_comparison,
         "recommendations": recommendations,
-        "raw_evaluation_data": evaluation_results
+        # Raw evaluations are not copied into the report; they are referenced by run
+        "source_run": {
+            "run_id": evaluation_results.get("meta", {}).get("run_id"),
+            "results_store": evaluation_results.get("meta", {}).get("results_store"),
+            "evaluation_results": evaluation_results.get("meta", {}).get("results_file", EVALUATION_RESULTS_JSON_PATH)
+        }
     }
     
+    model_performance = evaluation_results.get("meta", {}).get("model_performance")
+    if model_performance:
+        comparison_report["quality_latency_tradeoff"] = build_tradeoff(
+            model_performance, {label: all_model_stats[report_key(label)] for label in model_labels}, run_models
+        )
+    
     return comparison_report
 
 
-def save_comparison_report(report):
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    report_filename = f"model_comparison_report_{timestamp}.json"
+def save_comparison_report(report, results_dir=None):
+    run_id = report.get("source_run", {}).get("run_id") or time.strftime("%Y%m%d_%H%M%S")
+    report_filename = f"model_comparison_report_{run_id}.json"
     
-    results_dir = Path(EVALUATION_RESULTS_PATH)
+    results_dir = Path(results_dir or EVALUATION_RESULTS_PATH)
     results_dir.mkdir(parents=True, exist_ok=True)
     
     report_path = results_dir / report_filename
@@ -251,14 +741,32 @@ def save_comparison_report(report):
         return None
 
 
+def load_comparison_report(report_path=None):
+    # Without a path, the most recent comparison report in the results directory is used
+    if report_path is None:
+        reports = sorted(Path(EVALUATION_RESULTS_PATH).glob("model_comparison_report_*.json"),
+                         key=lambda path: path.stat().st_mtime)
+        if not reports:
+            print(f"No comparison reports found in {EVALUATION_RESULTS_PATH}")
+            return None
+        report_path = reports[-1]
+    
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        print(f"Report: {report_path}")
+        return report
+    except Exception as e:
+        print(f"Error loading report {report_path}: {e}")
+        return None
+
+
 def print_summary(report):
     if "error" in report:
         print(f"\nError: {report['error']}")
         return
     
     summary = report.get("evaluation_summary", {})
-    model1_data = report.get("model_comparison", {}).get("model1", {})
-    model2_data = report.get("model_comparison", {}).get("model2", {})
     
     print("\n" + "=" * 70)
     print("Model comparison summary:")
@@ -267,13 +775,17 @@ def print_summary(report):
     print(f"Total images evaluated: {summary.get('total_images_evaluated', 0)}")
     print(f"Successful evaluations: {summary.get('successful_evaluations', 0)}")
 
-    print(f"\n{MODEL_NAME_1}:")
-    print(f"Average score: {model1_data.get('average_overall_score', 0)}/10")
-    print(f"Successful evaluations: {model1_data.get('successful_evaluations', 0)}")
+    judge_stats = summary.get("judge_stats", {})
+    if judge_stats:
+        print(f"Judge mode: {judge_stats.get('mode', 'N/A')}")
+        print(f"Parse failures: {judge_stats.get('parse_failures', 0)} of {judge_stats.get('judge_requests', 0)} judge requests")
+        print(f"Re-judge rate: {judge_stats.get('rejudge_rate', 0):.1%} "
+              f"({judge_stats.get('rejudged_evaluations', 0)} of {judge_stats.get('evaluations', 0)} evaluations)")
 
-    print(f"\n{MODEL_NAME_2}:")
-    print(f"Average score: {model2_data.get('average_overall_score', 0)}/10")
-    print(f"Successful evaluations: {model2_data.get('successful_evaluations', 0)}")
+    for model_data in report.get("model_comparison", {}).values():
+        print(f"\n{model_data.get('model_name', 'Unknown')}:")
+        print(f"Average score: {model_data.get('average_overall_score', 0)}/10")
+        print(f"Successful evaluations: {model_data.get('successful_evaluations', 0)}")
 
     winner = summary.get("winner", "Неопределено")
     if winner != "Tie":
@@ -281,6 +793,34 @@ def print_summary(report):
     else:
         print(f"\nResult: Tie")
     
+    statistical_comparison = report.get("statistical_comparison", {})
+    if statistical_comparison:
+        print(f"\nPaired comparison ({1 - SIGNIFICANCE_ALPHA:.0%} bootstrap CI, permutation p-value, "
+              f"Holm-adjusted p-value, effect size dz; * - significant after adjustment):")
+        for pair_name, pair_stats in statistical_comparison.items():
+            tested = {criterion: stats for criterion, stats in pair_stats.items() if stats.get("n_pairs")}
+            if not tested:
+                continue
+            print(f"  {pair_name}:")
+            for criterion, stats in tested.items():
+                marker = " *" if stats["significant"] else ""
+                effect_size = stats["effect_size"] if stats["effect_size"] is not None else "N/A"
+                print(f"    {criterion}: {stats['mean_difference']:+} [{stats['ci_low']}, {stats['ci_high']}], "
+                      f"p = {stats['p_value']}, p_adj = {stats.get('p_adjusted', 'N/A')}, "
+                      f"dz = {effect_size}{marker}")
+
+    tradeoff = report.get("quality_latency_tradeoff")
+    if tradeoff:
+        print(f"\nQuality vs latency ({tradeoff['latency_metric']}; * - on the Pareto frontier):")
+        for label, row in tradeoff["models"].items():
+            marker = " *" if row["on_frontier"] else ""
+            memory = f"{row['peak_memory_mb']} MB" if row["peak_memory_mb"] is not None else "N/A"
+            print(f"  {row['model_name']}: {row['average_overall_score']}/10, latency {row['latency_p50']}s, "
+                  f"TTFT {row['time_to_first_token_p50']}s, {row['tokens_per_second']} tok/s, "
+                  f"load {row['load_seconds']}s, peak memory {memory}{marker}")
+        for family, frontier in tradeoff["pareto_frontier_by_model"].items():
+            print(f"  Frontier of {family}: {' -> '.join(tradeoff['models'][label]['model_name'] for label in frontier)}")
+
     recommendations = report.get("recommendations", [])
     if recommendations:
         print(f"\nRecommendations:")
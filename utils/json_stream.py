@@ -0,0 +1,142 @@
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+"""
+Incremental reading of large JSON result files.
+Only the value currently being decoded is held in memory, so a results file with an inline
+"detailed_results" array can be summarised or iterated without loading the whole array.
+"""
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+class JsonStreamReader:
+
+    def __init__(self, file, chunk_size: int = 1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has already been consumed before growing the buffer
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON input")
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found}'")
+        self.position += 1
+
+    def read_value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The value continues past the buffered text
+                if not self._fill():
+                    raise
+                continue
+            # A number followed only by buffered number characters may continue in the next chunk: a chunk ending
+            # at "12." or "1" (before "e5") decodes as 12 or 1
+            if isinstance(value, (int, float)) and not self.eof and \
+                    all(char in _NUMBER_CHARS for char in self.buffer[end:]):
+                self._fill()
+                continue
+            self.position = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.read_value()
+            separator = self._peek()
+            self.position += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' but found '{separator}'")
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Yield the keys of an object one by one; the caller reads or skips each value before the next key.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            separator = self._peek()
+            self.position += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' but found '{separator}'")
+
+    def skip_value(self):
+        if self._peek() == "[":
+            for _ in self.iter_array():
+                pass
+        else:
+            self.read_value()
+
+
+def load_json_skipping(path: str, skip_keys: Iterable[str]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Load a top-level JSON object without materialising the values of skip_keys.
+    Returns the loaded object and the list of skipped keys that were present.
+    """
+    skip_keys = set(skip_keys)
+    result: Dict[str, Any] = {}
+    streamed = []
+
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f)
+        for key in reader.iter_object():
+            if key in skip_keys:
+                reader.skip_value()
+                streamed.append(key)
+            else:
+                result[key] = reader.read_value()
+
+    return result, streamed
+
+
+def iter_json_array(path: str, key: str) -> Iterator[Any]:
+    """
+    Stream the items of the array stored under a top-level key.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = JsonStreamReader(f)
+        for found_key in reader.iter_object():
+            if found_key == key:
+                yield from reader.iter_array()
+                return
+            reader.skip_value()
@@ -0,0 +1,188 @@
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Any, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import JUDGE_CRITERIA, JUDGE_SCORE_MIN, JUDGE_SCORE_MAX
+
+
+JUDGE_TOOL_NAME = "submit_evaluation"
+
+
+def build_judge_tool() -> Dict[str, Any]:
+    """
+    Tool definition whose input schema mirrors the judge's JSON response format,
+    so that in tool mode the scores arrive as structured input instead of free text.
+    """
+    score_schema = {"type": "number", "minimum": JUDGE_SCORE_MIN, "maximum": JUDGE_SCORE_MAX}
+    criterion_schema = {
+        "type": "object",
+        "properties": {
+            "score": score_schema,
+            "explanation": {"type": "string"}
+        },
+        "required": ["score", "explanation"]
+    }
+
+    properties = {criterion: criterion_schema for criterion in JUDGE_CRITERIA}
+    properties.update({
+        "overall_score": score_schema,
+        "summary": {"type": "string", "description": "Brief overall assessment"},
+        "strengths": {"type": "array", "items": {"type": "string"}},
+        "weaknesses": {"type": "array", "items": {"type": "string"}}
+    })
+
+    return {
+        "name": JUDGE_TOOL_NAME,
+        "description": "Submit the evaluation of how well the generated React code matches the mobile UI screenshot.",
+        "input_schema": {
+            "type": "object",
+            "properties": properties,
+            "required": JUDGE_CRITERIA + ["overall_score", "summary", "strengths", "weaknesses"]
+        }
+    }
+
+
+def validate_judge_evaluation(evaluation: Any) -> List[str]:
+    """
+    Check a parsed judge response against the score schema.
+    Returns the list of problems found; an empty list means the evaluation is usable.
+    """
+    if not isinstance(evaluation, dict):
+        return [f"expected a JSON object, got {type(evaluation).__name__}"]
+
+    problems = []
+
+    def check_score(value, field_name):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            problems.append(f"'{field_name}' must be a number")
+        elif not JUDGE_SCORE_MIN <= value <= JUDGE_SCORE_MAX:
+            problems.append(f"'{field_name}' must be between {JUDGE_SCORE_MIN} and {JUDGE_SCORE_MAX}")
+
+    for criterion in JUDGE_CRITERIA:
+        criterion_data = evaluation.get(criterion)
+        if criterion_data is None:
+            problems.append(f"missing '{criterion}'")
+            continue
+        if not isinstance(criterion_data, dict):
+            problems.append(f"'{criterion}' must be an object with 'score' and 'explanation'")
+            continue
+        if "score" not in criterion_data:
+            problems.append(f"missing '{criterion}.score'")
+        else:
+            check_score(criterion_data["score"], f"{criterion}.score")
+        if not isinstance(criterion_data.get("explanation", ""), str):
+            problems.append(f"'{criterion}.explanation' must be a string")
+
+    if "overall_score" not in evaluation:
+        problems.append("missing 'overall_score'")
+    else:
+        check_score(evaluation["overall_score"], "overall_score")
+
+    for list_field in ["strengths", "weaknesses"]:
+        if list_field in evaluation and not isinstance(evaluation[list_field], list):
+            problems.append(f"'{list_field}' must be a list")
+
+    return problems
+
+
+class JudgeResponseParser:
+    """
+    Incremental extractor for the judge's JSON object.
+    Text chunks are fed as they arrive from the stream; top-level {...} objects are
+    detected by tracking brace depth outside of string literals, so prose or markdown
+    fences around the JSON do not matter and a cut-off object is reported as truncated.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.evaluation: Optional[Dict[str, Any]] = None
+        self.problems: List[str] = []
+
+        self._position = 0
+        self._depth = 0
+        self._object_start = -1
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """
+        Consume the next piece of the response.
+        Returns the evaluation as soon as a complete object that passes validation has been seen.
+        """
+        self.text += chunk
+
+        text = self.text
+        for position in range(self._position, len(text)):
+            char = text[position]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"' and self._depth > 0:
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = position
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._accept_candidate(text[self._object_start:position + 1])
+                    self._object_start = -1
+
+        self._position = len(text)
+        return self.evaluation
+
+    def _accept_candidate(self, candidate: str):
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            self.problems = [f"invalid JSON: {e.msg}"]
+            return
+
+        problems = validate_judge_evaluation(parsed)
+        # Keep the first schema-valid object; otherwise remember the latest candidate's problems
+        if self.evaluation is None:
+            if problems:
+                self.problems = problems
+            else:
+                self.evaluation = parsed
+                self.problems = []
+
+    @property
+    def is_complete(self) -> bool:
+        return self.evaluation is not None
+
+    @property
+    def is_truncated(self) -> bool:
+        return self.evaluation is None and self._depth > 0
+
+    def finish(self, stop_reason: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """
+        Close the stream and return (evaluation, problems).
+        """
+        if self.evaluation is not None:
+            return self.evaluation, []
+
+        if self.is_truncated or stop_reason == "max_tokens":
+            return None, ["the response was truncated by the token limit before the JSON object was complete"]
+
+        if self.problems:
+            return None, self.problems
+
+        return None, ["no JSON object found in the response"]
+
+
+def parse_judge_response(response_text: str, stop_reason: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    parser = JudgeResponseParser()
+    parser.feed(response_text)
+    return parser.finish(stop_reason)
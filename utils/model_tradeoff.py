@@ -0,0 +1,76 @@
+import os
+import sys
+from typing import Dict, List, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+Quality against latency for the models of a benchmark run (main.py benchmark). A model is on the Pareto frontier
+when no other model is at least as good and at least as fast, and strictly better or faster.
+The frontier is found for all models together and for each registered model with its variants.
+"""
+
+LATENCY_METRIC = "latency_p50"
+
+
+def pareto_frontier(points: Dict[str, Dict[str, float]], quality_key: str = "quality",
+                    latency_key: str = "latency") -> List[str]:
+    """
+    Labels of the non-dominated points, fastest first. Sorted by latency, a point is on the frontier exactly
+    when its quality beats every faster point's.
+    """
+    ranked = sorted(points, key=lambda label: (points[label][latency_key], -points[label][quality_key]))
+    frontier = []
+    best_quality = None
+    for label in ranked:
+        quality = points[label][quality_key]
+        if best_quality is None or quality > best_quality:
+            frontier.append(label)
+            best_quality = quality
+    return frontier
+
+
+def build_tradeoff(model_performance: Dict[str, Dict[str, Any]], model_stats: Dict[str, Dict[str, Any]],
+                   models: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    model_performance: label -> speed and memory of the model's generations; model_stats: label -> the comparison
+    report's model statistics; models: the registry recorded with the run, for the model families.
+    """
+    families = {model["label"]: model.get("family") or model["label"] for model in models or []}
+
+    rows = {}
+    for label, performance in model_performance.items():
+        stats = model_stats.get(label, {})
+        peak_memory = performance.get("peak_memory_bytes")
+        rows[label] = {
+            "model_name": stats.get("model_name", label),
+            "family": families.get(label, label),
+            "average_overall_score": stats.get("average_overall_score", 0),
+            "successful_evaluations": stats.get("successful_evaluations", 0),
+            "load_seconds": performance.get("load_seconds"),
+            "time_to_first_token_p50": performance.get("time_to_first_token_p50"),
+            "latency_p50": performance.get("latency_p50"),
+            "latency_p95": performance.get("latency_p95"),
+            "tokens_per_second": performance.get("tokens_per_second"),
+            "peak_memory_mb": round(peak_memory / 2 ** 20, 1) if peak_memory else None,
+            "wall_seconds": performance.get("wall_seconds")
+        }
+
+    # Only models with judged code and a measured latency can be placed
+    points = {label: {"quality": row["average_overall_score"], "latency": row[LATENCY_METRIC]}
+              for label, row in rows.items() if row["successful_evaluations"] and row[LATENCY_METRIC] is not None}
+    frontier = pareto_frontier(points)
+    frontier_by_model = {}
+    for family in dict.fromkeys(row["family"] for row in rows.values()):
+        frontier_by_model[family] = pareto_frontier({label: point for label, point in points.items()
+                                                     if rows[label]["family"] == family})
+    for label, row in rows.items():
+        row["on_frontier"] = label in frontier
+
+    return {
+        "quality_metric": "average_overall_score",
+        "latency_metric": LATENCY_METRIC,
+        "models": rows,
+        "pareto_frontier": frontier,
+        "pareto_frontier_by_model": frontier_by_model
+    }
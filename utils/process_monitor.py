@@ -0,0 +1,185 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import OLLAMA_MONITOR_INTERVAL
+
+"""
+Resource use of the local Ollama server while models run. Ollama serves every loaded model from a runner
+subprocess, so the server is its whole process tree. psutil is optional: without it, or when the server runs on
+another machine, nothing is measured.
+"""
+
+
+def ollama_server_processes(pid: Optional[int] = None) -> List:
+    """
+    The Ollama server process (pid, or every local process called ollama whose parent is not one).
+    """
+    try:
+        import psutil
+    except ImportError:
+        return []
+
+    if pid is not None:
+        try:
+            return [psutil.Process(pid)]
+        except psutil.Error:
+            return []
+
+    servers = []
+    for process in psutil.process_iter(["name"]):
+        try:
+            parent = process.parent()
+            if "ollama" in (process.info["name"] or "") and not (parent and "ollama" in parent.name()):
+                servers.append(process)
+        except psutil.Error:
+            continue
+    return servers
+
+
+class ProcessTreeMonitor:
+    """
+    Samples CPU, RSS, thread and process counts of the Ollama server's process tree on a background thread,
+    every interval seconds between start() and stop() (or while the with block runs). CPU is in percent of one
+    core, summed over the tree, so a saturated 8-core machine reads about 800.
+    """
+
+    def __init__(self, pid: Optional[int] = None, interval: float = OLLAMA_MONITOR_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[Dict[str, float]] = []
+        self.cpu_count = None
+        self._processes: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def peak_rss_bytes(self) -> Optional[int]:
+        with self._lock:
+            return max((sample["rss_bytes"] for sample in self.samples), default=None)
+
+    def start(self) -> "ProcessTreeMonitor":
+        roots = ollama_server_processes(self.pid)
+        if roots and self._thread is None:
+            import psutil
+            self.cpu_count = psutil.cpu_count()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(roots,), name="ollama-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "ProcessTreeMonitor":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self, roots: List):
+        while True:
+            sample = self._sample(roots)
+            if sample is not None:
+                with self._lock:
+                    self.samples.append(sample)
+            if self._stop.wait(self.interval):
+                return
+
+    def _sample(self, roots: List) -> Optional[Dict[str, float]]:
+        import psutil
+
+        tree = {}
+        for root in roots:
+            try:
+                for process in [root] + root.children(recursive=True):
+                    # The Process objects are kept between samples: cpu_percent() measures since the previous call
+                    tree[process.pid] = self._processes.get(process.pid, process)
+            except psutil.Error:
+                continue
+        if not tree:
+            return None
+        self._processes = tree
+
+        sample = {"time": time.time(), "cpu_percent": 0.0, "rss_bytes": 0, "threads": 0, "processes": 0}
+        for process in tree.values():
+            try:
+                with process.oneshot():
+                    sample["cpu_percent"] += process.cpu_percent(None)
+                    sample["rss_bytes"] += process.memory_info().rss
+                    sample["threads"] += process.num_threads()
+                sample["processes"] += 1
+            except psutil.Error:
+                continue
+        return sample
+
+    def save(self, path: str):
+        # One JSON line per sample
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            samples = list(self.samples)
+        with open(path, "w", encoding="utf-8") as f:
+            for sample in samples:
+                f.write(json.dumps(sample) + "\n")
+
+
+def correlate_with_spans(samples: List[Dict[str, float]], spans: List[Dict[str, Any]],
+                         cpu_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Put the server samples taken during a run next to the generation requests that were in flight at each sample.
+    Returns the timeline (one row per sample) and the samples grouped by the number of requests in flight, where
+    CPU that stops rising while requests keep being added shows the server is saturated.
+    """
+    if not samples or not spans:
+        return {}
+
+    starts = sorted(span["started"] for span in spans)
+    ends = sorted(span["finished"] for span in spans)
+    first = starts[0]
+    samples = [sample for sample in samples if first <= sample["time"] <= ends[-1]]
+
+    timeline = []
+    by_in_flight: Dict[int, Dict[str, List[float]]] = {}
+    for sample in samples:
+        # Requests started by the sample time minus those already finished
+        in_flight = bisect.bisect_right(starts, sample["time"]) - bisect.bisect_right(ends, sample["time"])
+        timeline.append({
+            "time": round(sample["time"] - first, 2),
+            "in_flight": in_flight,
+            "cpu_percent": round(sample["cpu_percent"], 1),
+            "rss_mb": round(sample["rss_bytes"] / 2 ** 20, 1),
+            "threads": sample["threads"],
+            "processes": sample["processes"]
+        })
+        level = by_in_flight.setdefault(in_flight, {"cpu_percent": [], "rss_bytes": [], "threads": []})
+        for key in level:
+            level[key].append(sample[key])
+
+    return {
+        "cpu_count": cpu_count,
+        "requests": len(spans),
+        "samples": len(timeline),
+        "peak_cpu_percent": round(max((row["cpu_percent"] for row in timeline), default=0), 1),
+        "peak_rss_mb": round(max((row["rss_mb"] for row in timeline), default=0), 1),
+        "by_in_flight": {
+            str(level): {
+                "samples": len(values["cpu_percent"]),
+                "cpu_percent_mean": round(sum(values["cpu_percent"]) / len(values["cpu_percent"]), 1),
+                "rss_mb_max": round(max(values["rss_bytes"]) / 2 ** 20, 1),
+                "threads_mean": round(sum(values["threads"]) / len(values["threads"]), 1)
+            }
+            for level, values in sorted(by_in_flight.items())
+        },
+        "timeline": timeline
+    }
@@ -0,0 +1,106 @@
+import math
+import os
+import random
+import sys
+from typing import Dict, List, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import SWEEP_INITIAL_IMAGES, SWEEP_ETA, SWEEP_SEED
+
+"""
+Successive halving over the prompts of PROMPT_DICT.
+Every round scores the surviving prompts on the first images of a shuffled image list, keeps the best
+1/eta of them and multiplies the number of images by eta for the next round. Images judged in earlier rounds
+keep their scores, so a survivor only pays for the images it has not seen yet. The sweep ends with one prompt,
+or when the survivors have been scored on every image.
+"""
+
+
+class SuccessiveHalvingSweep:
+
+    def __init__(self, prompt_indices: List[int], image_paths: List[str], initial_images: int = SWEEP_INITIAL_IMAGES,
+                 eta: int = SWEEP_ETA, seed: int = SWEEP_SEED):
+        self.eta = max(2, eta)
+        self.seed = seed
+        self.image_paths = sorted(str(path) for path in image_paths)
+        random.Random(seed).shuffle(self.image_paths)
+        self.initial_images = max(1, min(initial_images, len(self.image_paths)))
+
+        self.survivors = list(prompt_indices)
+        self.image_count = self.initial_images
+        # prompt index -> image path -> model label -> overall score
+        self.scores: Dict[int, Dict[str, Dict[str, float]]] = {prompt_index: {} for prompt_index in prompt_indices}
+        self.failures: Dict[int, int] = {prompt_index: 0 for prompt_index in prompt_indices}
+        self.judged: Dict[int, set] = {prompt_index: set() for prompt_index in prompt_indices}
+        self.rounds: List[Dict[str, Any]] = []
+        self.judgments = 0
+
+    @property
+    def finished(self) -> bool:
+        return len(self.survivors) <= 1 or (bool(self.rounds) and self.rounds[-1]["images"] >= len(self.image_paths))
+
+    def round_work(self) -> Dict[int, List[str]]:
+        """
+        Images every surviving prompt still has to be generated and judged on in this round.
+        """
+        images = self.image_paths[:self.image_count]
+        return {prompt_index: [image for image in images if image not in self.judged[prompt_index]]
+                for prompt_index in self.survivors}
+
+    def record(self, prompt_index: int, image_path: str, evaluation: Dict[str, Any]):
+        self.judgments += 1
+        self.judged[prompt_index].add(str(image_path))
+        model_name = evaluation.get("meta", {}).get("model_name", "Unknown Model")
+        if "error" in evaluation:
+            # A failed generation or judgment scores nothing; it is counted against the prompt
+            self.failures[prompt_index] += 1
+            return
+        self.scores[prompt_index].setdefault(str(image_path), {})[model_name] = float(evaluation.get("overall_score", 0))
+
+    def prompt_score(self, prompt_index: int) -> Optional[float]:
+        """
+        Mean overall score over all models on the images of this round; failures count as 0.
+        """
+        images = self.image_paths[:self.image_count]
+        values = [score for image in images for score in self.scores[prompt_index].get(image, {}).values()]
+        values.extend([0.0] * self.failures[prompt_index])
+        return sum(values) / len(values) if values else None
+
+    def finish_round(self) -> Dict[str, Any]:
+        ranking = sorted(self.survivors, key=lambda prompt_index: -(self.prompt_score(prompt_index) or 0))
+        keep = max(1, math.ceil(len(ranking) / self.eta))
+        round_result = {
+            "round": len(self.rounds) + 1,
+            "images": self.image_count,
+            "prompts": len(ranking),
+            "scores": {str(prompt_index): _rounded(self.prompt_score(prompt_index)) for prompt_index in ranking},
+            "kept": [str(prompt_index) for prompt_index in ranking[:keep]],
+            "dropped": [str(prompt_index) for prompt_index in ranking[keep:]],
+            "judgments_so_far": self.judgments
+        }
+        self.rounds.append(round_result)
+
+        self.survivors = ranking[:keep]
+        self.image_count = min(len(self.image_paths), self.image_count * self.eta)
+        return round_result
+
+    def report(self, models: int = 2) -> Dict[str, Any]:
+        # Running every prompt on every image costs a generation and a judge request per model
+        full_cost = 2 * models * len(self.scores) * len(self.image_paths)
+        spent = 2 * self.judgments
+        return {
+            "best_prompt": str(self.survivors[0]) if self.survivors else None,
+            "eta": self.eta,
+            "seed": self.seed,
+            "initial_images": self.initial_images,
+            "total_images": len(self.image_paths),
+            "rounds": self.rounds,
+            "inference_calls": spent,
+            "full_sweep_inference_calls": full_cost,
+            "inference_calls_saved": full_cost - spent
+        }
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
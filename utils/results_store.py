@@ -0,0 +1,165 @@
+import heapq
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import EVALUATION_STORE_PATH
+
+
+def new_run_id() -> str:
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+class ResultsStore:
+    """
+    Append-only evaluation store: one JSONL file per run, one row per finished evaluation.
+    Rows are flushed as soon as they are written, so an interrupted run keeps everything judged so far
+    and nothing has to be held in memory or rewritten at the end.
+    A small sidecar index (<run_id>.index.jsonl) records each row's byte offset, image, model and score,
+    so filtered reads seek straight to the matching rows.
+    """
+
+    def __init__(self, store_dir: str = EVALUATION_STORE_PATH, run_id: Optional[str] = None):
+        self.store_dir = Path(store_dir)
+        self.run_id = run_id or new_run_id()
+        self.rows_path = self.store_dir / f"{self.run_id}.jsonl"
+        self.index_path = self.store_dir / f"{self.run_id}.index.jsonl"
+        self.row_count = 0
+        self._file = None
+        self._index_file = None
+
+    @classmethod
+    def from_path(cls, rows_path: str) -> "ResultsStore":
+        path = Path(rows_path)
+        return cls(store_dir=str(path.parent), run_id=path.stem)
+
+    def append(self, row: Dict[str, Any]) -> int:
+        """
+        Write one row; returns its byte offset in the run's file.
+        """
+        if self._file is None:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.rows_path, 'ab')
+            self._index_file = open(self.index_path, 'a', encoding='utf-8')
+
+        meta = row.setdefault("meta", {})
+        meta["run_id"] = self.run_id
+
+        offset = self._file.tell()
+        self._file.write((json.dumps(row, ensure_ascii=False) + "\n").encode('utf-8'))
+        self._file.flush()
+
+        self._index_file.write(json.dumps({
+            "offset": offset,
+            "image_name": meta.get("image_name"),
+            "model_name": meta.get("model_name"),
+            "overall_score": row.get("overall_score"),
+            "error": "error" in row
+        }, ensure_ascii=False) + "\n")
+        self._index_file.flush()
+        self.row_count += 1
+        return offset
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+            self._file = None
+            self._index_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def iter_rows(self, image_names: Optional[Iterable[str]] = None,
+                  top_n: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the run's rows in write order.
+        With image_names and/or top_n (the N highest-scoring successful rows, best first), only the
+        matching rows are read, located through the index.
+        """
+        if not self.rows_path.exists():
+            return
+
+        if image_names is None and top_n is None:
+            with open(self.rows_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+            return
+
+        if not self.index_path.exists():
+            yield from filter_rows(self.iter_rows(), image_names, top_n)
+            return
+
+        entries = self.iter_index()
+        if image_names is not None:
+            image_names = set(image_names)
+            entries = (entry for entry in entries if entry.get("image_name") in image_names)
+        if top_n is not None:
+            entries = heapq.nlargest(top_n, (e for e in entries if _is_scored(e)), key=lambda e: e["overall_score"])
+
+        with open(self.rows_path, 'rb') as f:
+            for entry in entries:
+                f.seek(entry["offset"])
+                yield json.loads(f.readline().decode('utf-8'))
+
+    def read_row(self, offset: int) -> Dict[str, Any]:
+        with open(self.rows_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline().decode('utf-8'))
+
+    def iter_index(self) -> Iterator[Dict[str, Any]]:
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def list_runs(store_dir: str = EVALUATION_STORE_PATH) -> List[str]:
+    return sorted(path.stem for path in Path(store_dir).glob("*.jsonl") if not path.stem.endswith(".index"))
+
+
+def _is_scored(entry: Dict[str, Any]) -> bool:
+    score = entry.get("overall_score")
+    return not entry.get("error") and not isinstance(score, bool) and isinstance(score, (int, float))
+
+
+def filter_rows(rows: Iterable[Dict[str, Any]], image_names: Optional[Iterable[str]] = None,
+                top_n: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Apply the image and top-N filters to rows that have no index; top_n keeps only N rows in memory.
+    """
+    if image_names is not None:
+        image_names = set(image_names)
+        rows = (row for row in rows if row.get("meta", {}).get("image_name") in image_names)
+    if top_n is not None:
+        scored = (row for row in rows if _is_scored({"error": "error" in row, "overall_score": row.get("overall_score")}))
+        rows = heapq.nlargest(top_n, scored, key=lambda row: row["overall_score"])
+    yield from rows
+
+
+def iter_detailed_results(evaluation_results: Dict[str, Any], image_names: Optional[Iterable[str]] = None,
+                          top_n: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the evaluations behind a results index.
+    Older results files carry the evaluations inline under "detailed_results";
+    newer ones reference the run's rows in the results store.
+    """
+    if "detailed_results" in evaluation_results:
+        yield from filter_rows(evaluation_results["detailed_results"], image_names, top_n)
+        return
+
+    rows_path = evaluation_results.get("meta", {}).get("results_store")
+    if rows_path:
+        yield from ResultsStore.from_path(rows_path).iter_rows(image_names, top_n)
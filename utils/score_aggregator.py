@@ -0,0 +1,279 @@
+import os
+import sys
+import warnings
+from typing import Callable, Dict, Iterable, List, Optional, Any, Sequence
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import JUDGE_CRITERIA
+
+# Fields read from every evaluation; "overall_score" is treated as one more criterion
+SCORE_FIELDS = ["overall_score"] + JUDGE_CRITERIA
+DEFAULT_PROMPT_ID = "default"
+
+
+def is_successful_evaluation(evaluation: Dict[str, Any]) -> bool:
+    return "error" not in evaluation
+
+
+def _read_score(evaluation: Dict[str, Any], field: str) -> float:
+    value = evaluation.get(field) if field == "overall_score" else (evaluation.get(field) or {}).get("score")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return np.nan
+    return float(value)
+
+
+class ScoreTensor:
+    """
+    Judge scores as one array of shape (model, prompt, image, criterion, sample).
+    Cells without an evaluation are NaN, so any statistic can be taken over any combination of axes
+    with a single vectorised reduction instead of filtering the result list per model.
+    """
+
+    AXES = ("model", "prompt", "image", "criterion", "sample")
+
+    def __init__(self, scores: np.ndarray, present: np.ndarray, models: List[str], prompts: List[str],
+                 images: List[str], criteria: List[str], evaluation_counts: Dict[str, int], error_counts: Dict[str, int]):
+        self.scores = scores
+        self.present = present  # (model, prompt, image, sample) mask of cells holding an evaluation
+        self.models = models
+        self.prompts = prompts
+        self.images = images
+        self.criteria = criteria
+        self.evaluation_counts = evaluation_counts
+        self.error_counts = error_counts
+
+    @classmethod
+    def from_evaluations(cls, evaluations: Iterable[Dict[str, Any]],
+                         is_successful: Callable[[Dict[str, Any]], bool] = is_successful_evaluation,
+                         criteria: Optional[List[str]] = None) -> "ScoreTensor":
+        """
+        Build the tensor in a single pass over the evaluations (a list or a lazy store iterator).
+        Evaluations rejected by is_successful are counted per model but contribute no scores.
+        """
+        criteria = list(criteria or SCORE_FIELDS)
+        models: Dict[str, int] = {}
+        prompts: Dict[str, int] = {}
+        images: Dict[str, int] = {}
+        sample_counts: Dict[tuple, int] = {}
+        evaluation_counts: Dict[str, int] = {}
+        error_counts: Dict[str, int] = {}
+        coords = []
+        values = []
+
+        for evaluation in evaluations:
+            meta = evaluation.get("meta", {})
+            model = meta.get("model_name", "Unknown Model")
+            prompt = str(meta.get("prompt_id", DEFAULT_PROMPT_ID))
+            image = meta.get("image_name", "unknown")
+
+            model_index = models.setdefault(model, len(models))
+            evaluation_counts[model] = evaluation_counts.get(model, 0) + 1
+            if "error" in evaluation:
+                error_counts[model] = error_counts.get(model, 0) + 1
+
+            if not is_successful(evaluation):
+                continue
+
+            key = (model_index, prompts.setdefault(prompt, len(prompts)), images.setdefault(image, len(images)))
+            sample = sample_counts.get(key, 0)
+            sample_counts[key] = sample + 1
+
+            coords.append(key + (sample,))
+            values.append([_read_score(evaluation, field) for field in criteria])
+
+        shape = (len(models), len(prompts), len(images), len(criteria), max(sample_counts.values(), default=0))
+        scores = np.full(shape, np.nan)
+        present = np.zeros(shape[:3] + shape[4:], dtype=bool)
+        if coords:
+            index = np.asarray(coords, dtype=np.intp)
+            scores[index[:, 0], index[:, 1], index[:, 2], :, index[:, 3]] = np.asarray(values, dtype=float)
+            present[index[:, 0], index[:, 1], index[:, 2], index[:, 3]] = True
+
+        return cls(scores, present, list(models), list(prompts), list(images), criteria, evaluation_counts, error_counts)
+
+    @property
+    def total_evaluations(self) -> int:
+        return sum(self.evaluation_counts.values())
+
+    @property
+    def successful_evaluations(self) -> int:
+        return int(self.present.sum())
+
+    def labels(self, axis: str) -> List[Any]:
+        return {
+            "model": self.models,
+            "prompt": self.prompts,
+            "image": self.images,
+            "criterion": self.criteria,
+            "sample": list(range(self.scores.shape[4]))
+        }[axis]
+
+    def grouped(self, group_by: Sequence[str] = ("model",)) -> np.ndarray:
+        """
+        View of the scores as (*group_by, criterion, values), pooling every axis that is not grouped on.
+        """
+        keep = [self.AXES.index(axis) for axis in group_by] + [self.AXES.index("criterion")]
+        pooled = [axis for axis in range(len(self.AXES)) if axis not in keep]
+        data = np.transpose(self.scores, keep + pooled)
+        return data.reshape(data.shape[:len(keep)] + (-1,))
+
+    def describe(self, group_by: Sequence[str] = ("model",)) -> Dict[str, np.ndarray]:
+        """
+        Count, mean, variance, median, min and max for every group and criterion.
+        Each statistic is an array of shape (*group_by, criterion); empty groups are NaN with count 0.
+        """
+        data = self.grouped(group_by)
+        count = np.sum(~np.isnan(data), axis=-1)
+
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nansum(data, axis=-1) / count
+            variance = np.nansum((data - mean[..., None]) ** 2, axis=-1) / count
+            if data.shape[-1]:
+                median = np.nanmedian(data, axis=-1)
+                minimum = np.nanmin(data, axis=-1)
+                maximum = np.nanmax(data, axis=-1)
+            else:
+                median = minimum = maximum = np.full(count.shape, np.nan)
+
+        return {
+            "count": count,
+            "mean": mean,
+            "variance": variance,
+            "median": median,
+            "min": minimum,
+            "max": maximum
+        }
+
+    def group_by(self, *axes: str) -> Dict[tuple, Dict[str, Dict[str, float]]]:
+        """
+        Statistics per group as plain dicts: {(labels...): {criterion: {statistic: value}}}.
+        """
+        stats = self.describe(axes)
+        axis_labels = [self.labels(axis) for axis in axes]
+        result = {}
+        for position in np.ndindex(*[len(labels) for labels in axis_labels]):
+            key = tuple(labels[i] for labels, i in zip(axis_labels, position))
+            result[key] = {
+                criterion: {name: _to_float(values[position + (c,)]) for name, values in stats.items()}
+                for c, criterion in enumerate(self.criteria)
+            }
+        return result
+
+    def winners(self, statistic: str = "mean") -> Dict[str, Any]:
+        """
+        Best model per criterion by the given statistic; "Tie" when several models share the best value.
+        """
+        values = np.round(self.describe(("model",))[statistic], 2)
+        winners = {}
+        for c, criterion in enumerate(self.criteria):
+            column = values[:, c]
+            if np.all(np.isnan(column)):
+                winners[criterion] = "Tie"
+                continue
+            best = np.flatnonzero(column == np.nanmax(column))
+            winners[criterion] = self.models[best[0]] if len(best) == 1 else "Tie"
+        return winners
+
+    def summary(self, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Average overall and per-criterion scores for one model, or pooled over all models when model is None.
+        """
+        if model is None:
+            stats = self.describe(())
+            count = self.successful_evaluations
+        else:
+            if model not in self.models:
+                return {}
+            m = self.models.index(model)
+            stats = {name: values[m] for name, values in self.describe(("model",)).items()}
+            count = int(self.present[m].sum())
+
+        if not count:
+            return {}
+
+        means = {criterion: float(np.nan_to_num(stats["mean"][c])) for c, criterion in enumerate(self.criteria)}
+        return {
+            "average_overall_score": round(means.pop("overall_score", 0.0), 2),
+            "average_criteria_scores": {k: round(v, 2) for k, v in means.items()},
+            "count": count
+        }
+
+
+def summarize_evaluations(evaluations: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The "evaluation_summary" of a results index: counts plus average scores per model and overall.
+    """
+    scores = ScoreTensor.from_evaluations(evaluations)
+
+    if not scores.total_evaluations:
+        return {"error": "No evaluations to summarize"}
+
+    if not scores.successful_evaluations:
+        return {"error": "No successful evaluations"}
+
+    return {
+        "total_evaluations": scores.total_evaluations,
+        "successful_evaluations": scores.successful_evaluations,
+        "failed_evaluations": scores.total_evaluations - scores.successful_evaluations,
+        "model_summaries": {model: scores.summary(model) for model in scores.models},
+        "overall_summary": scores.summary()
+    }
+
+
+def _to_float(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def pass_at_k(scores: np.ndarray, group_ids: np.ndarray, thresholds: Sequence[float],
+              k_values: Sequence[int]) -> np.ndarray:
+    """
+    Unbiased pass@k estimate, 1 - C(n - c, k) / C(n, k), for every group, threshold and k,
+    where n is the number of samples in the group and c the number scoring at least the threshold.
+    Scores are sorted once per group, so c for every threshold comes from a binary search.
+    Returns shape (group, threshold, k); NaN where a group has fewer than k samples.
+    """
+    scores = np.asarray(scores, dtype=float)
+    group_ids = np.asarray(group_ids, dtype=np.intp)
+    thresholds = np.asarray(thresholds, dtype=float)
+    k_values = np.asarray(k_values, dtype=np.intp)
+
+    group_sizes = np.bincount(group_ids)
+    group_count = len(group_sizes)
+    if not len(scores):
+        return np.full((group_count, len(thresholds), len(k_values)), np.nan)
+
+    # Offset every group into its own score band so one sorted array serves all groups
+    low = scores.min()
+    span = scores.max() - low + 1
+    keys = np.sort(group_ids * span + (scores - low))
+
+    shifted_thresholds = np.clip(thresholds - low, 0, span - 0.5)
+    queries = np.arange(group_count)[:, None] * span + shifted_thresholds[None, :]
+    starts = np.concatenate([[0], np.cumsum(group_sizes)[:-1]])
+    below = np.searchsorted(keys, queries, side="left") - starts[:, None]
+    n = group_sizes[:, None, None]
+    c = (group_sizes[:, None] - below)[:, :, None]
+    k = k_values[None, None, :]
+
+    # log C(a, k) from a cumulative log-factorial table
+    max_count = max(group_sizes.max(), k_values.max())
+    log_factorial = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, max_count + 1)))])
+
+    def log_comb(a, b):
+        return log_factorial[a] - log_factorial[b] - log_factorial[a - b]
+
+    failures = n - c
+    with np.errstate(invalid="ignore"):
+        valid = (n >= k)
+        any_pass_guaranteed = failures < k
+        safe_failures = np.where(any_pass_guaranteed | ~valid, k, failures)
+        safe_n = np.where(valid, n, k)
+        probability_all_fail = np.exp(log_comb(safe_failures, k) - log_comb(safe_n, k))
+
+    result = np.where(any_pass_guaranteed, 1.0, 1.0 - probability_all_fail)
+    return np.where(valid, result, np.nan)
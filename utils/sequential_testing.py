@@ -0,0 +1,165 @@
+import math
+import os
+import sys
+from statistics import NormalDist
+from typing import Dict, List, Optional, Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import (
+    SEQUENTIAL_CONFIDENCE,
+    SEQUENTIAL_CI_WIDTH,
+    SEQUENTIAL_MIN_PAIRS
+)
+
+"""
+Repeated looks. A confidence interval recomputed after every pair excludes zero by chance at some look far more
+often than its level says (about 22% of null runs at 99%), so a test only decides at scheduled looks, after
+min_pairs, 2 * min_pairs, 4 * min_pairs, ... pairs, and splits its error rate over them (Bonferroni): look k uses
+alpha / 2 ** (k + 1), and the looks together spend at most alpha however long the run goes on.
+Each look is a Student t interval of the mean difference.
+"""
+
+
+def t_quantile(p: float, df: int) -> float:
+    """
+    Quantile of Student's t distribution, from the normal quantile by the Cornish-Fisher expansion
+    (Abramowitz and Stegun 26.7.5); within 0.1% of the exact value from 9 degrees of freedom at the levels used here.
+    """
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
+
+
+class SequentialPairedTest:
+    """
+    Running paired comparison of two models on one criterion.
+    Judgments arrive one at a time, keyed by their (prompt, image) cell; once both models have a score for a cell
+    the difference joins the sample. At every scheduled look the test stops when the interval of the mean difference
+    excludes zero (the winner is decided) or is narrower than ci_width (the models are as close as the target
+    precision can tell). Judge scores are coarse, so min_pairs differences without any spread are taken at face
+    value: a constant margin decides a winner and constant ties decide ci_width.
+    """
+
+    def __init__(self, model_a: str = "Model 1", model_b: str = "Model 2", criterion: str = "overall_score",
+                 confidence: float = SEQUENTIAL_CONFIDENCE, ci_width: float = SEQUENTIAL_CI_WIDTH,
+                 min_pairs: int = SEQUENTIAL_MIN_PAIRS):
+        self.model_a = model_a
+        self.model_b = model_b
+        self.criterion = criterion
+        self.confidence = confidence
+        self.ci_width = ci_width
+        self.min_pairs = max(2, min_pairs)
+        self.next_look = self.min_pairs
+
+        self.pending: Dict[str, Dict[str, float]] = {}
+        self.differences: List[float] = []
+        # Running mean and sum of squared deviations of the differences (Welford), so a look costs O(1)
+        self._mean = 0.0
+        self._squares = 0.0
+        self.judgments = 0
+        self.looks = 0
+        self.last_look: Dict[str, Any] = {}
+        self.decision: Optional[Dict[str, Any]] = None
+
+    @property
+    def stopped(self) -> bool:
+        return self.decision is not None
+
+    def add(self, cell: str, evaluation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Record one judgment; returns the decision once the test stops. Failed evaluations never complete their pair.
+        """
+        model_name = evaluation.get("meta", {}).get("model_name")
+        score = evaluation.get(self.criterion)
+        if "error" in evaluation or model_name not in (self.model_a, self.model_b) or score is None:
+            return self.decision
+        self.judgments += 1
+
+        scores = self.pending.setdefault(cell, {})
+        scores[model_name] = float(score)
+        if len(scores) == 2:
+            del self.pending[cell]
+            difference = scores[self.model_a] - scores[self.model_b]
+            self.differences.append(difference)
+            delta = difference - self._mean
+            self._mean += delta / len(self.differences)
+            self._squares += delta * (difference - self._mean)
+            if not self.stopped:
+                self._look()
+        return self.decision
+
+    def _look(self):
+        n = len(self.differences)
+        if n < self.next_look:
+            return
+        self.next_look *= 2
+        alpha = (1 - self.confidence) / 2 ** (self.looks + 1)
+        self.looks += 1
+
+        mean = self._mean
+        std = math.sqrt(max(0.0, self._squares) / (n - 1))
+        self.last_look = {
+            "look": self.looks,
+            "n_pairs": n,
+            "alpha": round(alpha, 8),
+            "mean_difference": round(mean, 3),
+            "std_difference": round(std, 3),
+            "leader": self.model_a if mean >= 0 else self.model_b,
+            "ci_low": None,
+            "ci_high": None
+        }
+        radius = t_quantile(1 - alpha / 2, n - 1) * std / math.sqrt(n)
+        ci_low, ci_high = mean - radius, mean + radius
+        self.last_look.update(ci_low=round(ci_low, 3), ci_high=round(ci_high, 3))
+
+        if ci_low > 0 or ci_high < 0:
+            self.decision = dict(self.last_look, reason="winner", winner=self.last_look["leader"])
+        elif ci_high - ci_low <= self.ci_width:
+            self.decision = dict(self.last_look, reason="ci_width", winner=None)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "criterion": self.criterion,
+            "confidence": self.confidence,
+            "ci_width_target": self.ci_width,
+            "min_pairs": self.min_pairs,
+            "next_look": self.next_look,
+            "judgments": self.judgments,
+            "pairs": len(self.differences),
+            "looks": self.looks,
+            "stopped": self.stopped,
+            "decision": self.decision,
+            "last_look": self.last_look
+        }
+
+
+class SequentialPairwiseTests:
+    """
+    A SequentialPairedTest for every pair of models; the run stops once every pair has stopped.
+    The error rate is split evenly over the pairs (Bonferroni), so that the chance of declaring any false winner
+    stays below 1 - confidence however many models are compared.
+    """
+
+    def __init__(self, models: List[str], confidence: float = SEQUENTIAL_CONFIDENCE, **test_options):
+        pairs = [(model_a, model_b) for i, model_a in enumerate(models) for model_b in models[i + 1:]]
+        self.confidence = confidence
+        self.pair_confidence = 1 - (1 - confidence) / max(1, len(pairs))
+        self.tests = {f"{model_a} vs {model_b}": SequentialPairedTest(model_a, model_b,
+                                                                       confidence=self.pair_confidence,
+                                                                       **test_options)
+                      for model_a, model_b in pairs}
+
+    @property
+    def stopped(self) -> bool:
+        return bool(self.tests) and all(test.stopped for test in self.tests.values())
+
+    def add(self, cell: str, evaluation: Dict[str, Any]):
+        for test in self.tests.values():
+            test.add(cell, evaluation)
+
+    def status(self) -> Dict[str, Any]:
+        return {"confidence": self.confidence, "pair_confidence": self.pair_confidence,
+                "comparisons": {pair: test.status() for pair, test in self.tests.items()}}
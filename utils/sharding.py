@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import GENERATED_CODE_DIR, EVALUATION_RESULTS_PATH, EVALUATION_RESULTS_JSON_PATH
+
+"""
+Deterministic sharding of the (model, prompt, image) generation work list.
+An item's shard depends only on its own key, so every worker computes the same split independently
+and adding images does not move existing items to other shards.
+"""
+
+
+class WorkItem:
+
+    def __init__(self, model_choice: int, prompt_index: int, image_path: str):
+        self.model_choice = model_choice
+        self.prompt_index = prompt_index
+        self.image_path = image_path
+
+    @property
+    def key(self) -> str:
+        return f"model{self.model_choice}|prompt{self.prompt_index}|{os.path.basename(self.image_path)}"
+
+    def __repr__(self):
+        return f"WorkItem({self.key})"
+
+
+def parse_shard(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    "i/N" -> (i, N) with 1 <= i <= N; None stays None.
+    """
+    if value is None:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard should look like i/N, got '{value}'")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard index should be between 1 and {count}, got '{value}'")
+    return index, count
+
+
+def shard_name(shard: Tuple[int, int]) -> str:
+    return f"shard_{shard[0]}_of_{shard[1]}"
+
+
+def shard_code_dir(shard: Optional[Tuple[int, int]], base_dir: str = GENERATED_CODE_DIR) -> str:
+    return str(Path(base_dir) / shard_name(shard)) if shard else base_dir
+
+
+def shard_results_dir(shard: Optional[Tuple[int, int]], base_dir: str = EVALUATION_RESULTS_PATH) -> str:
+    return str(Path(base_dir) / shard_name(shard)) if shard else base_dir
+
+
+def shard_of(key: str, count: int) -> int:
+    # A stable hash: Python's hash() of str is salted per process
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def build_work_items(model_choices: Iterable[int], prompt_indices: Iterable[int],
+                     image_paths: Iterable[str]) -> List[WorkItem]:
+    image_paths = sorted(str(path) for path in image_paths)
+    return [
+        WorkItem(model_choice, prompt_index, image_path)
+        for prompt_index in prompt_indices
+        for model_choice in model_choices
+        for image_path in image_paths
+    ]
+
+
+def select_shard(items: Iterable[WorkItem], shard: Optional[Tuple[int, int]]) -> List[WorkItem]:
+    if shard is None:
+        return list(items)
+    index, count = shard
+    return [item for item in items if shard_of(item.key, count) == index]
+
+
+def find_shard_results(results_dir: str = EVALUATION_RESULTS_PATH) -> List[str]:
+    return sorted(str(path) for path in Path(results_dir).glob("shard_*_of_*/evaluation_results.json"))
+
+
+def _resolve_rows_path(results_file: str, results: Dict[str, Any]) -> Optional[Path]:
+    rows_path = results.get("meta", {}).get("results_store")
+    if not rows_path:
+        return None
+    rows_path = Path(rows_path)
+    if rows_path.exists():
+        return rows_path
+    # Results copied from another host: look for the rows next to the shard's results file
+    for candidate in (Path(results_file).parent / "runs" / rows_path.name, Path(results_file).parent / rows_path.name):
+        if candidate.exists():
+            return candidate
+    return rows_path
+
+
+def merge_shard_results(results_files: List[str], output_path: str = EVALUATION_RESULTS_JSON_PATH) -> Dict[str, Any]:
+    """
+    Combine the evaluations of several shard runs into one results store and one results index.
+    """
+    from model_runner.llm_as_a_judge_runner import combine_judge_stats
+    from utils.results_store import ResultsStore, iter_detailed_results
+    from utils.score_aggregator import summarize_evaluations
+
+    if not results_files:
+        return {"error": "No shard results to merge"}
+
+    output_dir = Path(output_path).parent
+    store = ResultsStore(str(output_dir / "runs"))
+    shards = []
+    judge_stats = []
+    images = set()
+    models_used = set()
+
+    with store:
+        for results_file in results_files:
+            with open(results_file, "r", encoding="utf-8") as f:
+                results = json.load(f)
+            meta = results.get("meta", {})
+
+            rows_path = _resolve_rows_path(results_file, results)
+            if rows_path is not None:
+                if not rows_path.exists():
+                    print(f"Warning: evaluations of {results_file} not found at {rows_path}")
+                results = dict(results, meta=dict(meta, results_store=str(rows_path)))
+
+            shard_rows = 0
+            for row in iter_detailed_results(results):
+                row_meta = row.setdefault("meta", {})
+                row_meta["shard_run_id"] = meta.get("run_id")
+                images.add(row_meta.get("image_name"))
+                store.append(row)
+                shard_rows += 1
+
+            shards.append({"results_file": results_file, "run_id": meta.get("run_id"), "evaluations": shard_rows})
+            if meta.get("judge_stats"):
+                judge_stats.append(meta["judge_stats"])
+            if meta.get("model_used"):
+                models_used.add(meta["model_used"])
+
+    merged = {
+        "evaluation_summary": summarize_evaluations(store.iter_rows()),
+        "meta": {
+            "run_id": store.run_id,
+            "results_store": str(store.rows_path),
+            "results_file": output_path,
+            "total_images": len(images - {None}),
+            "total_evaluations": store.row_count,
+            "model_used": ", ".join(sorted(models_used)),
+            "merged_shards": shards,
+            "judge_stats": combine_judge_stats(judge_stats)
+        }
+    }
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2, ensure_ascii=False)
+
+    print(f"Merged {len(results_files)} shards ({store.row_count} evaluations) into {output_path}")
+    return merged
@@ -0,0 +1,152 @@
+import os
+import sys
+import warnings
+from typing import Dict, Optional, Any
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import SIGNIFICANCE_ALPHA, BOOTSTRAP_RESAMPLES, STATISTICS_SEED
+from utils.score_aggregator import ScoreTensor
+
+
+"""
+Paired statistics for model comparisons.
+Judge scores take few distinct values, so both resampling procedures work on the distinct
+differences and their counts instead of on the individual pairs:
+- a bootstrap resample of n pairs is a multinomial draw over the distinct differences;
+- a sign-flip permutation flips each of the c pairs sharing a magnitude independently,
+  so the number of positive signs per magnitude is Binomial(c, 0.5).
+Both are exact in distribution and cost O(resamples x distinct values) instead of O(resamples x pairs).
+"""
+
+
+def paired_differences(scores: ScoreTensor, model_a: str, model_b: str) -> np.ndarray:
+    """
+    Per-criterion differences model_a - model_b over the (prompt, image) cells both models were judged on.
+    Repeated samples of a cell are averaged first. Returns shape (prompt * image, criterion), NaN where unpaired.
+    """
+    a = scores.models.index(model_a)
+    b = scores.models.index(model_b)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        cell_means = np.nanmean(scores.scores[[a, b]], axis=-1)
+
+    differences = cell_means[0] - cell_means[1]
+    return differences.reshape(-1, differences.shape[-1])
+
+
+def bootstrap_means(differences: np.ndarray, resamples: int = BOOTSTRAP_RESAMPLES,
+                    rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Means of bootstrap resamples of the paired differences.
+    """
+    rng = rng or np.random.default_rng(STATISTICS_SEED)
+    n = len(differences)
+    values, counts = np.unique(differences, return_counts=True)
+
+    resampled_counts = rng.multinomial(n, counts / n, size=resamples)
+    return resampled_counts @ values / n
+
+
+def paired_bootstrap_ci(differences: np.ndarray, resamples: int = BOOTSTRAP_RESAMPLES,
+                        confidence: float = 1 - SIGNIFICANCE_ALPHA,
+                        rng: Optional[np.random.Generator] = None) -> tuple:
+    """
+    Percentile bootstrap confidence interval for the mean paired difference.
+    """
+    resampled_means = bootstrap_means(differences, resamples, rng)
+
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(resampled_means, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def paired_permutation_test(differences: np.ndarray, resamples: int = BOOTSTRAP_RESAMPLES,
+                            rng: Optional[np.random.Generator] = None) -> float:
+    """
+    Two-sided sign-flip permutation test of a zero mean paired difference.
+    """
+    rng = rng or np.random.default_rng(STATISTICS_SEED)
+    observed = abs(differences.sum())
+
+    magnitudes, counts = np.unique(np.abs(differences[differences != 0]), return_counts=True)
+    if not len(magnitudes):
+        return 1.0
+
+    positive_signs = rng.binomial(counts, 0.5, size=(resamples, len(counts)))
+    permuted = (2 * positive_signs - counts) @ magnitudes
+
+    # Small tolerance so that float round-off does not hide permutations equal to the observed sum
+    extreme = np.count_nonzero(np.abs(permuted) >= observed - 1e-9)
+    return float((extreme + 1) / (resamples + 1))
+
+
+def cohens_dz(differences: np.ndarray) -> Optional[float]:
+    """
+    Standardised mean of the paired differences; None when it is undefined.
+    """
+    if len(differences) < 2:
+        return None
+    deviation = differences.std(ddof=1)
+    if deviation == 0:
+        return None
+    return float(differences.mean() / deviation)
+
+
+def compare_models_paired(scores: ScoreTensor, model_a: str, model_b: str,
+                          resamples: int = BOOTSTRAP_RESAMPLES, alpha: float = SIGNIFICANCE_ALPHA,
+                          seed: int = STATISTICS_SEED) -> Dict[str, Any]:
+    """
+    Bootstrap CI, permutation p-value and effect size of model_a - model_b for every criterion.
+    """
+    rng = np.random.default_rng(seed)
+    all_differences = paired_differences(scores, model_a, model_b)
+
+    comparison = {}
+    for c, criterion in enumerate(scores.criteria):
+        differences = all_differences[:, c]
+        differences = differences[~np.isnan(differences)]
+
+        if not len(differences):
+            comparison[criterion] = {"n_pairs": 0, "significant": False}
+            continue
+
+        ci_low, ci_high = paired_bootstrap_ci(differences, resamples, 1 - alpha, rng)
+        p_value = paired_permutation_test(differences, resamples, rng)
+        effect_size = cohens_dz(differences)
+
+        comparison[criterion] = {
+            "n_pairs": int(len(differences)),
+            "mean_difference": round(float(differences.mean()), 3),
+            "ci_low": round(ci_low, 3),
+            "ci_high": round(ci_high, 3),
+            "p_value": round(p_value, 4),
+            "effect_size": round(effect_size, 3) if effect_size is not None else None,
+            "significant": p_value < alpha and (ci_low > 0 or ci_high < 0)
+        }
+
+    return comparison
+
+
+def holm_adjust(comparisons: Dict[str, Dict[str, Dict[str, Any]]],
+                alpha: float = SIGNIFICANCE_ALPHA) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Holm-Bonferroni correction over every tested (pair, criterion) of compare_models_paired() results: each
+    comparison gets p_adjusted, and is significant only when p_adjusted < alpha and its CI excludes zero.
+    With several models and criteria some unadjusted p-values fall below alpha by chance alone.
+    """
+    tested = sorted(((stats["p_value"], pair, criterion)
+                     for pair, pair_stats in comparisons.items()
+                     for criterion, stats in pair_stats.items() if stats.get("n_pairs")),
+                    key=lambda entry: entry[0])
+
+    running_max = 0.0
+    for rank, (p_value, pair, criterion) in enumerate(tested):
+        running_max = max(running_max, min(1.0, (len(tested) - rank) * p_value))
+        stats = comparisons[pair][criterion]
+        stats["p_adjusted"] = round(running_max, 4)
+        stats["significant"] = running_max < alpha and (stats["ci_low"] > 0 or stats["ci_high"] < 0)
+    return comparisons
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.constants import IMAGES_DIR, GENERATED_CODE_DIR, EVALUATION_RESULTS_PATH, BUILD_GRAPH_FILE
+
+"""
+Warm bundles (main.py snapshot / restore): the state a worker builds before its first request, in one file that
+another machine restores instead of rebuilding it. A bundle holds
+
+    the saved images with the sample manifest and dedup report  (no dataset download or image processing)
+    the generated code with its build graphs                    (no regeneration of up-to-date code)
+    the judge build graphs and the result rows they reference   (no re-judging of unchanged code)
+
+Paths are stored relative to the working directory and restored under it. The layout is the files' bytes back to
+back, then a JSON index and a fixed-size footer pointing at it, so a bundle is written in one pass and read through
+mmap: restoring copies slices of the mapping without loading the bundle into memory.
+"""
+
+BUNDLE_MAGIC = b"MUIWARM1"
+_FOOTER = struct.Struct("<QQ8s")  # index offset, index length, magic
+
+
+def bundle_files() -> List[Path]:
+    """
+    The files of this working directory's warm state, relative to it.
+    """
+    files = []
+    for directory in (IMAGES_DIR, GENERATED_CODE_DIR):
+        if Path(directory).is_dir():
+            files.extend(path for path in sorted(Path(directory).rglob("*")) if path.is_file())
+
+    # The judge caches: every results build graph and the rows its judgments are read back from
+    for graph_path in sorted(Path(EVALUATION_RESULTS_PATH).rglob(BUILD_GRAPH_FILE)):
+        files.append(graph_path)
+        with open(graph_path, "r", encoding="utf-8") as f:
+            nodes = json.load(f).get("nodes", {})
+        rows_paths = sorted({node["value"]["rows_path"] for node in nodes.values() if node.get("value")})
+        for rows_path in map(Path, rows_paths):
+            files.extend(path for path in (rows_path, rows_path.with_suffix(".index.jsonl")) if path.is_file())
+
+    relative_files = []
+    working_dir = Path.cwd().resolve()
+    for path in dict.fromkeys(files):
+        try:
+            relative_files.append(path.resolve().relative_to(working_dir))
+        except ValueError:
+            print(f"Not bundled, outside the working directory: {path}")
+    return relative_files
+
+
+def create_bundle(bundle_path: str, files: Optional[List[Path]] = None,
+                  extra_meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Write the files (by default bundle_files()) to bundle_path; returns the bundle's index.
+    """
+    files = bundle_files() if files is None else files
+    index = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "files": {}, **(extra_meta or {})}
+
+    # Written next to the target and moved over it, so that a failed snapshot leaves the previous bundle
+    temporary_path = f"{bundle_path}.tmp"
+    Path(bundle_path).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(temporary_path, "wb") as out:
+            out.write(BUNDLE_MAGIC)
+            for path in files:
+                sha = hashlib.sha256()
+                offset = out.tell()
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        sha.update(chunk)
+                        out.write(chunk)
+                index["files"][path.as_posix()] = {"offset": offset, "size": out.tell() - offset,
+                                                   "sha256": sha.hexdigest(), "mtime": path.stat().st_mtime}
+
+            index_bytes = json.dumps(index, ensure_ascii=False).encode("utf-8")
+            index_offset = out.tell()
+            out.write(index_bytes)
+            out.write(_FOOTER.pack(index_offset, len(index_bytes), BUNDLE_MAGIC))
+        os.replace(temporary_path, bundle_path)
+    except BaseException:
+        # Including Ctrl+C: a partial bundle is never left behind
+        Path(temporary_path).unlink(missing_ok=True)
+        raise
+    return index
+
+
+class WarmBundle:
+    """
+    A bundle mapped into memory; read() returns a file's bytes as a view of the mapping.
+    """
+
+    def __init__(self, bundle_path: str):
+        self.path = bundle_path
+        self._file = open(bundle_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            self._file.close()
+            raise ValueError(f"{bundle_path} is not a warm bundle")
+
+        magic = None
+        if len(self._map) >= len(BUNDLE_MAGIC) + _FOOTER.size:
+            index_offset, index_length, magic = _FOOTER.unpack(self._map[-_FOOTER.size:])
+        if self._map[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC or magic != BUNDLE_MAGIC:
+            self.close()
+            raise ValueError(f"{bundle_path} is not a warm bundle")
+        self.index = json.loads(self._map[index_offset:index_offset + index_length].decode("utf-8"))
+        self.files: Dict[str, Dict[str, Any]] = self.index["files"]
+
+    def read(self, path: str) -> memoryview:
+        entry = self.files[path]
+        return memoryview(self._map)[entry["offset"]:entry["offset"] + entry["size"]]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "WarmBundle":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def restore_bundle(bundle_path: str) -> Dict[str, int]:
+    """
+    Write the bundle's files under the working directory. Files that already have the bundled content are left
+    alone; a file whose bytes do not match their recorded digest is not written, nor is a path that would land
+    outside the working directory.
+    """
+    counts = {"restored": 0, "unchanged": 0, "corrupted": 0, "rejected": 0}
+    working_dir = Path.cwd().resolve()
+    with WarmBundle(bundle_path) as bundle:
+        for path, entry in bundle.files.items():
+            # The index is read from the file: an absolute or "../" path would write anywhere the user can
+            if Path(path).is_absolute() or not Path(path).resolve().is_relative_to(working_dir):
+                print(f"Skipping {path}: it is outside the working directory")
+                counts["rejected"] += 1
+                continue
+            data = bundle.read(path)
+            try:
+                digest = hashlib.sha256(data).hexdigest()
+                if digest != entry["sha256"]:
+                    print(f"Skipping {path}: its bundled bytes do not match their digest")
+                    counts["corrupted"] += 1
+                    continue
+                if _has_digest(Path(path), entry["size"], digest):
+                    counts["unchanged"] += 1
+                    continue
+
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+                os.utime(path, (entry["mtime"], entry["mtime"]))
+                counts["restored"] += 1
+            finally:
+                # The mapping cannot be closed while a view of it is alive
+                data.release()
+    return counts
+
+
+def _has_digest(path: Path, size: int, digest: str) -> bool:
+    if not path.is_file() or path.stat().st_size != size:
+        return False
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest() == digest